@@ -0,0 +1,198 @@
+import asyncio
+import time
+
+from state_guard import GuardMetrics
+from messages import ClientInitMessage, Framing, ServerInitMessage
+from socket_reader import AsyncSocketReader
+from socket_writer import WriteMetrics
+from webserver import Server, WebServer
+
+
+class StreamSocket:
+    # The part of the socket interface WebServer writes through, backed by an asyncio
+    # StreamWriter so both modes share the matchmaking code. Frames sent during one pass of
+    # the event loop are handed to the transport together at the end of it.
+    def __init__(self, writer: asyncio.StreamWriter, metrics: WriteMetrics, max_queued_bytes):
+        self._writer = writer
+        self._metrics = metrics
+        self._max_queued_bytes = max_queued_bytes
+        self._loop = asyncio.get_running_loop()
+
+        self._frames = []
+        self._queued_bytes = 0
+
+    def send(self, data):
+        self.sendall(data)
+        return len(data)
+
+    def sendall(self, data):
+        if self._writer.is_closing():
+            self._metrics.reject()
+            return
+
+        # The transport buffer holds what the client hasn't read yet
+        if self._writer.transport.get_write_buffer_size() + self._queued_bytes + len(data) > self._max_queued_bytes:
+            self._metrics.reject()
+            self._metrics.slow_consumer()
+            self._discard_queue()
+            self._writer.transport.abort()
+            return
+
+        if not self._frames:
+            self._loop.call_soon(self._flush)
+        self._frames.append(data)
+        self._queued_bytes += len(data)
+        self._metrics.queue(len(data), len(self._frames))
+
+    def _discard_queue(self):
+        self._metrics.drop(len(self._frames), self._queued_bytes)
+        self._frames = []
+        self._queued_bytes = 0
+
+    def _flush(self):
+        if not self._frames:
+            return
+        if self._writer.is_closing():
+            self._discard_queue()
+            return
+
+        self._writer.writelines(self._frames)
+        self._metrics.write(len(self._frames), self._queued_bytes, 1)
+        self._frames = []
+        self._queued_bytes = 0
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+    def abort(self):
+        self._discard_queue()
+        self._writer.transport.abort()
+
+
+class LoopGuard:
+    # The event loop already runs everything one piece at a time. Calls from other threads,
+    # like the console, are handed over to it.
+    def __init__(self):
+        self.metrics = GuardMetrics()
+        self._loop: asyncio.AbstractEventLoop = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def call(self, function, *args):
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if self._loop is None or running_loop is self._loop:
+            return function(*args)
+        return asyncio.run_coroutine_threadsafe(self._run(function, args, time.perf_counter()), self._loop).result()
+
+    async def _run(self, function, args, queued_at):
+        started_at = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.metrics.record(started_at - queued_at, time.perf_counter() - started_at)
+
+
+class LoopTimers:
+    # TimerService's interface on top of the event loop's own timers
+    def schedule(self, delay, function, *args):
+        return asyncio.get_running_loop().call_later(delay, function, *args)
+
+
+class AsyncWebServer(WebServer):
+    def __init__(self, host, port, **kwargs):
+        super().__init__(host, port, **kwargs)
+
+        self._logger.green("Running on a single asyncio event loop")
+
+
+    def _create_state_guard(self):
+        return LoopGuard()
+
+
+    def _create_timer_service(self):
+        return LoopTimers()
+
+
+    async def _handle_server(self, server: Server):
+        try:
+            while not server.retired:
+                if server.framing == Framing.BINARY:
+                    message_type, payload = await server.reader.read_frame()
+                    read_at = time.perf_counter()
+                    self._handle_server_frame(server, message_type, payload)
+                else:
+                    message = await server.read_message()
+                    message_type, read_at = message.message_type, time.perf_counter()
+                    self._handle_server_message(server, message)
+                self.metrics.record_server_message(message_type, read_at)
+        except Exception:
+            self._eject_server(server, "lost its connection")
+
+
+    async def _handle_client(self, init_msg: ClientInitMessage, socket_obj: StreamSocket, address: str, reader: AsyncSocketReader):
+        client = self._try_accept_client(init_msg, socket_obj, address, reader)
+        while client is None:
+            init_msg = await reader.read_message()
+
+            if not self._check_init_message_prototype(init_msg, socket_obj):
+                return
+
+            client = self._try_accept_client(init_msg, socket_obj, address, reader)
+
+        while True:
+            try:
+                self._handle_client_message(client, await client.read_message())
+            except:
+                self._handle_client_connection_lost(client)
+                return
+
+
+    async def _handle_connection(self, stream_reader: asyncio.StreamReader, stream_writer: asyncio.StreamWriter):
+        host, port = stream_writer.get_extra_info("peername")[:2]
+        new_address = f"{host}:{port}"
+
+        new_socket = StreamSocket(stream_writer, self.write_metrics, self.MAX_QUEUED_WRITE_BYTES)
+        reader = AsyncSocketReader(stream_reader, self.metrics.received_bytes)
+
+        if not self.accept_metrics.try_start_handshake(self.MAX_PENDING_HANDSHAKES):
+            self._reject_connection(new_socket, new_address)
+            return
+
+        accepted_at = time.perf_counter()
+        try:
+            init_msg = await asyncio.wait_for(reader.read_message(), self.HANDSHAKE_TIMEOUT_DURATION)
+        except asyncio.TimeoutError:
+            self._handshake_timed_out(new_socket, new_address)
+            return
+        except Exception:
+            self._handshake_failed(new_socket, new_address)
+            return
+
+        self.accept_metrics.finish_handshake(accepted_at)
+
+        if type(init_msg) == ServerInitMessage:
+            self._logger.blue(f"New server connected with address \"{new_address}\"")
+            server = self._init_new_server(new_socket, new_address, reader, init_msg)
+            await self._handle_server(server)
+        elif type(init_msg) == ClientInitMessage:
+            await self._handle_client(init_msg, new_socket, new_address, reader)
+        else:
+            new_socket.send(self.Text.INVALID_INIT_MESSAGE)
+
+
+    async def _serve(self):
+        self._state_guard.bind(asyncio.get_running_loop())
+        self._watch_restored_clients()
+        server = await asyncio.start_server(self._handle_connection, sock=self.socket)
+        async with server:
+            await server.serve_forever()
+
+
+    def receive_connections(self):
+        asyncio.run(self._serve())
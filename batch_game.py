@@ -0,0 +1,90 @@
+import numpy as np
+from game import WIN_MASKS
+
+
+# LINES[i, cell] is 1 when cell is on winning line i, with cells numbered 3*x + y as in game.py
+LINES = np.array([[mask >> cell & 1 for cell in range(9)] for mask in WIN_MASKS], dtype=np.int8)
+
+
+class BatchTicTacToeGame:
+    def __init__(self, count, first_turn_number=None, rng: np.random.Generator = None):
+        self._rng = rng if rng is not None else np.random.default_rng()
+
+        # Cell values follow TicTacToeGame: 0 is empty, 1 and 2 are the players
+        self.boards = np.zeros((count, 9), dtype=np.int8)
+        if first_turn_number is None:
+            self.turns = self._rng.integers(1, 3, size=count, dtype=np.int8)
+        else:
+            assert first_turn_number == 1 or first_turn_number == 2
+            self.turns = np.full(count, first_turn_number, dtype=np.int8)
+        # 0 while nobody has won
+        self.winners = np.zeros(count, dtype=np.int8)
+        self.moves = np.zeros(count, dtype=np.int8)
+
+    def __len__(self):
+        return len(self.boards)
+
+    def get_unfinished(self):
+        return (self.winners == 0) & (self.moves < 9)
+
+    def is_finished(self):
+        return not self.get_unfinished().any()
+
+    def get_winners(self):
+        # +1 for player 1, -1 for player 2, so a full line of either sums to +-3 in one product
+        signs = (self.boards == 1).astype(np.int8) - (self.boards == 2).astype(np.int8)
+        sums = signs @ LINES.T
+        winners = np.zeros(len(self), dtype=np.int8)
+        winners[(sums == 3).any(axis=1)] = 1
+        winners[(sums == -3).any(axis=1)] = 2
+        return winners
+
+    def random_moves(self):
+        # A uniform random key per empty cell; the largest key is a uniform random legal move
+        keys = self._rng.random(self.boards.shape)
+        keys[self.boards != 0] = -1
+        return keys.argmax(axis=1)
+
+    def put(self, indices, cells):
+        # cells[i] is the move for game indices[i]
+        if not self.get_unfinished()[indices].all():
+            raise Exception("Some games are finished!")
+        if (self.boards[indices, cells] != 0).any():
+            raise ValueError("Some cells are not empty!")
+
+        self.boards[indices, cells] = self.turns[indices]
+        self.moves[indices] += 1
+        self.turns[indices] = 3 - self.turns[indices]
+        self.winners = self.get_winners()
+
+    def random_play(self):
+        indices = np.flatnonzero(self.get_unfinished())
+        if len(indices) == 0:
+            raise Exception("All games are finished!")
+
+        cells = self.random_moves()[indices]
+        self.put(indices, cells)
+
+        return indices, cells
+
+    def play_until_finished(self):
+        while not self.is_finished():
+            self.random_play()
+
+
+def simulate_random_games(count, first_turn_number=None, batch_size=1 << 16, seed=None):
+    rng = np.random.default_rng(seed)
+    stats = {"games": 0, "player_1_wins": 0, "player_2_wins": 0, "draws": 0, "moves": 0}
+
+    while stats["games"] < count:
+        batch = BatchTicTacToeGame(min(batch_size, count - stats["games"]), first_turn_number, rng)
+        batch.play_until_finished()
+
+        stats["games"] += len(batch)
+        stats["player_1_wins"] += int((batch.winners == 1).sum())
+        stats["player_2_wins"] += int((batch.winners == 2).sum())
+        stats["draws"] += int((batch.winners == 0).sum())
+        stats["moves"] += int(batch.moves.sum())
+
+    stats["average_moves"] = stats["moves"] / stats["games"] if stats["games"] else 0
+    return stats
@@ -0,0 +1,32 @@
+import time
+
+import numpy as np
+
+from batch_game import simulate_random_games
+from game import TicTacToeGame
+
+
+def loop_random_games(count):
+    results = {1: 0, 2: 0, None: 0}
+    for _ in range(count):
+        game = TicTacToeGame(np.random.randint(1, 3))
+        while not game.is_finished():
+            game.random_play()
+        results[game.get_winner()] += 1
+    return results
+
+
+if __name__ == '__main__':
+    np.random.seed(0)
+
+    count = 20000
+    start = time.perf_counter()
+    results = loop_random_games(count)
+    loop = count / (time.perf_counter() - start)
+    print(f"TicTacToeGame.random_play loop | {loop:10.0f} games/s | {results}")
+
+    for count in [20000, 1000000]:
+        start = time.perf_counter()
+        stats = simulate_random_games(count, seed=0)
+        batch = count / (time.perf_counter() - start)
+        print(f"batch of {count:>7}               | {batch:10.0f} games/s ({batch / loop:.0f}x) | {stats}")
@@ -0,0 +1,131 @@
+import time
+
+from termcolor import colored
+
+from benchmarks.game_engine import random_games
+from game import TicTacToeGame, _render_grid
+from server import GameSession
+
+
+CLIENTS = [{"username": "alice", "address": "a"}, {"username": "bob", "address": "b"}]
+LEGACY_SIGNS = {0: " ", 1: "X", 2: "O"}
+
+
+def legacy_board_and_turn(cells, turn):
+    # What GameSession built before boards were cached, for every board it sent
+    board = "┏━━━┳━━━┳━━━┓\n"
+    board += f"┃ {LEGACY_SIGNS[cells[0][0]]} ┃ {LEGACY_SIGNS[cells[0][1]]} ┃ {LEGACY_SIGNS[cells[0][2]]} ┃\n"
+    board += "┣━━━╋━━━╋━━━┫\n"
+    board += f"┃ {LEGACY_SIGNS[cells[1][0]]} ┃ {LEGACY_SIGNS[cells[1][1]]} ┃ {LEGACY_SIGNS[cells[1][2]]} ┃\n"
+    board += "┣━━━╋━━━╋━━━┫\n"
+    board += f"┃ {LEGACY_SIGNS[cells[2][0]]} ┃ {LEGACY_SIGNS[cells[2][1]]} ┃ {LEGACY_SIGNS[cells[2][2]]} ┃\n"
+    board += "┗━━━┻━━━┻━━━┛\n"
+    board += f"{CLIENTS[0]['username']}: {LEGACY_SIGNS[1]} | {CLIENTS[1]['username']}: {LEGACY_SIGNS[2]}\n"
+    board += f"Turn: {CLIENTS[turn - 1]['username']}"
+    return board + "\n"
+
+
+def legacy_moves(games):
+    moves = 0
+    start = time.perf_counter()
+    for game_moves in games:
+        game = TicTacToeGame(1)
+        cells = [[0] * 3 for _ in range(3)]
+        turn = 1
+        for x, y in game_moves:
+            game.put(x, y)
+            cells[x][y] = turn
+            turn = 3 - turn
+            message = legacy_board_and_turn(cells, turn)
+            for _ in CLIENTS:
+                colored(message, "blue")
+            moves += 1
+    return moves / (time.perf_counter() - start)
+
+
+def uncached_generic_moves(games, size):
+    # The generic renderer without the template and the state cache
+    signs = TicTacToeGame.SIGNS
+    moves = 0
+    start = time.perf_counter()
+    for game_moves in games:
+        game = TicTacToeGame(1, size, 5)
+        cells = [[0] * size for _ in range(size)]
+        turn = 1
+        for x, y in game_moves:
+            game.put(x, y)
+            cells[x][y] = turn
+            turn = 3 - turn
+            message = _render_grid(size, lambda x, y: [f" {signs[cells[x][y]]} "], 3, size != 3)
+            for _ in CLIENTS:
+                colored(message, "blue")
+            moves += 1
+    return moves / (time.perf_counter() - start)
+
+
+def session_moves(games, size=3, win_length=3):
+    session = GameSession(0, lambda message: None, None, None)
+    session._clients = CLIENTS
+    session._status = GameSession.Status.PLAYING_DUAL
+
+    moves = 0
+    start = time.perf_counter()
+    for game_moves in games:
+        session._game = TicTacToeGame(1, size, win_length)
+        session._players_and_turn_strings = {}
+        for x, y in game_moves:
+            session._game.put(x, y)
+            for _ in CLIENTS:
+                session._get_board_message()
+            moves += 1
+    return moves / (time.perf_counter() - start)
+
+
+def legacy_help():
+    board = ""
+    board += "┏━━━━━━━━┳━━━━━━━━┳━━━━━━━━┓\n"
+    for x in range(3):
+        if x != 0:
+            board += "┣━━━━━━━━╋━━━━━━━━╋━━━━━━━━┫\n"
+        board += "┃        ┃        ┃        ┃\n"
+        board += f"┃ ({x}, 0) ┃ ({x}, 1) ┃ ({x}, 2) ┃\n"
+        board += "┃        ┃        ┃        ┃\n"
+    board += "┗━━━━━━━━┻━━━━━━━━┻━━━━━━━━┛\n"
+    board += "Use the command \"/put (x, y)\" to put your sign on the board.\n"
+    board += "Use the command \"/msg message\" to send your message\n"
+    return colored(board, "yellow")
+
+
+def help_requests(get_help, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        get_help()
+    return count / (time.perf_counter() - start)
+
+
+def big_board_games(count, size, moves):
+    games = []
+    for i in range(count):
+        cells = [(i * 7 + j * 31) % (size * size) for j in range(size * size)]
+        games.append([divmod(cell, size) for cell in dict.fromkeys(cells)][:moves])
+    return games
+
+
+if __name__ == '__main__':
+    games = random_games(20000)
+
+    legacy = legacy_moves(games)
+    cached = session_moves(games)
+    print(f"3x3   | legacy string building | {legacy:10.0f} moves/s")
+    print(f"3x3   | template + state cache | {cached:10.0f} moves/s ({cached / legacy:.1f}x)")
+
+    games = big_board_games(200, 15, 40)
+    uncached = uncached_generic_moves(games, 15)
+    cached = session_moves(games, 15, 5)
+    print(f"15x15 | generic renderer       | {uncached:10.0f} moves/s")
+    print(f"15x15 | template + state cache | {cached:10.0f} moves/s ({cached / uncached:.1f}x)")
+
+    legacy = help_requests(legacy_help, 100000)
+    cached = help_requests(lambda: GameSession._get_help_message(3, 3), 100000)
+    print(f"/help | rebuilt every time     | {legacy:10.0f} requests/s")
+    print(f"/help | built once             | {cached:10.0f} requests/s ({cached / legacy:.1f}x)")
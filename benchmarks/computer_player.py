@@ -0,0 +1,43 @@
+import time
+
+import numpy as np
+
+from computer_player import ComputerPlayer, Difficulty, PerfectPlayTable
+from game import TicTacToeGame
+
+
+def startup():
+    start = time.perf_counter()
+    table = PerfectPlayTable()
+    return time.perf_counter() - start, len(table)
+
+
+def move_latencies(computer: ComputerPlayer, games):
+    # Computer moves against a random opponent, the way a solo GameSession plays them
+    opponent = ComputerPlayer(Difficulty.RANDOM)
+    latencies = []
+    results = {"won": 0, "tie": 0, "lost": 0}
+    for i in range(games):
+        game = TicTacToeGame(1 + i % 2)
+        while not game.is_finished():
+            if game.get_turn() == 2:
+                start = time.perf_counter()
+                computer.play(game)
+                latencies.append(time.perf_counter() - start)
+            else:
+                opponent.play(game)
+        results["tie" if game.is_draw() else "won" if game.get_winner() == 2 else "lost"] += 1
+    return np.array(latencies), results
+
+
+if __name__ == '__main__':
+    np.random.seed(0)
+
+    solve_time, positions = startup()
+    print(f"perfect play table solved in {solve_time * 1000:.1f} ms ({positions} canonical positions)")
+    print()
+
+    for difficulty in Difficulty.ALL:
+        latencies, results = move_latencies(ComputerPlayer(difficulty), 5000)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1e6
+        print(f"{difficulty:8} | p50 {p50:6.1f} us | p99 {p99:6.1f} us | vs random: {results}")
@@ -0,0 +1,64 @@
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+from messages import ClientInitMessage
+from socket_reader import SocketReader
+
+
+def process_stats(pid):
+    stats = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            stats[key] = value.strip()
+    return int(stats["VmRSS"].split()[0]), int(stats["Threads"])
+
+
+def run(mode, port, count):
+    env = dict(os.environ, HOST="127.0.0.1", PORT=str(port), WEBSERVER_MODE=mode)
+    webserver = subprocess.Popen(
+        [sys.executable, "webserver.py"], env=env, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    time.sleep(1)
+
+    idle_rss, _ = process_stats(webserver.pid)
+
+    sockets = []
+    start = time.perf_counter()
+    try:
+        for i in range(count):
+            socket_obj = socket.create_connection(("127.0.0.1", port))
+            socket_obj.sendall(ClientInitMessage(f"bot{i}").encode())
+            SocketReader(socket_obj).read_json()
+            sockets.append(socket_obj)
+    except OSError as e:
+        print(f"{mode}: failed after {len(sockets)} connections ({e})")
+    elapsed = time.perf_counter() - start
+
+    time.sleep(0.5)
+    rss, threads = process_stats(webserver.pid)
+
+    for socket_obj in sockets:
+        socket_obj.close()
+    webserver.kill()
+    webserver.wait()
+
+    return len(sockets), elapsed, rss - idle_rss, threads
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    _, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+
+    for port, mode in enumerate(["threaded", "asyncio"], start=9100):
+        connected, elapsed, rss_kb, threads = run(mode, port, count)
+        print(
+            f"{mode:9} | {connected:6} connections held | {connected / elapsed:7.0f} handshakes/s | "
+            f"+{rss_kb / 1024:7.1f} MB RSS ({rss_kb / max(connected, 1):5.1f} KB/conn) | {threads:6} threads"
+        )
@@ -0,0 +1,66 @@
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from event_log import Event, EventLog
+
+
+def run_group_commit(events):
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        log = EventLog(os.path.join(directory, "events.log"))
+
+        start = time.perf_counter()
+        for i in range(events):
+            log.append(Event.PUT, i // 9, i % 3, i // 3 % 3)
+        append = (time.perf_counter() - start) / events * 1e6
+
+        log.close()
+        total = time.perf_counter() - start
+        return append, total, log.metrics
+
+
+def run_fsync_per_event(events):
+    # What logging costs the game path when every event waits for its own fsync
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "events.log"), "ab") as f:
+            start = time.perf_counter()
+            for i in range(events):
+                f.write(b'[%d,"put",%d,%d,%d]\n' % (i + 1, i // 9, i % 3, i // 3 % 3))
+                f.flush()
+                os.fsync(f.fileno())
+            return (time.perf_counter() - start) / events * 1e6
+
+
+def run_recovery(games, moves):
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        path = os.path.join(directory, "events.log")
+        log = EventLog(path)
+        log.SNAPSHOT_EVERY = games * (moves + 2) + 1
+        for game_id in range(games):
+            log.append(Event.START, game_id, 1, [19, 5], [f"a{game_id}", f"b{game_id}"], 1)
+        for move in range(moves):
+            for game_id in range(games):
+                log.append(Event.PUT, game_id, move // 19, move % 19)
+        log.close()
+        size = os.path.getsize(path)
+
+        start = time.perf_counter()
+        recovered = EventLog(path).recovered
+        replay = time.perf_counter() - start
+        assert len(recovered.games) == games and all(len(game[4]) == moves for game in recovered.games.values())
+        return replay, size
+
+
+if __name__ == '__main__':
+    append, total, metrics = run_group_commit(200000)
+    fsync_each = run_fsync_per_event(2000)
+    print(
+        f"200000 events | append {append:.1f}us on the caller | all durable after {total:.2f}s in {metrics.commits} commits "
+        f"({metrics.events / max(metrics.commits, 1):.0f} events each) | fsync per event: {fsync_each:.0f}us each"
+    )
+
+    for games, moves in [(1000, 20), (10000, 10)]:
+        replay, size = run_recovery(games, moves)
+        print(f"recovery of {games} games with {moves} moves each: {games * (moves + 1)} events, {size / 1e6:.1f}MB replayed in {replay:.2f}s")
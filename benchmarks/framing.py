@@ -0,0 +1,87 @@
+import socket
+import threading
+import time
+
+import numpy as np
+
+from messages import Framing, MessageType, ServerToClientMessage
+from socket_reader import SocketReader
+
+
+BOARD = "┏━━━┳━━━┳━━━┓\n┃ X ┃ O ┃   ┃\n┣━━━╋━━━╋━━━┫\n┃   ┃ X ┃   ┃\n┣━━━╋━━━╋━━━┫\n┃ O ┃   ┃   ┃\n┗━━━┻━━━┻━━━┛\nalice: X | bob: O\nTurn: alice\n"
+CLIENT_ADDRESS = "127.0.0.1:50000"
+
+
+def relay(reader: SocketReader, framing, client_socket: socket.socket, count: int):
+    # Same work as WebServer._handle_server does for a ServerToClientMessage
+    for _ in range(count):
+        msg_obj = reader.read_message(framing)
+        if msg_obj.message_type == MessageType.SERVER_TO_CLIENT_MESSAGE and msg_obj.client_address == CLIENT_ADDRESS:
+            client_socket.sendall(msg_obj.message.encode())
+
+
+def zero_parse_relay(reader: SocketReader, framing, client_socket: socket.socket, count: int):
+    # Same work as WebServer._handle_server_frame does for a relay frame
+    for _ in range(count):
+        message_type, payload = reader.read_frame()
+        if message_type == MessageType.SERVER_TO_CLIENT_RELAY:
+            address, text = ServerToClientMessage.split_relay(payload)
+            if address == CLIENT_ADDRESS:
+                client_socket.sendall(text)
+
+
+def read_exactly(socket_obj: socket.socket, n: int):
+    received = 0
+    while received < n:
+        received += len(socket_obj.recv(n - received))
+
+
+def run(framing, count: int, pipelined: bool, relayed=False):
+    game_server, webserver_in = socket.socketpair()
+    webserver_out, client = socket.socketpair()
+
+    t = threading.Thread(target=zero_parse_relay if relayed else relay, args=[SocketReader(webserver_in), framing, webserver_out, count])
+    t.start()
+
+    message = ServerToClientMessage(CLIENT_ADDRESS, BOARD)
+    frame = message.encode_relay() if relayed else message.encode(framing)
+    payload_size = len(BOARD.encode())
+
+    latencies = []
+    start = time.perf_counter()
+    if pipelined:
+        sender = threading.Thread(target=game_server.sendall, args=[frame * count])
+        sender.start()
+        read_exactly(client, payload_size * count)
+        sender.join()
+    else:
+        for _ in range(count):
+            sent_at = time.perf_counter()
+            game_server.sendall(frame)
+            read_exactly(client, payload_size)
+            latencies.append(time.perf_counter() - sent_at)
+    elapsed = time.perf_counter() - start
+
+    t.join()
+    for s in [game_server, webserver_in, webserver_out, client]:
+        s.close()
+
+    return len(frame), elapsed, latencies
+
+
+if __name__ == '__main__':
+    count = 20000
+
+    modes = [
+        ("JSON (brace counted)", Framing.JSON, False),
+        ("BINARY (length prefixed)", Framing.BINARY, False),
+        ("BINARY relay (no parsing)", Framing.BINARY, True),
+    ]
+    for name, framing, relayed in modes:
+        frame_size, elapsed, _ = run(framing, count, pipelined=True, relayed=relayed)
+        _, _, latencies = run(framing, count // 4, pipelined=False, relayed=relayed)
+        latencies_us = np.array(latencies) * 1e6
+        print(
+            f"{name:26} | frame {frame_size:4} bytes | {count / elapsed:9.0f} msgs/s | "
+            f"latency p50 {np.percentile(latencies_us, 50):6.1f}us p99 {np.percentile(latencies_us, 99):6.1f}us"
+        )
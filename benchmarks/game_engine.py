@@ -0,0 +1,95 @@
+import time
+
+import numpy as np
+
+from game import TicTacToeGame
+
+
+# The list-of-lists engine TicTacToeGame used before it moved to bitboards
+class LegacyTicTacToeGame:
+    def __init__(self, first_turn_number):
+        assert first_turn_number == 1 or first_turn_number == 2
+        self.__board = [[0 for _ in range(3)] for _ in range(3)]
+        self.__turn = first_turn_number
+
+    def get_sign(self, x):
+        return {0: " ", 1: "X", 2: "O"}[x]
+
+    def get_winner(self):
+        for i in range(3):
+            if self.__board[i][0] == self.__board[i][1] and self.__board[i][1] == self.__board[i][2] and self.__board[i][0] != 0:
+                return self.__board[i][0]
+            if self.__board[0][i] == self.__board[1][i] and self.__board[1][i] == self.__board[2][i] and self.__board[0][i] != 0:
+                return self.__board[0][i]
+        if self.__board[0][0] == self.__board[1][1] and self.__board[1][1] == self.__board[2][2] and self.__board[0][0] != 0:
+            return self.__board[0][0]
+        if self.__board[0][2] == self.__board[1][1] and self.__board[1][1] == self.__board[2][0] and self.__board[0][2] != 0:
+            return self.__board[0][2]
+        return None
+
+    def is_draw(self):
+        if self.get_winner() != None:
+            return False
+        for i in range(3):
+            for j in range(3):
+                if self.__board[i][j] == 0:
+                    return False
+        return True
+
+    def is_finished(self):
+        return self.get_winner() != None or self.is_draw()
+
+    def __change_turn(self):
+        self.__turn = 2 if self.__turn == 1 else 1
+
+    def is_coord_valid(self, x, y):
+        return x >= 0  and x <= 2 and y >= 0 and y <= 2
+
+    def is_coord_cell_empty(self, x, y):
+        return self.__board[x][y] == 0
+
+    def put(self, x, y):
+        if self.is_finished():
+            raise Exception("Game is finished!")
+        if not self.is_coord_cell_empty(x, y):
+            raise ValueError(f"Cell ({x}, {y}) is not empty!")
+        self.__board[x][y] = self.__turn
+        self.__change_turn()
+
+
+def random_games(count, seed=0):
+    np.random.seed(seed)
+    games = []
+    for _ in range(count):
+        game = TicTacToeGame(1)
+        moves = []
+        while not game.is_finished():
+            moves.append(game.random_play())
+        games.append(moves)
+    return games
+
+
+def replay(game_cls, games):
+    # Per move, the same calls GameSession makes for a /put
+    moves = 0
+    start = time.perf_counter()
+    for game_moves in games:
+        game = game_cls(1)
+        for x, y in game_moves:
+            if game.is_coord_valid(x, y) and game.is_coord_cell_empty(x, y):
+                game.put(x, y)
+                if game.is_finished():
+                    game.is_draw()
+                    game.get_winner()
+            moves += 1
+    return moves / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    games = random_games(50000)
+
+    legacy = replay(LegacyTicTacToeGame, games)
+    bitboard = replay(TicTacToeGame, games)
+
+    print(f"list of lists | {legacy:10.0f} moves/s")
+    print(f"bitboards     | {bitboard:10.0f} moves/s ({bitboard / legacy:.1f}x)")
@@ -0,0 +1,65 @@
+import contextlib
+import io
+import socket
+import threading
+import time
+
+from messages import ClientToServerMessage, Framing, Message, ServerStartDualPlayMessage
+from server import GameServer
+from socket_reader import SocketReader
+
+
+# The player who moves first wins on the fifth move
+MOVES = [(0, 0), (1, 0), (0, 1), (1, 1), (0, 2)]
+
+
+def drain(socket_obj: socket.socket):
+    while socket_obj.recv(1 << 16):
+        pass
+
+
+def decode(frame: bytes):
+    header_size = Framing.HEADER.size
+    _, message_type, _ = Framing.HEADER.unpack(frame[:header_size])
+    return Message.decode_frame(message_type, frame[header_size:])
+
+
+def run(concurrent_games: int, rounds: int):
+    game_server_socket, sink = socket.socketpair()
+    t = threading.Thread(target=drain, args=[sink])
+    t.start()
+
+    game_server = GameServer(game_server_socket, SocketReader(game_server_socket), Framing.BINARY)
+    players = [[{"username": f"p{g}a", "address": f"10.0.0.1:{g}"}, {"username": f"p{g}b", "address": f"10.0.0.2:{g}"}] for g in range(concurrent_games)]
+
+    games = 0
+    start = time.perf_counter()
+    for r in range(rounds):
+        game_ids = [r * concurrent_games + g for g in range(concurrent_games)]
+        for game_id, clients in zip(game_ids, players):
+            game_server._handle_message(decode(ServerStartDualPlayMessage(clients=clients, game_id=game_id).encode(Framing.BINARY)))
+            game_server._flush()
+
+        # Interleave the games move by move, as a busy server sees them
+        for move in MOVES:
+            for game_id, clients in zip(game_ids, players):
+                turn_client = game_server._sessions[game_id]._get_turn_client()
+                message = ClientToServerMessage(turn_client["address"], f"/put ({move[0]}, {move[1]})", game_id=game_id)
+                game_server._handle_message(decode(message.encode(Framing.BINARY)))
+                game_server._flush()
+        games += concurrent_games
+    elapsed = time.perf_counter() - start
+
+    assert len(game_server._sessions) == 0
+    game_server_socket.close()
+    t.join()
+    sink.close()
+
+    return games / elapsed
+
+
+if __name__ == '__main__':
+    for concurrent_games in [1, 16, 256]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            games_per_second = run(concurrent_games, rounds=max(1, 2048 // concurrent_games))
+        print(f"{concurrent_games:4} concurrent games in one process | {games_per_second:8.0f} games/s")
@@ -0,0 +1,33 @@
+import time
+
+from benchmarks.messages import SAMPLES
+from json_codec import get_available_backends
+from messages import Framing, Message, get_json_backend, use_json_backend
+
+
+def rate(function, items, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for item in items:
+            function(item)
+    return rounds * len(items) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    rounds = 20000
+    print(f"active backend: {get_json_backend()}")
+    print()
+
+    for backend in get_available_backends():
+        use_json_backend(backend.name)
+        frames = [(message.message_type, message.encode(Framing.BINARY)[Framing.HEADER.size:]) for message in SAMPLES]
+        documents = [message.encode(Framing.JSON) for message in SAMPLES]
+
+        encode = rate(lambda message: message.encode(Framing.BINARY), SAMPLES, rounds)
+        decode = rate(lambda frame: Message.decode_frame(*frame), frames, rounds)
+        json_encode = rate(lambda message: message.encode(Framing.JSON), SAMPLES, rounds)
+        json_decode = rate(Message.deserialize, documents, rounds)
+        print(
+            f"{backend.name:8} | binary encode {encode:9.0f} msg/s | binary decode {decode:9.0f} msg/s | "
+            f"json encode {json_encode:9.0f} msg/s | json decode {json_decode:9.0f} msg/s"
+        )
@@ -0,0 +1,79 @@
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from leaderboard import Leaderboard
+from stats_store import StatsStore
+
+
+def per_operation_us(function, items):
+    start = time.perf_counter()
+    for item in items:
+        function(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def run_leaderboard(count, sample):
+    rng = random.Random(0)
+    scores = {f"user{i}": (rng.randrange(100), rng.randrange(20), rng.randrange(100)) for i in range(count)}
+    leaderboard = Leaderboard((username, *score) for username, score in scores.items())
+    players = rng.sample(list(scores), sample)
+
+    def win(username):
+        wins, ties, losses = scores[username]
+        scores[username] = (wins + 1, ties, losses)
+        leaderboard.update(username, wins + 1, ties, losses)
+
+    update = per_operation_us(win, players)
+    rank = per_operation_us(leaderboard.rank, players)
+    # What /scoreboard did before: sort every player for each query
+    full_sort = per_operation_us(
+        lambda _: sorted((-wins, -ties, losses, username) for username, (wins, ties, losses) in scores.items()),
+        range(min(sample, 20))
+    )
+
+    expected = sorted(scores, key=lambda username: (-scores[username][0], -scores[username][1], scores[username][2], username))
+    assert [username for _, username, *_ in leaderboard.top(100)] == expected[:100]
+    assert all(leaderboard.rank(username) == expected.index(username) + 1 for username in players[:20])
+    return update, rank, full_sort
+
+
+def run_store(players, games):
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        path = os.path.join(directory, "stats.db")
+        store = StatsStore(path)
+        rng = random.Random(0)
+        scores = {}
+        results = [(f"user{rng.randrange(players)}", rng.randrange(3)) for _ in range(games)]
+
+        start = time.perf_counter()
+        for username, result in results:
+            score = scores.setdefault(username, [0, 0, 0])
+            score[result] += 1
+            store.record(username, *score)
+        record = (time.perf_counter() - start) / games * 1e6
+
+        close_start = time.perf_counter()
+        store.close()
+        close_time = time.perf_counter() - close_start
+
+        connection = sqlite3.connect(path)
+        assert {row[0]: list(row[1:]) for row in connection.execute("SELECT * FROM players")} == scores
+        connection.close()
+        return record, store.metrics, close_time
+
+
+if __name__ == '__main__':
+    for count in [1000, 10000, 100000]:
+        update, rank, full_sort = run_leaderboard(count, sample=500)
+        print(f"{count:6} players | win recorded {update:5.1f}us | rank query {rank:4.1f}us | full sort {full_sort / 1000:7.2f}ms")
+
+    record, metrics, close_time = run_store(players=10000, games=200000)
+    print(
+        f"200000 game results for 10000 players | StatsStore.record {record:4.1f}us on the game path | "
+        f"{metrics.commits} commits of {metrics.rows_written / max(metrics.commits, 1):.0f} rows, last flush {close_time * 1000:.0f}ms"
+    )
@@ -0,0 +1,68 @@
+import contextlib
+import io
+import random
+import time
+
+from indexed_queue import IndexedQueue
+from messages import ClientInitMessage, ClientMessage
+from webserver import Client, GameType, Server, WebServer
+
+
+class NullSocket:
+    def send(self, data):
+        return len(data)
+
+    def sendall(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+class UnboundWebServer(WebServer):
+    def _init_socket(self):
+        pass
+
+
+def per_operation_us(function, items):
+    start = time.perf_counter()
+    for item in items:
+        function(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def run(count: int, sample: int):
+    web_server = UnboundWebServer(None, None)
+    clients = [
+        web_server._init_new_client(NullSocket(), f"10.0.{i >> 16}.{i & 0xffff}", ClientInitMessage(f"user{i}"), None)
+        for i in range(count)
+    ]
+    for client in clients:
+        web_server._assign_available_client(client, GameType.DUAL)
+
+    # A server takes the 64 clients who waited the longest
+    server = Server(NullSocket(), "10.1.0.1:9000", None, capacity=32)
+    web_server.servers.append(server)
+    web_server._assign_available_server(server)
+    assert [c.username for c in web_server._get_clients_playing_dual_game()][:2] == ["user0", "user1"]
+
+    leaving = random.Random(0).sample(clients[64:], sample)
+    exchange = per_operation_us(lambda c: web_server._handle_client_message(c, ClientMessage("/exchange")), leaving)
+    lookups = per_operation_us(lambda _: web_server._get_games_hosting_dual_game(), range(sample))
+
+    remove = per_operation_us(IndexedQueue(clients[64:]).remove, leaving)
+    # The same operations on the plain lists the WebServer used before
+    legacy_remove = per_operation_us(list(clients[64:]).remove, leaving)
+    legacy_lookups = per_operation_us(lambda _: [c for c in clients if c.status == Client.Status.PLAYING_DUAL], range(min(sample, 100)))
+
+    return exchange, remove, legacy_remove, lookups, legacy_lookups
+
+
+if __name__ == '__main__':
+    for count in [1000, 10000, 100000]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            exchange, remove, legacy_remove, lookups, legacy_lookups = run(count, sample=500)
+        print(
+            f"{count:6} waiting clients | leave queue: list {legacy_remove:6.1f}us indexed queue {remove:4.1f}us | "
+            f"dual games lookup: scan {legacy_lookups:8.1f}us status index {lookups:4.1f}us | /exchange {exchange:4.1f}us"
+        )
@@ -0,0 +1,155 @@
+import contextlib
+import io
+import queue
+import random
+import sys
+import threading
+import time
+
+from benchmarks.matchmaking import NullSocket, UnboundWebServer
+from messages import ClientInitMessage, ClientMessage, Message, MessageType, ServerEndGameMessage
+from webserver import Server
+
+
+COMMANDS = ["/dual", "/dual", "/solo", "/exchange", "/users", "/dual 5 4", "/msg hi"]
+
+
+class UnsynchronizedWebServer(UnboundWebServer):
+    # Every thread changes the matchmaking state directly, for comparison
+    def _run_exclusive(self, function, *args):
+        return function(*args)
+
+
+class ScriptedReader:
+    # Hands out the client's messages, then reports the connection as lost
+    def __init__(self, messages):
+        self._messages = list(messages)
+
+    def read_message(self, framing=None):
+        if not self._messages:
+            raise ConnectionError("Socket closed by the peer")
+        time.sleep(random.random() * 0.002)
+        return self._messages.pop(0)
+
+
+class Assignments:
+    # Every game the WebServer starts, checked against the games that are still running
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = {}
+        self.busy = set()
+        self.started = 0
+        self.duplicated = 0
+
+    def start(self, game_id, usernames):
+        with self._lock:
+            self.started += 1
+            if self.busy & set(usernames) or game_id in self.active:
+                self.duplicated += 1
+            self.active[game_id] = usernames
+            self.busy.update(usernames)
+
+    def end(self, game_id):
+        with self._lock:
+            usernames = self.active.pop(game_id, None)
+            if usernames is None:
+                return False
+            self.busy.difference_update(usernames)
+            return True
+
+
+class FakeGameServerSocket:
+    def __init__(self, assignments: Assignments, games: queue.SimpleQueue):
+        self._assignments = assignments
+        self._games = games
+
+    def sendall(self, data):
+        message = Message.deserialize(data)
+        if message.message_type == MessageType.SERVER_START_SOLO_PLAY:
+            self._assignments.start(message.game_id, [message.client["username"]])
+            self._games.put(message.game_id)
+        elif message.message_type == MessageType.SERVER_START_DUAL_PLAY:
+            self._assignments.start(message.game_id, [c["username"] for c in message.clients])
+            self._games.put(message.game_id)
+        elif message.message_type == MessageType.SERVER_FORCE_TERMINATE:
+            self._assignments.end(message.game_id)
+
+    def close(self):
+        pass
+
+
+def play_games(web_server: UnboundWebServer, server: Server, assignments: Assignments, games: queue.SimpleQueue):
+    # The game server's reader thread: every game ends in a tie shortly after it starts
+    while True:
+        game_id = games.get()
+        if game_id is None:
+            return
+        time.sleep(random.random() * 0.005)
+        if assignments.end(game_id):
+            web_server._handle_server_message(server, ServerEndGameMessage(is_tie=True, winner_address=None, game_id=game_id))
+
+
+def run(web_server_cls, client_count: int, server_count: int, seed=0):
+    random.seed(seed)
+    web_server = web_server_cls(None, None)
+    web_server.TERMINATE_TIMEOUT_DURATION = 1
+
+    assignments = Assignments()
+    game_queues = [queue.SimpleQueue() for _ in range(server_count)]
+    servers = [Server(FakeGameServerSocket(assignments, q), f"10.1.0.{i}:9000", None, capacity=8) for i, q in enumerate(game_queues)]
+    server_threads = [threading.Thread(target=play_games, args=[web_server, s, assignments, q]) for s, q in zip(servers, game_queues)]
+    for server, t in zip(servers, server_threads):
+        web_server._run_exclusive(web_server.servers.append, server)
+        web_server._run_exclusive(web_server._assign_available_server, server)
+        t.start()
+
+    def connect(i):
+        messages = [ClientMessage(random.choice(COMMANDS)) for _ in range(random.randint(3, 10))]
+        web_server._handle_client(ClientInitMessage(f"user{i}"), NullSocket(), f"10.0.0.{i}", ScriptedReader(messages))
+
+    start = time.perf_counter()
+    client_threads = [threading.Thread(target=connect, args=[i]) for i in range(client_count)]
+    for t in client_threads:
+        t.start()
+    for t in client_threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    # Clients that left in the middle of a game are removed once they time out
+    deadline = time.time() + 10
+    while web_server._run_exclusive(len, web_server.clients) and time.time() < deadline:
+        time.sleep(0.1)
+    for q in game_queues:
+        q.put(None)
+    for t in server_threads:
+        t.join()
+
+    def leftovers():
+        return {
+            "clients": len(web_server.clients),
+            "usernames": len(web_server.username_to_clients_dict),
+            "addresses": len(web_server.address_to_clients_dict),
+            "solo queue": len(web_server.waiting_clients_for_solo_play),
+            "dual queues": sum(len(q) for q in web_server.waiting_clients_for_dual_play.values()),
+            "waiting games": len(web_server.waiting_game_for_dual_play),
+            "open games": sum(len(s.games) for s in web_server.servers),
+            "busy servers": len(web_server.servers) - len(web_server.free_servers),
+        }
+
+    return elapsed, assignments, web_server._run_exclusive(leftovers), web_server._state_guard.metrics.get_stats()
+
+
+if __name__ == '__main__':
+    # Switch threads far more often than every 5ms, so races show up in a short run
+    sys.setswitchinterval(1e-5)
+
+    for client_count in [500, 2000]:
+        for name, web_server_cls in [("unsynchronized", UnsynchronizedWebServer), ("state lock", UnboundWebServer)]:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                elapsed, assignments, leftovers, stats = run(web_server_cls, client_count, server_count=8)
+            leaked = {k: v for k, v in leftovers.items() if v != 0}
+            print(
+                f"{client_count:5} clients | {name:14} | {elapsed:5.2f}s | games started {assignments.started:5} | "
+                f"duplicated {assignments.duplicated} | still running {len(assignments.active)} | leaked state {leaked or 'none'}"
+            )
+        print(f"      | {' | '.join(line for section in stats for line in section)}")
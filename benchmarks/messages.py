@@ -0,0 +1,101 @@
+import json
+import sys
+import time
+
+from messages import (
+    ClientInitMessage,
+    ClientInitResponse,
+    ClientMessage,
+    ClientToServerMessage,
+    Message,
+    MessageType,
+    ServerEndGameMessage,
+    ServerForceTerminateMessage,
+    ServerInitMessage,
+    ServerInitResponse,
+    ServerStartDualPlayMessage,
+    ServerStartSoloPlayMessage,
+    ServerToClientMessage,
+    ServerUpdateClientMessage,
+)
+
+
+CLIENT = {"username": "alice", "address": "127.0.0.1:50000"}
+
+SAMPLES = [
+    ClientInitMessage("alice", framing=1),
+    ClientInitResponse(True, "Username accepted by the webserver", framing=1),
+    ClientMessage("/put (1, 1)"),
+    ServerInitMessage(framing=1, capacity=64),
+    ServerInitResponse(1, "Successfully connected to the WebServer.\n"),
+    ServerStartSoloPlayMessage(CLIENT, game_id=1),
+    ServerStartDualPlayMessage([CLIENT, CLIENT], game_id=2),
+    ClientToServerMessage("127.0.0.1:50000", "/put (1, 1)", game_id=1),
+    ServerToClientMessage("127.0.0.1:50000", "┏━━━┳━━━┳━━━┓\n┃ X ┃   ┃ O ┃\n" * 3),
+    ServerEndGameMessage(False, "127.0.0.1:50000", game_id=1),
+    ServerForceTerminateMessage(game_id=1),
+    ServerUpdateClientMessage(CLIENT, game_id=1),
+]
+
+
+class LegacyMessage:
+    # The __dict__ based messages, serialized the way Message did before the slotted codec
+    def __init__(self, message_type, **fields):
+        self.message_type = message_type
+        self.__dict__.update(fields)
+
+    def serialize(self):
+        return json.dumps({k: v for k, v in self.__dict__.items() if v is not None})
+
+    @staticmethod
+    def resolve_class(m_type):
+        return {
+            MessageType.CLIENT_INIT: LegacyMessage,
+            MessageType.CLIENT_INIT_RESPONSE: LegacyMessage,
+            MessageType.CLIENT_MESSAGE: LegacyMessage,
+            MessageType.SERVER_INIT: LegacyMessage,
+            MessageType.SERVER_START_SOLO_PLAY: LegacyMessage,
+            MessageType.SERVER_START_DUAL_PLAY: LegacyMessage,
+            MessageType.CLIENT_TO_SERVER_MESSAGE: LegacyMessage,
+            MessageType.SERVER_TO_CLIENT_MESSAGE: LegacyMessage,
+            MessageType.SERVER_END_GAME: LegacyMessage,
+            MessageType.SERVER_FORCE_TERMINATE: LegacyMessage,
+            MessageType.SERVER_UPDATE_CLIENT: LegacyMessage,
+            MessageType.SERVER_INIT_RESPONSE: LegacyMessage,
+        }[m_type]
+
+    @staticmethod
+    def deserialize(message_json):
+        message_dict = json.loads(message_json)
+        cls = LegacyMessage.resolve_class(message_dict["message_type"])
+        return cls(**message_dict)
+
+
+def rate(function, items, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for item in items:
+            function(item)
+    return rounds * len(items) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    rounds = 20000
+    legacy_samples = [LegacyMessage(**message.to_dict()) for message in SAMPLES]
+    serialized = [message.serialize() for message in SAMPLES]
+    frames = [(message.message_type, message.encode(1)[6:]) for message in SAMPLES]
+
+    results = [
+        ("serialize", rate(LegacyMessage.serialize, legacy_samples, rounds), rate(Message.serialize, SAMPLES, rounds)),
+        ("deserialize", rate(LegacyMessage.deserialize, serialized, rounds), rate(Message.deserialize, serialized, rounds)),
+    ]
+    for name, legacy, slotted in results:
+        print(f"{name:11} | __dict__ messages {legacy:10.0f} msg/s | slotted codec {slotted:10.0f} msg/s ({slotted / legacy:.2f}x)")
+
+    binary_encode = rate(lambda message: message.encode(1), SAMPLES, rounds)
+    binary_decode = rate(lambda frame: Message.decode_frame(*frame), frames, rounds)
+    print(f"binary      | encode {binary_encode:10.0f} msg/s | decode {binary_decode:10.0f} msg/s")
+
+    legacy_bytes = sum(sys.getsizeof(m) + sys.getsizeof(m.__dict__) for m in legacy_samples) / len(legacy_samples)
+    slotted_bytes = sum(sys.getsizeof(m) for m in SAMPLES) / len(SAMPLES)
+    print(f"memory      | __dict__ messages {legacy_bytes:.0f} bytes/msg | slotted messages {slotted_bytes:.0f} bytes/msg")
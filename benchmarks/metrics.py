@@ -0,0 +1,119 @@
+import contextlib
+import io
+import time
+
+from benchmarks.matchmaking import NullSocket, UnboundWebServer
+from messages import ClientInitMessage, Framing, MessageType, ServerToClientMessage, ServerToClientsMessage
+from metrics import MetricsRegistry
+from socket_reader import SocketReader
+from webserver import Server, WebServerMetrics
+
+
+class BufferSocket:
+    # Returns what a game server sent, then reports the connection closed
+    def __init__(self, data):
+        self._data = data
+
+    def recv(self, size):
+        data, self._data = self._data[:size], self._data[size:]
+        return data
+
+
+class UninstrumentedWebServer(UnboundWebServer):
+    # _handle_server as it was before the metrics
+    def _handle_server(self, server: Server):
+        try:
+            while not server.retired:
+                if server.framing == Framing.BINARY:
+                    self._handle_server_frame(server, *server.reader.read_frame())
+                else:
+                    self._handle_server_message(server, server.read_message())
+        except Exception:
+            pass
+
+    def _eject_server(self, server, reason):
+        pass
+
+
+class InstrumentedWebServer(UnboundWebServer):
+    def _eject_server(self, server, reason):
+        pass
+
+
+def per_operation_ns(function, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return (time.perf_counter() - start) / count * 1e9
+
+
+def run_primitives(count):
+    metrics = WebServerMetrics(MetricsRegistry())
+    read_at = time.perf_counter()
+    return {
+        "counter inc": per_operation_ns(lambda: metrics.received_bytes.inc(100), count),
+        "histogram observe": per_operation_ns(lambda: metrics.matchmaking_wait.observe(0.3), count),
+        "client message count": per_operation_ns(lambda: metrics.count_client_message(MessageType.CLIENT_MESSAGE), count),
+        "server message record": per_operation_ns(lambda: metrics.record_server_message(MessageType.SERVER_TO_CLIENT_RELAY, read_at), count),
+        "empty call": per_operation_ns(lambda: None, count),
+    }
+
+
+def run_relay(web_server_cls, clients, messages, instrumented, rounds=5):
+    # Seconds per message for a game server sending board updates to its players, best of rounds
+    with contextlib.redirect_stdout(io.StringIO()):
+        web_server = web_server_cls(None, None)
+        addresses = [f"10.0.0.{i >> 8}:{i & 0xff}" for i in range(clients)]
+        for address in addresses:
+            web_server._init_new_client(NullSocket(), address, ClientInitMessage(f"user{address}"), None)
+
+    frames = []
+    for i in range(messages):
+        board = "X" * 120
+        if i % 2:
+            frames.append(ServerToClientMessage(addresses[i % clients], board).encode_relay())
+        else:
+            frames.append(ServerToClientsMessage([addresses[i % clients], addresses[(i + 1) % clients]], board).encode_relay())
+    data = b"".join(frames)
+
+    best = None
+    for _ in range(rounds):
+        socket_obj = BufferSocket(data)
+        reader = SocketReader(socket_obj, web_server.metrics.received_bytes if instrumented else None)
+        server = Server(NullSocket(), "10.1.0.1:9000", reader, capacity=64)
+        server.framing = Framing.BINARY
+
+        start = time.perf_counter()
+        web_server._handle_server(server)
+        elapsed = (time.perf_counter() - start) / messages
+        best = elapsed if best is None else min(best, elapsed)
+    return best, web_server
+
+
+def run_scrape(clients):
+    with contextlib.redirect_stdout(io.StringIO()):
+        web_server = UnboundWebServer(None, None)
+        for i in range(clients):
+            web_server._init_new_client(NullSocket(), f"10.0.{i >> 16}.{i & 0xffff}", ClientInitMessage(f"user{i}"), None)
+
+    start = time.perf_counter()
+    body = web_server.metrics.registry.render()
+    return time.perf_counter() - start, len(body)
+
+
+if __name__ == '__main__':
+    primitives = run_primitives(200000)
+    print("recording cost: " + " | ".join(f"{name} {ns:.0f}ns" for name, ns in primitives.items()))
+
+    messages = 100000
+    before, _ = run_relay(UninstrumentedWebServer, 1000, messages, instrumented=False)
+    after, web_server = run_relay(InstrumentedWebServer, 1000, messages, instrumented=True)
+    recorded = sum(sum(relay_time.get()[:-1]) for relay_time in web_server.metrics._relay_times.values())
+    print(
+        f"{messages} relayed game server messages | without metrics {before * 1e6:.2f}us | with metrics {after * 1e6:.2f}us per message "
+        f"({(after - before) / before * 100:+.1f}%) | {recorded} relay times recorded"
+    )
+
+    for clients in [1000, 100000]:
+        scrape, size = run_scrape(clients)
+        print(f"scrape with {clients} clients: {scrape * 1000:.2f}ms for {size} bytes")
@@ -0,0 +1,59 @@
+import contextlib
+import io
+
+from benchmarks.game_server import MOVES
+from messages import ClientToServerMessage, Framing, ServerStartDualPlayMessage
+from server import GameServer
+
+
+class CountingSocket:
+    def __init__(self):
+        self.writes = 0
+        self.bytes = 0
+
+    def sendall(self, data):
+        self.writes += 1
+        self.bytes += len(data)
+
+
+class PerMessageGameServer(GameServer):
+    # Writes every frame on its own, like GameServer did before writes were coalesced
+    def _flush(self):
+        for frame in self._outbox:
+            self._socket.sendall(frame)
+        self._outbox.clear()
+
+
+def play(game_server_cls, framing, relay, multicast, games):
+    socket_obj = CountingSocket()
+    game_server = game_server_cls(socket_obj, None, framing, relay=relay, multicast=multicast)
+    clients = [{"username": "alice", "address": "127.0.0.1:50000"}, {"username": "bob", "address": "127.0.0.1:50001"}]
+
+    moves = 0
+    for game_id in range(games):
+        game_server._handle_message(ServerStartDualPlayMessage(clients, game_id=game_id))
+        game_server._flush()
+        for x, y in MOVES:
+            turn_client = game_server._sessions[game_id]._get_turn_client()
+            game_server._handle_message(ClientToServerMessage(turn_client["address"], f"/put ({x}, {y})", game_id=game_id))
+            game_server._flush()
+            moves += 1
+
+    return socket_obj.writes / moves, socket_obj.bytes / moves
+
+
+if __name__ == '__main__':
+    games = 1000
+    modes = [
+        ("JSON", Framing.JSON, False),
+        ("BINARY", Framing.BINARY, False),
+        ("BINARY relay", Framing.BINARY, True),
+    ]
+    for name, framing, relay in modes:
+        with contextlib.redirect_stdout(io.StringIO()):
+            before = play(PerMessageGameServer, framing, relay, False, games)
+            after = play(GameServer, framing, relay, True, games)
+        print(
+            f"{name:12} | one write per client message {before[0]:4.2f} writes {before[1]:6.0f} bytes per move | "
+            f"multicast + coalesced {after[0]:4.2f} writes {after[1]:6.0f} bytes per move"
+        )
@@ -0,0 +1,90 @@
+import contextlib
+import io
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from messages import ClientInitMessage, ClientMessage
+from socket_reader import SocketReader
+from webserver import WebServer
+
+
+def connect(port, username):
+    socket_obj = socket.create_connection(("127.0.0.1", port))
+    socket_obj.sendall(ClientInitMessage(username).encode())
+    SocketReader(socket_obj).read_json()
+    return socket_obj
+
+
+def read_until(socket_obj, text):
+    # Everything received up to text, or until the connection closed
+    received = b""
+    while text not in received:
+        data = socket_obj.recv(65536)
+        if not data:
+            break
+        received += data
+    return received
+
+
+def wait_for(socket_obj, text):
+    return text in read_until(socket_obj, text)
+
+
+def run(port, server_count, clients):
+    env = dict(os.environ, HOST="127.0.0.1", PORT=str(port), GAME_SERVER_CAPACITY="64")
+    with contextlib.redirect_stdout(io.StringIO()):
+        # A shorter timeout than the default so the run doesn't take long
+        web_server = WebServer("127.0.0.1", port, server_heartbeat=(1, 2))
+        threading.Thread(target=web_server.receive_connections, daemon=True).start()
+
+        # One at a time, so processes[i] runs web_server.servers[i]
+        processes = []
+        for i in range(server_count):
+            processes.append(subprocess.Popen([sys.executable, "server.py"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            while len(web_server.servers) <= i:
+                time.sleep(0.05)
+        # A few heartbeats for the round-trip times
+        time.sleep(3)
+
+        sockets = [connect(port, f"bot{i}") for i in range(clients)]
+        for socket_obj in sockets:
+            socket_obj.sendall(ClientMessage("/solo").encode())
+            wait_for(socket_obj, b"You have been assigned")
+
+        loads = {str(server): len(server.games) for server in web_server.servers}
+        rtts = {str(server): server.rtt for server in web_server.servers}
+
+        # The first server hangs: its process is alive and connected, but stops reading
+        hung_server = web_server.servers[0]
+        hung_sockets = [sockets[int(client.username[3:])] for client in web_server.clients if client.game.server is hung_server]
+        processes[0].send_signal(signal.SIGSTOP)
+        stopped_at = time.perf_counter()
+
+        # The games go on where they were on the servers that are left
+        received = [read_until(socket_obj, b"continues where it was left") for socket_obj in hung_sockets]
+        resumed_after = time.perf_counter() - stopped_at
+        servers_left = [str(server) for server in web_server.servers]
+        lost = sum(b"stopped responding" in data for data in received)
+        resumed = sum(b"continues where it was left" in data for data in received)
+
+        for socket_obj in sockets:
+            socket_obj.close()
+        for process in processes:
+            process.kill()
+            process.wait()
+
+    print(f"{clients} solo games on {server_count} servers with 64 slots each")
+    print("  games per server : " + ", ".join(f"{server} {games}" for server, games in loads.items()))
+    print("  heartbeat RTT    : " + ", ".join(f"{server} {rtt * 1000:.2f}ms" for server, rtt in rtts.items()))
+    print(f"  {hung_server} stopped (SIGSTOP); ejected and its games resumed elsewhere after {resumed_after:.2f}s with a 2s heartbeat timeout")
+    print(f"  {lost} of its {len(hung_sockets)} players were told, {resumed} got their game back, servers left: {servers_left}")
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9210
+    run(port, server_count=3, clients=30)
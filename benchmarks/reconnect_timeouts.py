@@ -0,0 +1,70 @@
+import contextlib
+import io
+import threading
+import time
+
+from benchmarks.matchmaking import NullSocket, UnboundWebServer
+from messages import ClientInitMessage
+from webserver import Client, GameType, Server
+
+
+def run(count: int, timeout: float):
+    web_server = UnboundWebServer(None, None)
+    web_server.TERMINATE_TIMEOUT_DURATION = timeout
+
+    server = Server(NullSocket(), "10.1.0.1:9000", None, capacity=count)
+    web_server.servers.append(server)
+    web_server._assign_available_server(server)
+
+    clients = [
+        web_server._init_new_client(NullSocket(), f"10.0.{i >> 16}.{i & 0xffff}", ClientInitMessage(f"user{i}"), None)
+        for i in range(count)
+    ]
+    for client in clients:
+        web_server._run_exclusive(web_server._assign_available_client, client, GameType.DUAL)
+    assert all(c.status == Client.Status.PLAYING_DUAL for c in clients)
+
+    # A network blip: every player drops at once
+    threads_before = threading.active_count()
+    disconnected_at = start = time.perf_counter()
+    for client in clients:
+        web_server._run_exclusive(web_server._handle_client_connection_lost, client)
+    disconnect_time = time.perf_counter() - start
+    threads_after = threading.active_count()
+
+    # Both players of every other game come back, the rest time out
+    returning = [c for i, c in enumerate(clients) if (i // 2) % 2 == 0]
+    start = time.perf_counter()
+    for i, client in enumerate(returning):
+        web_server._run_exclusive(web_server._try_accept_client, ClientInitMessage(client.username), NullSocket(), f"10.2.{i >> 16}.{i & 0xffff}", None)
+    reconnect_time = time.perf_counter() - start
+    pending_after_reconnects = len(web_server._timers)
+
+    deadline = time.perf_counter() + timeout + 30
+    while len(web_server._timers) and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    expired_after = time.perf_counter() - disconnected_at
+    time.sleep(0.1)
+
+    remaining = web_server._run_exclusive(lambda: set(web_server.clients))
+    return {
+        "disconnect us/client": disconnect_time / count * 1e6,
+        "reconnect us/client": reconnect_time / len(returning) * 1e6,
+        "threads started": threads_after - threads_before,
+        "pending deadlines after reconnects": pending_after_reconnects,
+        "last deadline fired after s": expired_after,
+        "returned clients kept": sum(c in remaining for c in returning),
+        "timed out clients removed": count - len(returning) - sum(c not in returning for c in remaining),
+        "clients left": len(remaining),
+    }
+
+
+if __name__ == '__main__':
+    count = 10000
+    timeout = 2
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = run(count, timeout)
+    print(f"{count} simultaneous disconnects, {timeout}s reconnect deadline, done in {time.perf_counter() - start:.1f}s")
+    for name, value in stats.items():
+        print(f"  {name:36} {value:10.1f}" if isinstance(value, float) else f"  {name:36} {value:10}")
@@ -0,0 +1,83 @@
+import contextlib
+import io
+import socket
+import sys
+import threading
+import time
+
+from messages import ClientInitMessage, ClientMessage
+from server_pool import ServerPool
+from socket_reader import SocketReader
+from webserver import WebServer
+
+
+def request_game(port, username, assigned_after, index):
+    socket_obj = socket.create_connection(("127.0.0.1", port))
+    socket_obj.sendall(ClientInitMessage(username).encode())
+    reader = SocketReader(socket_obj)
+    reader.read_json()
+
+    asked_at = time.perf_counter()
+    socket_obj.sendall(ClientMessage("/solo").encode())
+    received = b""
+    while b"You have been assigned" not in received:
+        data = socket_obj.recv(65536)
+        if not data:
+            return socket_obj
+        received += data
+    assigned_after[index] = time.perf_counter() - asked_at
+    return socket_obj
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+
+def run(port, clients, max_size, capacity, idle_timeout):
+    with contextlib.redirect_stdout(io.StringIO()):
+        web_server = WebServer("127.0.0.1", port)
+        # Dropped players free their games quickly, so the servers go idle within the run
+        web_server.TERMINATE_TIMEOUT_DURATION = 0.5
+        web_server.pool = ServerPool(web_server, "127.0.0.1", port, max_size=max_size, capacity=capacity, idle_timeout=idle_timeout)
+        web_server.pool.start()
+        threading.Thread(target=web_server.receive_connections, daemon=True).start()
+
+        assigned_after = [None] * clients
+        sockets = [None] * clients
+
+        def client(index):
+            sockets[index] = request_game(port, f"bot{index}", assigned_after, index)
+
+        threads = [threading.Thread(target=client, args=[i]) for i in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        burst_served = time.perf_counter() - start
+        peak_size = len(web_server.pool)
+
+        for socket_obj in sockets:
+            socket_obj.close()
+
+        # Wait for the pool to shrink back to its minimum
+        retire_start = time.perf_counter()
+        while len(web_server.pool) > 0 and time.perf_counter() - retire_start < idle_timeout + 10:
+            time.sleep(0.1)
+        retired_after = time.perf_counter() - retire_start
+
+        stats = web_server._run_exclusive(web_server._get_pool_stat)
+
+    waits = [wait for wait in assigned_after if wait is not None]
+    print(f"{clients} clients asked for a solo game at once, no servers running, pool of up to {max_size} x {capacity} games")
+    print(f"  all assigned after {burst_served:.2f}s, pool peaked at {peak_size} servers")
+    print(f"  queue wait p50 {percentile(waits, 0.5) * 1000:.0f}ms, p99 {percentile(waits, 0.99) * 1000:.0f}ms")
+    print(f"  pool back to 0 servers {retired_after:.2f}s after the players left (idle timeout {idle_timeout}s)")
+    for section in stats:
+        print("  " + " | ".join(section))
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9200
+    run(port, clients=200, max_size=8, capacity=32, idle_timeout=2)
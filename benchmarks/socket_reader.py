@@ -0,0 +1,75 @@
+import socket
+import threading
+import time
+
+from messages import ServerToClientMessage
+from socket_reader import SocketReader
+
+
+class LegacySocketReader:
+    def __init__(self, socket: socket.socket):
+        self._socket = socket
+
+    def read_json(self):
+        res = self._socket.recv(1).decode()
+        cnt = 1
+        while cnt != 0:
+            ch = self._socket.recv(1).decode()
+            res += ch
+            if ch == "{":
+                cnt += 1
+            elif ch == "}":
+                cnt -= 1
+        return res
+
+
+class CountingSocket:
+    def __init__(self, socket_obj: socket.socket):
+        self._socket = socket_obj
+        self.recv_calls = 0
+
+    def recv(self, size):
+        self.recv_calls += 1
+        return self._socket.recv(size)
+
+
+def _writer(socket_obj: socket.socket, frame: bytes, count: int):
+    socket_obj.sendall(frame * count)
+
+
+def run(reader_cls, frame: bytes, count: int, persistent: bool):
+    left, right = socket.socketpair()
+    counting_socket = CountingSocket(right)
+
+    t = threading.Thread(target=_writer, args=[left, frame, count])
+    t.start()
+
+    start = time.perf_counter()
+    reader = reader_cls(counting_socket)
+    for _ in range(count):
+        if not persistent:
+            reader = reader_cls(counting_socket)
+        reader.read_json()
+    elapsed = time.perf_counter() - start
+
+    t.join()
+    left.close()
+    right.close()
+
+    return elapsed, counting_socket.recv_calls
+
+
+if __name__ == '__main__':
+    frame = ServerToClientMessage("127.0.0.1:50000", "┏━━━┳━━━┳━━━┓\n" * 7).serialize().encode()
+    count = 5000
+
+    print(f"Frame size: {len(frame)} bytes | Frames: {count}")
+    for name, reader_cls, persistent in [
+        ("recv(1) per byte", LegacySocketReader, False),
+        ("buffered, persistent", SocketReader, True),
+    ]:
+        elapsed, recv_calls = run(reader_cls, frame, count, persistent)
+        print(
+            f"{name:22} | {elapsed:7.3f}s | {count / elapsed:10.0f} frames/s | "
+            f"{len(frame) * count / elapsed / 1e6:8.2f} MB/s | {recv_calls:8} recv calls | {recv_calls / count:7.2f} recv/frame"
+        )
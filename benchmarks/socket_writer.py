@@ -0,0 +1,69 @@
+import socket
+import threading
+import time
+
+from benchmarks.framing import BOARD, read_exactly
+from socket_writer import SocketWriter, WriteMetrics
+
+
+class CountingSocket:
+    # Counts the send calls made on a real socket
+    def __init__(self, socket_obj: socket.socket):
+        self._socket = socket_obj
+        self.writes = 0
+
+    def sendall(self, data):
+        self.writes += 1
+        self._socket.sendall(data)
+
+    def sendmsg(self, buffers):
+        self.writes += 1
+        return self._socket.sendmsg(buffers)
+
+    def shutdown(self, how):
+        self._socket.shutdown(how)
+
+    def close(self):
+        self._socket.close()
+
+
+def run(queued: bool, threads: int, frames_per_thread: int):
+    webserver, client = socket.socketpair()
+    counting_socket = CountingSocket(webserver)
+    writer = SocketWriter(counting_socket, WriteMetrics(), 1 << 30) if queued else counting_socket
+
+    frame = BOARD.encode()
+    total = len(frame) * threads * frames_per_thread
+
+    # The game server and client threads of the WebServer, all writing to one client socket
+    def produce():
+        for _ in range(frames_per_thread):
+            writer.sendall(frame)
+
+    start = time.perf_counter()
+    producers = [threading.Thread(target=produce) for _ in range(threads)]
+    for t in producers:
+        t.start()
+    read_exactly(client, total)
+    elapsed = time.perf_counter() - start
+
+    for t in producers:
+        t.join()
+    writes = counting_socket.writes
+    if queued:
+        writer.close()
+    else:
+        webserver.close()
+    client.close()
+
+    return threads * frames_per_thread / elapsed, total / writes
+
+
+if __name__ == '__main__':
+    for threads in [1, 4, 16]:
+        direct, direct_bytes = run(False, threads, 20000 // threads)
+        queued, queued_bytes = run(True, threads, 20000 // threads)
+        print(
+            f"{threads:2} writer threads | sendall from each thread {direct:8.0f} frames/s {direct_bytes:7.0f} bytes/write | "
+            f"queue + one writer {queued:8.0f} frames/s {queued_bytes:7.0f} bytes/write"
+        )
@@ -0,0 +1,149 @@
+import asyncio
+import codecs
+import re
+
+from messages import ClientHeartbeatResponse, ClientInitMessage, ClientInitResponse, ClientMessage, Framing, Message
+from socket_reader import AsyncSocketReader
+
+
+class BotEvent:
+    # What the WebServer and the game servers tell a client, recognized in the text they send.
+    # The texts come from WebServer.Text and GameSession.Text.
+    MENU = "menu"
+    WAIT = "wait"
+    ASSIGNED = "assigned"
+    WAITING_FOR_OPPONENT = "waiting_for_opponent"
+    OPPONENT_FOUND = "opponent_found"
+    # A board with the players' signs and whose turn it is, the first one of a game means it started
+    BOARD = "board"
+    FINISHED = "finished"
+    OPPONENT_LEFT = "opponent_left"
+    CANCELLED = "cancelled"
+    DETACHED = "detached"
+    REJECTED = "rejected"
+    # A /msg broadcast: the sender and the text
+    MESSAGE = "message"
+
+    PATTERNS = {
+        MENU: r"┏━ Menu",
+        WAIT: r"You will be assigned to a server ASAP",
+        ASSIGNED: r"You have been assigned to a server\. Enjoy!",
+        WAITING_FOR_OPPONENT: r"Waiting for opponent\.\.\.",
+        OPPONENT_FOUND: r"Opponent has been found",
+        # Before MESSAGE, which the players line would match too
+        BOARD: r"\S+: [XO] \| \S+: [XO]\nTurn: (?P<turn>\S+)\n",
+        FINISHED: r"Game finished\. (?P<result>Result: Tie|You won the game!|You lost the game!)",
+        OPPONENT_LEFT: r"Your opponent left the game\.",
+        CANCELLED: r"The game was cancelled\.",
+        DETACHED: r"Your game continues on another server ASAP",
+        REJECTED: r"It's not your turn to play!|Invalid coord!|The cell is already filled|Invalid command|Invalid input",
+        MESSAGE: r"(?P<sender>\S+): (?P<text>[^\n]*)\n",
+    }
+
+    REGEX = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in PATTERNS.items()))
+
+
+ANSI_ESCAPE_REGEX = re.compile(r"\x1b\[[0-9;]*m")
+
+
+def parse_board(text):
+    # Returns the rows of the last board in text, each a list of " ", "X" or "O". Board rows
+    # are the lines with cells between "┃", the row and column numbers of big boards aside.
+    rows = []
+    for line in text.split("\n"):
+        if line.startswith("┏") or line.lstrip(" 0123456789").startswith("┏"):
+            rows = []
+        elif "┃" in line:
+            rows.append([cell.strip() or " " for cell in line.split("┃")[1:-1]])
+    return rows
+
+
+def get_empty_cells(rows):
+    return [(x, y) for x, row in enumerate(rows) for y, cell in enumerate(row) if cell == " "]
+
+
+class BotClient:
+    # A client without a terminal: it reads what the WebServer sends as a stream of BotEvents
+    # and answers heartbeats on its own. Everything runs on the caller's event loop.
+
+    def __init__(self, host, port, username, framing=Framing.BINARY, heartbeat=True):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.framing = framing
+        self.heartbeat = heartbeat
+
+        self._reader: AsyncSocketReader = None
+        self._writer: asyncio.StreamWriter = None
+        self._decoder = None
+        # Text received and not yet turned into events, without colors
+        self._text = ""
+        self._raw_tail = ""
+
+    async def connect(self):
+        # Returns the ClientInitResponse, is_valid is False if the username is taken
+        stream_reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._reader = AsyncSocketReader(stream_reader)
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._text = ""
+        self._raw_tail = ""
+
+        if self.framing == Framing.JSON:
+            # The init message old WebServers know, they take no other fields
+            init_message = ClientInitMessage(self.username)
+        else:
+            init_message = ClientInitMessage(self.username, framing=self.framing, heartbeat=self.heartbeat or None)
+        self._writer.write(init_message.encode())
+        response: ClientInitResponse = Message.deserialize(await self._reader.read_json())
+        if response.is_valid:
+            self.framing = Framing.JSON if response.framing is None else response.framing
+        else:
+            self.close()
+        return response
+
+    def send(self, text):
+        self._writer.write(ClientMessage(text).encode(self.framing))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _receive(self, data: bytes):
+        requests = data.count(ClientHeartbeatResponse.REQUEST)
+        if requests:
+            data = data.replace(ClientHeartbeatResponse.REQUEST, b"")
+            for _ in range(requests):
+                self._writer.write(ClientHeartbeatResponse().encode(self.framing))
+
+        # A color code split between two reads is kept until the rest of it comes
+        text = self._raw_tail + self._decoder.decode(data)
+        escape = text.rfind("\x1b")
+        if escape != -1 and "m" not in text[escape:]:
+            text, self._raw_tail = text[:escape], text[escape:]
+        else:
+            self._raw_tail = ""
+        self._text += ANSI_ESCAPE_REGEX.sub("", text)
+
+    async def next_event(self):
+        # Returns (event, match, text) where text is everything received since the previous
+        # event, the board of a BOARD event included
+        while True:
+            match = BotEvent.REGEX.search(self._text)
+            if match is not None:
+                text = self._text[:match.end()]
+                self._text = self._text[match.end():]
+                return match.lastgroup, match, text
+
+            data = await self._reader.read_available()
+            if not data:
+                raise ConnectionError("Socket closed by the WebServer")
+            self._receive(data)
+
+    async def wait_for(self, *events):
+        # Skips events until one of the given ones, returns it like next_event
+        while True:
+            event, match, text = await self.next_event()
+            if event in events:
+                return event, match, text
+
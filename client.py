@@ -1,27 +1,43 @@
 from dotenv import load_dotenv
+import codecs
 import os
 import socket
 import threading
-from messages import ClientInitMessage, ClientInitResponse, ClientMessage, Message
+from messages import ClientHeartbeatResponse, ClientInitMessage, ClientInitResponse, ClientMessage, Framing, Message
 from socket_reader import SocketReader
 
 
-def receive_thread(socket_obj: socket.socket):
+def receive_thread(socket_obj: socket.socket, reader: SocketReader, framing, send_lock: threading.Lock):
+    # Big boards don't fit in one read, and a read can end in the middle of a character
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
     while True:
         try:
-            print(socket_obj.recv(1024).decode(), end='')
-        except:
+            data = reader.read_available(1024)
+            if not data:
+                raise ConnectionError("Socket closed by the peer")
+
+            # Heartbeat requests are answered right away, so an idle client isn't taken for a dead one
+            for _ in range(data.count(ClientHeartbeatResponse.REQUEST)):
+                with send_lock:
+                    socket_obj.sendall(ClientHeartbeatResponse().encode(framing))
+            print(decoder.decode(data.replace(ClientHeartbeatResponse.REQUEST, b"")), end='')
+        except socket.timeout:
+            print(f"\nNo word from the WebServer in {socket_obj.gettimeout()} seconds. Connection lost.")
+            socket_obj.close()
+            return
+        except OSError:
             socket_obj.close()
             return
 
-def send_thread(socket_obj: socket.socket):
+def send_thread(socket_obj: socket.socket, framing, send_lock: threading.Lock):
     while True:
         inp = input()
         if inp == '/exit':
             socket_obj.shutdown(0)
             socket_obj.close()
             return
-        socket_obj.send(ClientMessage(inp).serialize().encode())
+        with send_lock:
+            socket_obj.sendall(ClientMessage(inp).encode(framing))
 
 
 def non_empty_username_from_input():
@@ -39,24 +55,37 @@ if __name__ == '__main__':
     
     host = os.getenv("HOST")
     port = int(os.getenv("PORT"))
+    framing = Framing.BINARY if os.getenv("FRAMING", "binary") == "binary" else Framing.JSON
 
     socket_obj = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     socket_obj.connect((host, port))
 
+    reader = SocketReader(socket_obj)
+
     while True:
-        socket_obj.send(ClientInitMessage(username).serialize().encode())
+        if framing == Framing.JSON:
+            # The init message old WebServers know, they take no other fields
+            init_message = ClientInitMessage(username)
+        else:
+            init_message = ClientInitMessage(username, framing=framing, heartbeat=True)
+        socket_obj.send(init_message.encode())
 
-        message: ClientInitResponse = Message.deserialize(SocketReader(socket_obj).read_json())
+        message: ClientInitResponse = Message.deserialize(reader.read_json())
         
         if message.is_valid:
+            framing = Framing.JSON if message.framing is None else message.framing
+            # The WebServer sends heartbeat requests, so a silent connection is a dead one
+            socket_obj.settimeout(message.heartbeat_timeout)
             break
         else:
             print(message.message, end='')
             username = non_empty_username_from_input()
 
 
-    tr = threading.Thread(target=receive_thread, args=[socket_obj])
-    tc = threading.Thread(target=send_thread, args=[socket_obj])
+    # Heartbeat answers and typed messages are sent from different threads
+    send_lock = threading.Lock()
+    tr = threading.Thread(target=receive_thread, args=[socket_obj, reader, framing, send_lock])
+    tc = threading.Thread(target=send_thread, args=[socket_obj, framing, send_lock])
     
     tr.start()
     tc.start()
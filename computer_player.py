@@ -0,0 +1,151 @@
+from game import TicTacToeGame, WIN_MASKS
+
+
+class Difficulty:
+    RANDOM = "random"
+    GREEDY = "greedy"
+    PERFECT = "perfect"
+
+    ALL = [RANDOM, GREEDY, PERFECT]
+
+
+# The 8 symmetries of the board as cell permutations: SYMMETRIES[s][cell] is where cell goes
+_ROTATE = [3 * (2 - cell % 3) + cell // 3 for cell in range(9)]
+_MIRROR = [3 * (cell // 3) + 2 - cell % 3 for cell in range(9)]
+
+
+def _compose(first, second):
+    return [second[first[cell]] for cell in range(9)]
+
+
+def _build_symmetries():
+    symmetries = []
+    permutation = list(range(9))
+    for _ in range(4):
+        symmetries.append(permutation)
+        symmetries.append(_compose(permutation, _MIRROR))
+        permutation = _compose(permutation, _ROTATE)
+    return symmetries
+
+
+SYMMETRIES = _build_symmetries()
+
+# SYMMETRY_TABLES[s][board] is the bitboard board mapped through symmetry s
+SYMMETRY_TABLES = [
+    [sum(1 << symmetry[cell] for cell in range(9) if board >> cell & 1) for board in range(1 << 9)]
+    for symmetry in SYMMETRIES
+]
+
+
+def canonicalize(mover, opponent):
+    best = None
+    for s, table in enumerate(SYMMETRY_TABLES):
+        key = (table[mover], table[opponent])
+        if best is None or key < best[0]:
+            best = (key, s)
+    return best
+
+
+def has_line(board):
+    for mask in WIN_MASKS:
+        if board & mask == mask:
+            return True
+    return False
+
+
+class PerfectPlayTable:
+    def __init__(self):
+        # Best cell for the player to move, keyed by the canonical (mover, opponent) boards
+        self._best_moves = {}
+        self._scores = {}
+        self._solve(0, 0)
+
+    def __len__(self):
+        return len(self._best_moves)
+
+    def _solve(self, mover, opponent):
+        # Negamax score for the player to move. Faster wins and slower losses score higher.
+        key, _ = canonicalize(mover, opponent)
+        if key in self._scores:
+            return self._scores[key]
+
+        mover, opponent = key
+        empty_cells = 9 - bin(mover | opponent).count("1")
+        if has_line(opponent):
+            score = -(empty_cells + 1)
+        elif empty_cells == 0:
+            score = 0
+        else:
+            score, best_cell = None, None
+            occupied = mover | opponent
+            for cell in range(9):
+                if occupied >> cell & 1:
+                    continue
+                cell_score = -self._solve(opponent, mover | (1 << cell))
+                if score is None or cell_score > score:
+                    score, best_cell = cell_score, cell
+            self._best_moves[key] = best_cell
+
+        self._scores[key] = score
+        return score
+
+    def best_move(self, mover, opponent):
+        (canonical_mover, canonical_opponent), s = canonicalize(mover, opponent)
+        canonical_cell = self._best_moves[(canonical_mover, canonical_opponent)]
+        return SYMMETRIES[s].index(canonical_cell)
+
+
+class ComputerPlayer:
+    # Solved once per process and shared by every perfect player
+    _perfect_play_table: PerfectPlayTable = None
+
+    def __init__(self, difficulty=Difficulty.RANDOM):
+        if difficulty not in Difficulty.ALL:
+            raise ValueError(f"Invalid difficulty \"{difficulty}\". It should be one of {Difficulty.ALL}")
+        self.difficulty = difficulty
+
+        if difficulty == Difficulty.PERFECT and ComputerPlayer._perfect_play_table is None:
+            ComputerPlayer._perfect_play_table = PerfectPlayTable()
+
+    def _winning_cell(self, game: TicTacToeGame, board, occupied):
+        for cell, masks in enumerate(game.get_cell_line_masks()):
+            if occupied >> cell & 1:
+                continue
+            for mask in masks:
+                if (board | (1 << cell)) & mask == mask:
+                    return cell
+        return None
+
+    def _greedy_cell(self, game: TicTacToeGame, mover, opponent):
+        occupied = mover | opponent
+        for board in [mover, opponent]:
+            cell = self._winning_cell(game, board, occupied)
+            if cell is not None:
+                return cell
+        center = (game.size // 2) * (game.size + 1)
+        if not occupied >> center & 1:
+            return center
+        return None
+
+    def play(self, game: TicTacToeGame):
+        if game.is_finished():
+            raise Exception("Game is finished!")
+
+        if self.difficulty == Difficulty.RANDOM:
+            return game.random_play()
+
+        boards = game.get_boards()
+        mover, opponent = (boards[0], boards[1]) if game.get_turn() == 1 else (boards[1], boards[0])
+
+        # The solved table only covers the classic board; bigger boards get the greedy player
+        if self.difficulty == Difficulty.PERFECT and game.is_classic():
+            cell = self._perfect_play_table.best_move(mover, opponent)
+        else:
+            cell = self._greedy_cell(game, mover, opponent)
+            if cell is None:
+                return game.random_play()
+
+        x, y = divmod(cell, game.size)
+        game.put(x, y)
+
+        return x, y
@@ -0,0 +1,245 @@
+import atexit
+import os
+import threading
+import time
+import traceback
+
+from logger import Logger
+from messages import get_json_backend
+from metrics import Samples, format_percentile
+
+
+class Event:
+    # Every record is a JSON array: the sequence number, one of these and the event's fields
+    CLIENT = "client"  # username
+    QUEUE = "queue"  # username, game type, variant
+    MENU = "menu"  # username
+    REMOVE = "remove"  # username
+    START = "start"  # game id, game type, variant, usernames, first turn
+    PUT = "put"  # game id, x, y
+    END = "end"  # game id
+
+
+class EventLogMetrics:
+    SAMPLES = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        self.events = 0
+        self.commits = 0
+        self.bytes_written = 0
+        self.snapshots = 0
+        self.last_snapshot_size = 0
+        # Seconds each write and fsync took, for the latest commits
+        self.commit_times = Samples(self.SAMPLES)
+
+    def append(self):
+        with self._lock:
+            self.events += 1
+
+    def commit(self, size, commit_time):
+        with self._lock:
+            self.commits += 1
+            self.bytes_written += size
+            self.commit_times.append(commit_time)
+
+    def snapshot(self, size):
+        with self._lock:
+            self.snapshots += 1
+            self.last_snapshot_size = size
+
+    def get_stats(self, pending):
+        with self._lock:
+            commit_times = self.commit_times.get_sorted()
+            commits = max(self.commits, 1)
+
+        return [
+            f"Events : {self.events}",
+            f"Pending events : {pending}",
+            f"Commits : {self.commits}",
+            f"Events per commit : {self.events / commits:.2f}",
+            f"Bytes written : {self.bytes_written}",
+        ], [
+            f"Commit time p50 : {format_percentile(commit_times, 0.5)}",
+            f"Commit time p99 : {format_percentile(commit_times, 0.99)}",
+        ], [
+            f"Snapshots : {self.snapshots}",
+            f"Last snapshot size : {self.last_snapshot_size} bytes",
+        ]
+
+
+class RecoveredState:
+    # The games in progress, rebuilt from a snapshot and the events after it. Players who were
+    # in the menu or in a queue aren't kept: like after any disconnect, they come back as new.
+    def __init__(self, snapshot=None):
+        self.seq = 0
+        # Game id -> [game type, variant, usernames, first turn, moves]
+        self.games = {}
+        if snapshot is not None:
+            self.seq = snapshot["seq"]
+            self.games = {game[0]: game[1:] for game in snapshot["games"]}
+
+    def apply(self, record):
+        seq, event, *fields = record
+        self.seq = seq
+        if event == Event.START:
+            game_id, game_type, variant, usernames, first_turn = fields
+            self.games[game_id] = [game_type, variant, usernames, first_turn, []]
+        elif event == Event.PUT:
+            game_id, x, y = fields
+            if game_id in self.games:
+                self.games[game_id][4].append([x, y])
+        elif event == Event.END:
+            self.games.pop(fields[0], None)
+
+
+class EventLog:
+    # An append-only file of state changes, one JSON array per line, and a snapshot file that
+    # replaces everything logged before it. Appending only queues the record; a writer thread
+    # writes and fsyncs whatever piled up while it was busy with the previous commit, so the
+    # WebServer never waits on the disk and a busy server commits many events per fsync. A
+    # crash loses the events of the commit that was in progress.
+
+    # A snapshot is taken after this many events, so recovery replays at most that many
+    SNAPSHOT_EVERY = 100000
+
+    def __init__(self, path):
+        self.path = path
+        self.snapshot_path = path + ".snapshot"
+        self.metrics: EventLogMetrics = EventLogMetrics()
+        self._logger: Logger = Logger()
+        self._json = get_json_backend()
+
+        self.recovered: RecoveredState = self._recover()
+
+        self._condition = threading.Condition()
+        # Encoded records and snapshots, in the order they were made
+        self._pending = []
+        self._pending_events = 0
+        self._seq = self.recovered.seq
+        self._events_since_snapshot = 0
+        self._closed = False
+
+        self._file = open(path, "ab")
+        self._writer = threading.Thread(target=self._run, daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _recover(self):
+        snapshot = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as f:
+                snapshot = self._json.loads(f.read())
+        state = RecoveredState(snapshot)
+
+        if not os.path.exists(self.path):
+            return state
+
+        replayed = 0
+        valid_size = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated record")
+                    record = self._json.loads(line)
+                except Exception:
+                    # A record the crash cut off, it was never committed
+                    self._logger.red(f"Event log {self.path} ends with a torn record at byte {valid_size}. It is dropped")
+                    break
+                valid_size += len(line)
+                # Events from before the snapshot remain if the log wasn't cleared after it
+                if record[0] > state.seq:
+                    state.apply(record)
+                    replayed += 1
+
+        if valid_size != os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_size)
+
+        self._logger.green(f"Event log replayed: {replayed} events after the snapshot, {len(state.games)} games in progress")
+        return state
+
+    def get_pending_count(self):
+        with self._condition:
+            return self._pending_events
+
+    def append(self, event, *fields):
+        # Returns True when it's time for a snapshot
+        with self._condition:
+            self._seq += 1
+            self._events_since_snapshot += 1
+            self._pending.append(self._json.dumps([self._seq, event, *fields]) + b"\n")
+            self._pending_events += 1
+            self._condition.notify()
+            snapshot_due = self._events_since_snapshot >= self.SNAPSHOT_EVERY
+        self.metrics.append()
+        return snapshot_due
+
+    def snapshot(self, games):
+        # games holds [game id, game type, variant, usernames, first turn, moves] for every game
+        # in progress, taken right after the last appended event. It is written by the writer
+        # thread, after the events before it and before the ones after it.
+        with self._condition:
+            self._pending.append({"seq": self._seq, "games": games})
+            self._events_since_snapshot = 0
+            self._condition.notify()
+
+    def close(self):
+        # Commits what is still pending and stops the writer
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._writer.join()
+        self._file.close()
+
+    def _write(self, records):
+        if not records:
+            return
+        started_at = time.perf_counter()
+        data = b"".join(records)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.metrics.commit(len(data), time.perf_counter() - started_at)
+
+    def _write_snapshot(self, snapshot):
+        data = self._json.dumps(snapshot)
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+        # The events up to the snapshot aren't needed anymore. If this is cut short by a crash,
+        # recovery skips them by their sequence numbers.
+        self._file.truncate(0)
+        self.metrics.snapshot(len(data))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+                self._pending_events = 0
+
+            try:
+                records = []
+                for item in batch:
+                    if isinstance(item, bytes):
+                        records.append(item)
+                    else:
+                        self._write(records)
+                        records = []
+                        self._write_snapshot(item)
+                self._write(records)
+            except OSError:
+                self._logger.red(f"Couldn't write to the event log {self.path}")
+                traceback.print_exc()
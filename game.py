@@ -1,96 +1,165 @@
+from functools import lru_cache
 import numpy as np
 
 
+# Cell (x, y) is bit 3*x + y of a player's board
+WIN_MASKS = (
+    0b000000111, 0b000111000, 0b111000000,  # rows
+    0b001001001, 0b010010010, 0b100100100,  # columns
+    0b100010001, 0b001010100,               # diagonals
+)
+
+MAX_BOARD_SIZE = 19
+
+# Right, down, down-right and down-left as (dx, dy)
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+@lru_cache(maxsize=None)
+def get_cell_line_masks(size, win_length):
+    # For every cell of a size x size board (cell (x, y) is bit size*x + y), the masks of the
+    # win_length long lines through it along the four directions
+    cell_masks = [[] for _ in range(size * size)]
+    for x in range(size):
+        for y in range(size):
+            for dx, dy in DIRECTIONS:
+                end_x, end_y = x + dx * (win_length - 1), y + dy * (win_length - 1)
+                if not (0 <= end_x < size and 0 <= end_y < size):
+                    continue
+                cells = [size * (x + dx * i) + y + dy * i for i in range(win_length)]
+                mask = sum(1 << cell for cell in cells)
+                for cell in cells:
+                    cell_masks[cell].append(mask)
+    return tuple(tuple(masks) for masks in cell_masks)
+
+
+def _render_grid(size, get_cell_lines, width, with_axes):
+    margin = "   " if with_axes else ""
+
+    def border(left, middle, right):
+        return margin + left + middle.join(["━" * width] * size) + right + "\n"
+
+    board = ""
+    if with_axes:
+        board += (margin + " " + " ".join(f"{y:^{width}}" for y in range(size))).rstrip() + "\n"
+    board += border("┏", "┳", "┓")
+    for x in range(size):
+        if x != 0:
+            board += border("┣", "╋", "┫")
+        cells = [get_cell_lines(x, y) for y in range(size)]
+        for i in range(len(cells[0])):
+            prefix = (f"{x:>2} " if i == len(cells[0]) // 2 else margin) if with_axes else ""
+            board += prefix + "┃" + "┃".join(lines[i] for lines in cells) + "┃\n"
+    board += border("┗", "┻", "┛")
+    return board
+
+
+@lru_cache(maxsize=None)
+def get_board_template(size):
+    # A format string with one {} per cell. Boards bigger than the classic one get row and
+    # column numbers to read coords from.
+    return _render_grid(size, lambda x, y: [" {} "], 3, size != 3)
+
+
+@lru_cache(maxsize=4096)
+def render_board(size, board_1, board_2):
+    # Keyed by the board state, so a board that is sent to several clients is rendered once
+    signs = TicTacToeGame.SIGNS
+    return get_board_template(size).format(*[
+        signs[(board_1 >> cell & 1) | (board_2 >> cell & 1) << 1] for cell in range(size * size)
+    ])
+
+
+@lru_cache(maxsize=None)
+def render_help_board(size):
+    if size != 3:
+        return _render_grid(size, lambda x, y: ["   "], 3, True) + "Cell (x, y) is on row x and column y\n"
+    return _render_grid(size, lambda x, y: ["        ", f" ({x}, {y}) ", "        "], 8, False)
+
+
 class TicTacToeGame:
-    def __init__(self, first_turn_number):
+    SIGNS = (" ", "X", "O")
+
+    def __init__(self, first_turn_number, size=3, win_length=3):
         assert first_turn_number == 1 or first_turn_number == 2
-        self.__board = [[0 for _ in range(3)] for _ in range(3)]
+        if not 3 <= win_length <= size <= MAX_BOARD_SIZE:
+            raise ValueError(f"Invalid board {size}x{size} with {win_length} in a row. It should be 3 <= win length <= size <= {MAX_BOARD_SIZE}")
+        self.size = size
+        self.win_length = win_length
+        self.__cell_line_masks = get_cell_line_masks(size, win_length)
+        # One size*size bit board per player, indexed by the player number (index 0 is unused)
+        self.__boards = [0, 0, 0]
+        self.__empty_cells = size * size
+        self.__winner = None
         self.__turn = first_turn_number
     
     def get_sign(self, x):
-        return {0: " ", 1: "X", 2: "O"}[x]
-    
+        return self.SIGNS[x]
+
+    def is_classic(self):
+        return self.size == 3 and self.win_length == 3
+
+    def get_cell_line_masks(self):
+        return self.__cell_line_masks
+
     def get_winner(self):
-        for i in range(3):
-            if self.__board[i][0] == self.__board[i][1] and self.__board[i][1] == self.__board[i][2] and self.__board[i][0] != 0:
-                return self.__board[i][0]
-            if self.__board[0][i] == self.__board[1][i] and self.__board[1][i] == self.__board[2][i] and self.__board[0][i] != 0:
-                return self.__board[0][i]
-        if self.__board[0][0] == self.__board[1][1] and self.__board[1][1] == self.__board[2][2] and self.__board[0][0] != 0:
-            return self.__board[0][0]
-        if self.__board[0][2] == self.__board[1][1] and self.__board[1][1] == self.__board[2][0] and self.__board[0][2] != 0:
-            return self.__board[0][2]
-        return None
+        return self.__winner
     
     def is_draw(self):
-        if self.get_winner() != None:
-            return False
-        for i in range(3):
-            for j in range(3):
-                if self.__board[i][j] == 0:
-                    return False
-        return True
+        return self.__winner is None and self.__empty_cells == 0
              
     def is_finished(self):
-        return self.get_winner() != None or self.is_draw() 
+        return self.__winner is not None or self.__empty_cells == 0
     
     def __change_turn(self):
         self.__turn = 2 if self.__turn == 1 else 1
     
     def is_coord_valid(self, x, y):
-        return x >= 0  and x <= 2 and y >= 0 and y <= 2
+        return x >= 0  and x < self.size and y >= 0 and y < self.size
     
     def is_coord_cell_empty(self, x, y):
-        return self.__board[x][y] == 0
+        return not (self.__boards[1] | self.__boards[2]) >> (self.size * x + y) & 1
     
     def put(self, x, y):
         if self.is_finished():
             raise Exception("Game is finished!")
+        if not self.is_coord_valid(x, y):
+            raise ValueError(f"Cell ({x}, {y}) is not on the {self.size}x{self.size} board!")
         if not self.is_coord_cell_empty(x, y):
             raise ValueError(f"Cell ({x}, {y}) is not empty!")
-        self.__board[x][y] = self.__turn
+
+        cell = self.size * x + y
+        board = self.__boards[self.__turn] | (1 << cell)
+        self.__boards[self.__turn] = board
+        self.__empty_cells -= 1
+
+        # Only the lines through the new stone can have been completed by it
+        for mask in self.__cell_line_masks[cell]:
+            if board & mask == mask:
+                self.__winner = self.__turn
+                break
+
         self.__change_turn()
     
     def get_board_as_string(self):
-        board = "┏━━━┳━━━┳━━━┓\n"
-        board += f"┃ {self.get_sign(self.__board[0][0])} ┃ {self.get_sign(self.__board[0][1])} ┃ {self.get_sign(self.__board[0][2])} ┃\n"
-        board += "┣━━━╋━━━╋━━━┫\n"
-        board += f"┃ {self.get_sign(self.__board[1][0])} ┃ {self.get_sign(self.__board[1][1])} ┃ {self.get_sign(self.__board[1][2])} ┃\n"
-        board += "┣━━━╋━━━╋━━━┫\n"
-        board += f"┃ {self.get_sign(self.__board[2][0])} ┃ {self.get_sign(self.__board[2][1])} ┃ {self.get_sign(self.__board[2][2])} ┃\n"
-        board += "┗━━━┻━━━┻━━━┛\n"
-        return board
+        return render_board(self.size, self.__boards[1], self.__boards[2])
     
     def get_help_board_as_string(self):
-        board = ""
-        board += "┏━━━━━━━━┳━━━━━━━━┳━━━━━━━━┓\n"
-        board += "┃        ┃        ┃        ┃\n"
-        board += "┃ (0, 0) ┃ (0, 1) ┃ (0, 2) ┃\n"
-        board += "┃        ┃        ┃        ┃\n"
-        board += "┣━━━━━━━━╋━━━━━━━━╋━━━━━━━━┫\n"
-        board += "┃        ┃        ┃        ┃\n"
-        board += "┃ (1, 0) ┃ (1, 1) ┃ (1, 2) ┃\n"
-        board += "┃        ┃        ┃        ┃\n"
-        board += "┣━━━━━━━━╋━━━━━━━━╋━━━━━━━━┫\n"
-        board += "┃        ┃        ┃        ┃\n"
-        board += "┃ (2, 0) ┃ (2, 1) ┃ (2, 2) ┃\n"
-        board += "┃        ┃        ┃        ┃\n"
-        board += "┗━━━━━━━━┻━━━━━━━━┻━━━━━━━━┛\n"
-        return board
+        return render_help_board(self.size)
 
     def get_turn(self):
         return self.__turn
     
+    def get_boards(self):
+        return self.__boards[1], self.__boards[2]
+
     def random_play(self):
         if self.is_finished():
             raise Exception("Game is finished!")
-        choices = []
-        for i in range(3):
-            for j in range(3):
-                if self.__board[i][j] == 0:
-                    choices.append((i, j))
+        occupied = self.__boards[1] | self.__boards[2]
+        choices = [cell for cell in range(self.size * self.size) if not occupied >> cell & 1]
         
-        x, y = choices[np.random.randint(len(choices))]
+        x, y = divmod(choices[np.random.randint(len(choices))], self.size)
 
         self.put(x, y)
 
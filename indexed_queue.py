@@ -0,0 +1,86 @@
+from collections import defaultdict, deque
+
+
+class IndexedQueue:
+    # A FIFO queue of unique, hashable items with O(1) append, popleft, remove and membership
+    # tests. Removed items are only dropped from the deque once they reach the front; the
+    # index tells which entries are still queued.
+    def __init__(self, items=()):
+        self._entries = deque()
+        self._index = {}
+        self._next_entry = 0
+        for item in items:
+            self.append(item)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __bool__(self):
+        return len(self._index) != 0
+
+    def __contains__(self, item):
+        return item in self._index
+
+    def __iter__(self):
+        for entry, item in self._entries:
+            if self._index.get(item) == entry:
+                yield item
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def append(self, item):
+        if item in self._index:
+            raise ValueError(f"{item} is already queued")
+
+        self._entries.append((self._next_entry, item))
+        self._index[item] = self._next_entry
+        self._next_entry += 1
+
+    def popleft(self):
+        while self._entries:
+            entry, item = self._entries.popleft()
+            if self._index.get(item) == entry:
+                del self._index[item]
+                return item
+        raise IndexError("pop from an empty queue")
+
+    def peek(self):
+        for item in self:
+            return item
+        return None
+
+    def remove(self, item):
+        del self._index[item]
+
+        # Don't let removed entries pile up behind an item that stays at the front
+        if len(self._entries) > 2 * len(self._index) + 64:
+            self._entries = deque((entry, item) for entry, item in self._entries if self._index.get(item) == entry)
+
+    def discard(self, item):
+        if item in self._index:
+            self.remove(item)
+
+
+class StatusIndex:
+    # Items grouped by their current status, each group in the order its items got the status
+    def __init__(self):
+        self._groups = defaultdict(IndexedQueue)
+        self._statuses = {}
+
+    def set(self, item, status):
+        old_status = self._statuses.get(item)
+        if old_status == status:
+            return
+        if old_status is not None:
+            self._groups[old_status].remove(item)
+        self._groups[status].append(item)
+        self._statuses[item] = status
+
+    def discard(self, item):
+        status = self._statuses.pop(item, None)
+        if status is not None:
+            self._groups[status].remove(item)
+
+    def get(self, status) -> IndexedQueue:
+        return self._groups[status]
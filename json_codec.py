@@ -0,0 +1,73 @@
+import json
+
+
+class JsonBackend:
+    # dumps takes a JSON-compatible object and returns UTF-8 bytes; loads takes bytes or str
+    def __init__(self, name, dumps, loads):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self):
+        return self.name
+
+
+def _load_orjson():
+    import orjson
+    return JsonBackend("orjson", orjson.dumps, orjson.loads)
+
+
+def _load_msgspec():
+    import msgspec
+    return JsonBackend("msgspec", msgspec.json.Encoder().encode, msgspec.json.Decoder().decode)
+
+
+def _load_ujson():
+    import ujson
+    return JsonBackend("ujson", lambda obj: ujson.dumps(obj, ensure_ascii=False).encode(), ujson.loads)
+
+
+def _load_stdlib():
+    encoder = json.JSONEncoder()
+    decoder = json.JSONDecoder()
+
+    def dumps(obj):
+        return encoder.encode(obj).encode()
+
+    def loads(data):
+        # Cheaper than letting json.loads detect the encoding of bytes
+        return decoder.decode(data if isinstance(data, str) else bytes(data).decode())
+
+    return JsonBackend("json", dumps, loads)
+
+
+# Fastest first. The stdlib backend is always available.
+BACKEND_LOADERS = {
+    "orjson": _load_orjson,
+    "msgspec": _load_msgspec,
+    "ujson": _load_ujson,
+    "json": _load_stdlib,
+}
+
+# Escapes everything outside ASCII like json.dumps does by default, for peers that can't take
+# UTF-8 split across reads
+dumps_ascii = _load_stdlib().dumps
+
+
+def get_available_backends():
+    backends = []
+    for loader in BACKEND_LOADERS.values():
+        try:
+            backends.append(loader())
+        except ImportError:
+            pass
+    return backends
+
+
+def load_backend(name=None):
+    if name is None:
+        return get_available_backends()[0]
+
+    if name not in BACKEND_LOADERS:
+        raise ValueError(f"Unknown JSON backend \"{name}\". It should be one of {list(BACKEND_LOADERS)}")
+    return BACKEND_LOADERS[name]()
@@ -0,0 +1,50 @@
+import bisect
+
+
+class Leaderboard:
+    # Players ordered by wins, then ties, then fewest losses, then username. The keys are kept
+    # sorted in a list, so a rank is one binary search and an update moves a single entry
+    # instead of sorting everyone again.
+    def __init__(self, scores=()):
+        self._keys = []
+        self._scores = {}
+        for username, wins, ties, losses in scores:
+            self._scores[username] = (wins, ties, losses)
+            self._keys.append(self._get_key(username, wins, ties, losses))
+        self._keys.sort()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, username):
+        return username in self._scores
+
+    @staticmethod
+    def _get_key(username, wins, ties, losses):
+        return -wins, -ties, losses, username
+
+    def get(self, username):
+        # Returns (wins, ties, losses), all zero for players who haven't finished a game
+        return self._scores.get(username, (0, 0, 0))
+
+    def update(self, username, wins, ties, losses):
+        old_score = self._scores.get(username)
+        if old_score == (wins, ties, losses):
+            return
+        if old_score is not None:
+            del self._keys[bisect.bisect_left(self._keys, self._get_key(username, *old_score))]
+
+        self._scores[username] = (wins, ties, losses)
+        bisect.insort(self._keys, self._get_key(username, wins, ties, losses))
+
+    def rank(self, username):
+        # 1-based, None for players who aren't on the board
+        score = self._scores.get(username)
+        if score is None:
+            return None
+        return bisect.bisect_left(self._keys, self._get_key(username, *score)) + 1
+
+    def top(self, count=None):
+        # Returns (rank, username, wins, ties, losses) for the best players
+        for index, (wins, ties, losses, username) in enumerate(self._keys[:count]):
+            yield index + 1, username, -wins, -ties, losses
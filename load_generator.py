@@ -0,0 +1,390 @@
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+
+from bot_client import BotClient, BotEvent, get_empty_cells, parse_board
+from messages import Framing
+from metrics import percentile
+
+
+class LoadConfig:
+    def __init__(
+        self,
+        players=1000,
+        duration=60,
+        ramp_up=10,
+        think_time=(0.5, 2),
+        solo_ratio=0.5,
+        msg_rate=0.05,
+        disconnect_rate=0.01,
+        reconnect_delay=1,
+        framing=Framing.BINARY,
+        username_prefix="bot",
+    ):
+        self.players = players
+        # Seconds from the first player's start to the end of the run, ramp-up included
+        self.duration = duration
+        # Players start evenly spread over the first ramp_up seconds
+        self.ramp_up = ramp_up
+        # A player waits between these many seconds before every move and every game
+        self.think_time = think_time
+        # Chance that a game is /solo rather than /dual
+        self.solo_ratio = solo_ratio
+        # Chances, on every move, to send a /msg and to drop the connection
+        self.msg_rate = msg_rate
+        self.disconnect_rate = disconnect_rate
+        # Seconds a dropped player waits before it comes back with the same username
+        self.reconnect_delay = reconnect_delay
+        self.framing = framing
+        self.username_prefix = username_prefix
+
+
+class LoadStats:
+    # Plain lists and counters, so the stats of several processes can be sent back and merged
+
+    # Seconds between a /put and the board or the result it brought
+    MOVE = "move"
+    # Seconds between a /solo or /dual and the first board of the game
+    SOLO_WAIT = "solo_wait"
+    DUAL_WAIT = "dual_wait"
+    # Seconds between a /msg and its broadcast coming back
+    MSG = "msg"
+
+    COUNTERS = (
+        "logins", "rejected_logins", "connection_errors", "disconnects", "reconnected_games",
+        "games_started", "games_finished", "opponents_left", "games_cancelled", "games_detached", "rejected_commands",
+    )
+
+    def __init__(self):
+        self.samples = {name: [] for name in (self.MOVE, self.SOLO_WAIT, self.DUAL_WAIT, self.MSG)}
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def add(self, name, value):
+        self.samples[name].append(value)
+
+    def count(self, name):
+        self.counters[name] += 1
+
+    def merge(self, other):
+        for name, values in other.samples.items():
+            self.samples[name] += values
+        for name, value in other.counters.items():
+            self.counters[name] += value
+
+    def get_report(self, duration):
+        def percentiles(values):
+            if not values:
+                return "-"
+            values = sorted(values)
+            return " | ".join(
+                f"p{int(p * 100)} {percentile(values, p) * 1000:8.2f}ms" for p in (0.5, 0.95, 0.99)
+            )
+
+        moves = len(self.samples[self.MOVE])
+        return [
+            f"Move round trip  : {percentiles(self.samples[self.MOVE])} ({moves} moves)",
+            f"Solo matchmaking : {percentiles(self.samples[self.SOLO_WAIT])} ({len(self.samples[self.SOLO_WAIT])} games)",
+            f"Dual matchmaking : {percentiles(self.samples[self.DUAL_WAIT])} ({len(self.samples[self.DUAL_WAIT])} players)",
+            f"/msg round trip  : {percentiles(self.samples[self.MSG])} ({len(self.samples[self.MSG])} messages)",
+            f"Throughput       : {moves / duration:.1f} moves/s | {self.counters['games_finished'] / duration:.1f} game results/s",
+            " | ".join(f"{name.replace('_', ' ')} {value}" for name, value in self.counters.items()),
+        ]
+
+
+class Player:
+    # One bot going through the menu, the queues and games until the deadline. Its state is
+    # kept across reconnects, like a person who comes back to the same game.
+
+    # Seconds a player that came back waits for its game before it asks for a new one
+    RESYNC_TIMEOUT = 2
+    RETRY_DELAY = 0.2
+
+    def __init__(self, host, port, username, config: LoadConfig, stats: LoadStats, deadline, rng: random.Random):
+        self.username = username
+        self.config = config
+        self.stats = stats
+        self.deadline = deadline
+        self.rng = rng
+        self.bot = BotClient(host, port, username, config.framing)
+
+        # (game type, time) of the last /solo or /dual that didn't get a game yet
+        self._requested = None
+        self._put_at = None
+        self._msg_seq = 0
+        self._msg_sent_at = {}
+
+    def _choose_game_type(self):
+        return "/solo" if self.rng.random() < self.config.solo_ratio else "/dual"
+
+    async def _think(self):
+        await asyncio.sleep(self.rng.uniform(*self.config.think_time))
+
+    def _request_game(self, game_type):
+        self.bot.send(game_type)
+        self._requested = (game_type, time.perf_counter())
+
+    async def _connect(self):
+        while time.perf_counter() < self.deadline:
+            try:
+                response = await self.bot.connect()
+            except OSError:
+                self.stats.count("connection_errors")
+            else:
+                if response.is_valid:
+                    self.stats.count("logins")
+                    return True
+                # The WebServer hasn't noticed the previous connection is gone
+                self.stats.count("rejected_logins")
+            await asyncio.sleep(self.RETRY_DELAY)
+        return False
+
+    async def _next_event(self, timeout=None):
+        remaining = self.deadline - time.perf_counter()
+        return await asyncio.wait_for(self.bot.next_event(), remaining if timeout is None else min(timeout, remaining))
+
+    async def _take_turn(self, board_text):
+        await self._think()
+        if self.rng.random() < self.config.msg_rate:
+            self._msg_seq += 1
+            self._msg_sent_at[self._msg_seq] = time.perf_counter()
+            self.bot.send(f"/msg ping {self._msg_seq}")
+        if self.rng.random() < self.config.disconnect_rate:
+            return False
+
+        x, y = self.rng.choice(get_empty_cells(parse_board(board_text)))
+        self.bot.send(f"/put ({x}, {y})")
+        self._put_at = time.perf_counter()
+        return True
+
+    def _handle_result(self, now, counter):
+        if self._put_at is not None:
+            self.stats.add(LoadStats.MOVE, now - self._put_at)
+            self._put_at = None
+        self.stats.count(counter)
+
+    async def _resync(self):
+        # Back after a disconnect: a game in progress sends its board right away, otherwise
+        # the player is in the menu or still in a queue, and asks for a game again
+        try:
+            event, match, text = await self._next_event(self.RESYNC_TIMEOUT)
+        except asyncio.TimeoutError:
+            if time.perf_counter() < self.deadline:
+                if self._requested is None:
+                    self._request_game(self._choose_game_type())
+                else:
+                    self.bot.send(self._requested[0])
+            return None
+        if event == BotEvent.BOARD:
+            self.stats.count("reconnected_games")
+        return event, match, text
+
+    async def _play_session(self, resync):
+        # Returns when the player drops its connection or the deadline passes
+        first_event = await self._resync() if resync else None
+        while True:
+            if first_event is not None:
+                (event, match, text), first_event = first_event, None
+            else:
+                event, match, text = await self._next_event()
+            now = time.perf_counter()
+
+            if event == BotEvent.MENU:
+                await self._think()
+                if time.perf_counter() >= self.deadline:
+                    return
+                self._request_game(self._choose_game_type())
+            elif event == BotEvent.BOARD:
+                if self._requested is not None:
+                    game_type, requested_at = self._requested
+                    self.stats.add(LoadStats.SOLO_WAIT if game_type == "/solo" else LoadStats.DUAL_WAIT, now - requested_at)
+                    self.stats.count("games_started")
+                    self._requested = None
+                if self._put_at is not None:
+                    self.stats.add(LoadStats.MOVE, now - self._put_at)
+                    self._put_at = None
+                if match.group("turn") == self.username and not await self._take_turn(text):
+                    self.stats.count("disconnects")
+                    return
+            elif event == BotEvent.FINISHED:
+                self._handle_result(now, "games_finished")
+            elif event == BotEvent.OPPONENT_LEFT:
+                # The WebServer puts the player back in the dual queue on its own
+                self._handle_result(now, "opponents_left")
+                self._requested = ("/dual", now)
+            elif event == BotEvent.CANCELLED:
+                self._handle_result(now, "games_cancelled")
+            elif event == BotEvent.DETACHED:
+                self._put_at = None
+                self.stats.count("games_detached")
+            elif event == BotEvent.REJECTED:
+                self._put_at = None
+                self.stats.count("rejected_commands")
+            elif event == BotEvent.MESSAGE and match.group("sender") == self.username:
+                seq = match.group("text").split()[-1]
+                sent_at = self._msg_sent_at.pop(int(seq), None) if seq.isdigit() else None
+                if sent_at is not None:
+                    self.stats.add(LoadStats.MSG, now - sent_at)
+
+    async def run(self, start_at):
+        await asyncio.sleep(max(0, start_at - time.perf_counter()))
+        resync = False
+        while await self._connect():
+            try:
+                await self._play_session(resync)
+            except asyncio.TimeoutError:
+                pass
+            except (ConnectionError, OSError):
+                self.stats.count("connection_errors")
+            self.bot.close()
+            self._put_at = None
+
+            if time.perf_counter() + self.config.reconnect_delay >= self.deadline:
+                return
+            await asyncio.sleep(self.config.reconnect_delay)
+            resync = True
+
+
+async def run_players(host, port, config: LoadConfig, indexes, started_at):
+    stats = LoadStats()
+    # started_at is time.time() so every process starts the ramp-up at the same moment
+    start = time.perf_counter() - (time.time() - started_at)
+    deadline = start + config.duration
+    players = [
+        Player(host, port, f"{config.username_prefix}{i}", config, stats, deadline, random.Random(i))
+        for i in indexes
+    ]
+    await asyncio.gather(*(
+        player.run(start + config.ramp_up * i / config.players) for i, player in zip(indexes, players)
+    ))
+    return stats
+
+
+def run_process(host, port, config: LoadConfig, indexes, started_at):
+    return asyncio.run(run_players(host, port, config, indexes, started_at))
+
+
+class LocalCluster:
+    # A WebServer and its GameServers on this machine, each in its own process. The WebServer
+    # logs to a temporary file, where the servers connecting are looked for.
+
+    STARTUP_TIMEOUT = 30
+
+    def __init__(self, host, port, server_count, capacity, mode, framing):
+        self.host = host
+        self.port = port
+        self.server_count = server_count
+        self._directory = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self._directory.name, "webserver.log")
+        self._env = dict(
+            os.environ,
+            HOST=host,
+            PORT=str(port),
+            WEBSERVER_MODE=mode,
+            FRAMING="binary" if framing == Framing.BINARY else "json",
+            GAME_SERVER_CAPACITY=str(capacity),
+            STATS_DB=os.path.join(self._directory.name, "stats.db"),
+            EVENT_LOG="",
+            POOL_MAX_SERVERS="0",
+            PYTHONUNBUFFERED="1",
+        )
+        self._processes = []
+
+    def _spawn(self, script, **kwargs):
+        process = subprocess.Popen([sys.executable, script], env=self._env, stderr=subprocess.STDOUT, **kwargs)
+        self._processes.append(process)
+        return process
+
+    def _wait_for_log(self, text, count):
+        timeout_at = time.perf_counter() + self.STARTUP_TIMEOUT
+        while time.perf_counter() < timeout_at:
+            with open(self.log_path, "rb") as f:
+                if f.read().count(text) >= count:
+                    return
+            if any(process.poll() is not None for process in self._processes):
+                break
+            time.sleep(0.1)
+        raise RuntimeError(f"The local cluster didn't start. See {self.log_path}")
+
+    def start(self):
+        # The WebServer reads console commands, its stdin stays open until it is stopped
+        with open(self.log_path, "wb") as log:
+            self._spawn("webserver.py", stdin=subprocess.PIPE, stdout=log)
+        self._wait_for_log(b"WebServer initialized successfully", 1)
+        for _ in range(self.server_count):
+            self._spawn("server.py", stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+        self._wait_for_log(b"New server connected", self.server_count)
+
+    def stop(self):
+        for process in self._processes:
+            process.kill()
+            process.wait()
+        self._directory.cleanup()
+
+
+def run(host, port, config: LoadConfig, process_count=1):
+    started_at = time.time()
+    if process_count <= 1:
+        stats = run_process(host, port, config, range(config.players), started_at)
+    else:
+        # Every process runs an equal share of the players, in its own event loop
+        stats = LoadStats()
+        with ProcessPoolExecutor(process_count) as executor:
+            futures = [
+                executor.submit(run_process, host, port, config, range(i, config.players, process_count), started_at)
+                for i in range(process_count)
+            ]
+            for future in futures:
+                stats.merge(future.result())
+    return stats
+
+
+if __name__ == '__main__':
+    load_dotenv()
+
+    # Players connect to HOST:PORT, where a local WebServer and LOAD_SERVERS GameServers are
+    # started unless LOAD_EXTERNAL is set
+    host = os.getenv("HOST", "127.0.0.1")
+    port = int(os.getenv("PORT"))
+    framing = Framing.BINARY if os.getenv("FRAMING", "binary") == "binary" else Framing.JSON
+    config = LoadConfig(
+        players=int(os.getenv("LOAD_PLAYERS", "1000")),
+        duration=float(os.getenv("LOAD_DURATION", "60")),
+        ramp_up=float(os.getenv("LOAD_RAMP_UP", "10")),
+        think_time=(float(os.getenv("LOAD_THINK_MIN", "0.5")), float(os.getenv("LOAD_THINK_MAX", "2"))),
+        solo_ratio=float(os.getenv("LOAD_SOLO_RATIO", "0.5")),
+        msg_rate=float(os.getenv("LOAD_MSG_RATE", "0.05")),
+        disconnect_rate=float(os.getenv("LOAD_DISCONNECT_RATE", "0.01")),
+        reconnect_delay=float(os.getenv("LOAD_RECONNECT_DELAY", "1")),
+        framing=framing,
+        username_prefix=os.getenv("LOAD_USERNAME_PREFIX", "bot"),
+    )
+
+    cluster = None
+    if not os.getenv("LOAD_EXTERNAL"):
+        cluster = LocalCluster(
+            host,
+            port,
+            server_count=int(os.getenv("LOAD_SERVERS", "4")),
+            capacity=int(os.getenv("GAME_SERVER_CAPACITY", "64")),
+            mode=os.getenv("WEBSERVER_MODE", "threaded"),
+            framing=framing,
+        )
+        cluster.start()
+        print(f"Local cluster: {os.getenv('WEBSERVER_MODE', 'threaded')} WebServer on {host}:{port} with {cluster.server_count} GameServers")
+
+    try:
+        print(f"{config.players} players for {config.duration:g}s, {config.ramp_up:g}s ramp-up")
+        stats = run(host, port, config, int(os.getenv("LOAD_PROCESSES", "1")))
+    finally:
+        if cluster is not None:
+            cluster.stop()
+
+    for line in stats.get_report(config.duration):
+        print(line)
@@ -1,4 +1,6 @@
-import json
+import inspect
+import struct
+from json_codec import JsonBackend, dumps_ascii, load_backend
 
 
 class MessageType:
@@ -13,102 +15,423 @@ class MessageType:
     SERVER_END_GAME = 8
     SERVER_FORCE_TERMINATE = 9
     SERVER_UPDATE_CLIENT = 10
+    SERVER_INIT_RESPONSE = 11
+    # Binary framing only: a ServerToClientMessage laid out for relaying, see ServerToClientMessage.encode_relay
+    SERVER_TO_CLIENT_RELAY = 12
+    SERVER_TO_CLIENTS_MESSAGE = 13
+    # Binary framing only: a ServerToClientsMessage laid out for relaying
+    SERVER_TO_CLIENTS_RELAY = 14
+    SERVER_HEARTBEAT = 15
+    SERVER_HEARTBEAT_RESPONSE = 16
+    CLIENT_HEARTBEAT_RESPONSE = 17
+    SERVER_MOVE = 18
 
     @staticmethod
     def resolve_class(m_type):
-        return {
-            MessageType.CLIENT_INIT: ClientInitMessage,
-            MessageType.CLIENT_INIT_RESPONSE: ClientInitResponse,
-            MessageType.CLIENT_MESSAGE: ClientMessage,
-            MessageType.SERVER_INIT: ServerInitMessage,
-            MessageType.SERVER_START_SOLO_PLAY: ServerStartSoloPlayMessage,
-            MessageType.SERVER_START_DUAL_PLAY: ServerStartDualPlayMessage,
-            MessageType.CLIENT_TO_SERVER_MESSAGE: ClientToServerMessage,
-            MessageType.SERVER_TO_CLIENT_MESSAGE: ServerToClientMessage,
-            MessageType.SERVER_END_GAME: ServerEndGameMessage,
-            MessageType.SERVER_FORCE_TERMINATE: ServerForceTerminateMessage,
-            MessageType.SERVER_UPDATE_CLIENT: ServerUpdateClientMessage,
-        }[m_type]
+        return MESSAGE_CLASSES[m_type]
+
+    @staticmethod
+    def get_name(m_type):
+        return MESSAGE_TYPE_NAMES[m_type]
+
+
+class Framing:
+    # Brace-delimited JSON objects. Every peer understands it.
+    JSON = 0
+    # Fixed header (version, message type, payload length) followed by the JSON encoded fields.
+    BINARY = 1
+
+    SUPPORTED = {JSON, BINARY}
+
+    VERSION = 1
+    HEADER = struct.Struct("!BBI")
+
+    @staticmethod
+    def negotiate(requested):
+        return requested if requested in Framing.SUPPORTED else Framing.JSON
+
+
+# The fastest JSON library that is installed, see use_json_backend
+_json: JsonBackend = load_backend()
+
+
+def use_json_backend(name=None):
+    global _json
+    _json = load_backend(name)
+    return _json
+
+
+def get_json_backend():
+    return _json
 
 
 class Message:
+    __slots__ = ("message_type",)
+
+    # Fields that are left out of the wire format while they are None, so peers that
+    # don't know about them keep working.
+    OPTIONAL_FIELDS = ()
+
     def __init__(self, message_type: MessageType):
         self.message_type = message_type
-    
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._compile_codec()
+
+    @classmethod
+    def _compile_codec(cls):
+        # Like dataclasses do for __init__, generate a to_dict/_to_fields/_from_fields for the
+        # fields of the class, so messages are turned into dicts and back without reflection
+        parameters = list(inspect.signature(cls.__init__).parameters.values())[1:]
+        fields = [p.name for p in parameters]
+
+        def dict_builder(name, first_entries):
+            lines = [f"def {name}(self):", f"    fields = {{{', '.join(first_entries)}}}"]
+            for field in fields:
+                if field in cls.OPTIONAL_FIELDS:
+                    lines.append(f"    if self.{field} is not None:")
+                    lines.append(f"        fields['{field}'] = self.{field}")
+                else:
+                    lines.append(f"    fields['{field}'] = self.{field}")
+            lines.append("    return fields")
+            return "\n".join(lines)
+
+        arguments = [
+            f"fields['{p.name}']" if p.default is inspect.Parameter.empty else f"fields.get('{p.name}')"
+            for p in parameters
+        ]
+        source = "\n\n".join([
+            dict_builder("to_dict", ["'message_type': self.message_type"]),
+            dict_builder("_to_fields", []),
+            f"def _from_fields(fields):\n    return cls({', '.join(arguments)})",
+        ])
+
+        namespace = {"cls": cls}
+        exec(source, namespace)
+        cls.to_dict = namespace["to_dict"]
+        cls._to_fields = namespace["_to_fields"]
+        cls._from_fields = staticmethod(namespace["_from_fields"])
+
+    def to_dict(self):
+        return {"message_type": self.message_type}
+
+    def _to_fields(self):
+        return {}
+
     def serialize(message):
-        return json.dumps(message, default=lambda msg: msg.__dict__)
+        return message.encode().decode()
+
+    def encode(self, framing=Framing.JSON):
+        if framing == Framing.JSON:
+            fields = self.to_dict()
+            data = _json.dumps(fields)
+            # Peers on JSON framing may read byte by byte and decode each byte on its own
+            return data if data.isascii() else dumps_ascii(fields)
+
+        payload = _json.dumps(self._to_fields())
+        return Framing.HEADER.pack(Framing.VERSION, self.message_type, len(payload)) + payload
     
     @staticmethod
     def deserialize(message_json):
-        message_dict = json.loads(message_json)
-        cls = MessageType.resolve_class(message_dict["message_type"])
-        message_dict.pop("message_type")
-        return cls(**message_dict)
+        # Takes the JSON as bytes or str
+        fields = _json.loads(message_json)
+        return MESSAGE_CLASSES[fields["message_type"]]._from_fields(fields)
+
+    @staticmethod
+    def decode_frame(message_type, payload):
+        if message_type == MessageType.SERVER_TO_CLIENT_RELAY:
+            return ServerToClientMessage.decode_relay(payload)
+        if message_type == MessageType.SERVER_TO_CLIENTS_RELAY:
+            return ServerToClientsMessage.decode_relay(payload)
+        return MESSAGE_CLASSES[message_type]._from_fields(_json.loads(payload))
 
 
 class ClientInitMessage(Message):
-    def __init__(self, username):
+    __slots__ = ("username", "framing", "heartbeat")
+
+    OPTIONAL_FIELDS = ("framing", "heartbeat")
+
+    def __init__(self, username, framing=None, heartbeat=None):
         super().__init__(MessageType.CLIENT_INIT)
         self.username = username
+        self.framing = framing
+        # True if the client answers heartbeat requests, see ClientHeartbeatResponse
+        self.heartbeat = heartbeat
 
 
 class ClientInitResponse(Message):
-    def __init__(self, is_valid, message):
+    __slots__ = ("is_valid", "message", "framing", "heartbeat_timeout")
+
+    OPTIONAL_FIELDS = ("framing", "heartbeat_timeout")
+
+    def __init__(self, is_valid, message, framing=None, heartbeat_timeout=None):
         super().__init__(MessageType.CLIENT_INIT_RESPONSE)
         self.is_valid = is_valid
         self.message = message
+        self.framing = framing
+        # Set if the WebServer sends heartbeat requests: seconds without a word from the
+        # WebServer after which the client can count the connection as dead
+        self.heartbeat_timeout = heartbeat_timeout
 
 
 class ClientMessage(Message):
+    __slots__ = ("message",)
+
     def __init__(self, message):
         super().__init__(MessageType.CLIENT_MESSAGE)
         self.message = message
 
 
 class ServerInitMessage(Message):
-    def __init__(self):
+    __slots__ = ("framing", "capacity", "relay", "multicast", "worker_id", "heartbeat", "resumable")
+
+    OPTIONAL_FIELDS = ("framing", "capacity", "relay", "multicast", "worker_id", "heartbeat", "resumable")
+
+    def __init__(self, framing=None, capacity=None, relay=None, multicast=None, worker_id=None, heartbeat=None, resumable=None):
         super().__init__(MessageType.SERVER_INIT)
+        self.framing = framing
+        # Number of games the server can host at once. Servers that don't send it host one game.
+        self.capacity = capacity
+        # True if the server can send ServerToClientMessages as relay frames
+        self.relay = relay
+        # True if the server can send ServerToClientsMessages
+        self.multicast = multicast
+        # Set by servers the WebServer's server pool started
+        self.worker_id = worker_id
+        # True if the server answers ServerHeartbeatMessages
+        self.heartbeat = heartbeat
+        # True if the server can report moves with ServerMoveMessages and start games from the
+        # first turn and moves in the start messages
+        self.resumable = resumable
+
+
+class ServerInitResponse(Message):
+    __slots__ = ("framing", "message", "relay", "multicast", "heartbeat_timeout", "resumable")
+
+    OPTIONAL_FIELDS = ("relay", "multicast", "heartbeat_timeout", "resumable")
+
+    def __init__(self, framing, message, relay=None, multicast=None, heartbeat_timeout=None, resumable=None):
+        super().__init__(MessageType.SERVER_INIT_RESPONSE)
+        self.framing = framing
+        self.message = message
+        # True if the WebServer accepts relay frames from the server
+        self.relay = relay
+        # True if the WebServer accepts ServerToClientsMessages from the server
+        self.multicast = multicast
+        # Set if the WebServer sends ServerHeartbeatMessages: seconds without a word from the
+        # WebServer after which the server can count the connection as dead
+        self.heartbeat_timeout = heartbeat_timeout
+        # True if the WebServer wants ServerMoveMessages from the server
+        self.resumable = resumable
 
 
 class ServerStartSoloPlayMessage(Message):
-    def __init__(self, client):
+    __slots__ = ("client", "game_id", "size", "win_length", "first_turn", "moves")
+
+    # size and win_length are left out for the classic 3x3 game. first_turn and moves are only
+    # sent to resumable servers: the player who starts, and for a game that is resumed, the
+    # [x, y] of every move played so far.
+    OPTIONAL_FIELDS = ("game_id", "size", "win_length", "first_turn", "moves")
+
+    def __init__(self, client, game_id=None, size=None, win_length=None, first_turn=None, moves=None):
         super().__init__(MessageType.SERVER_START_SOLO_PLAY)
         self.client = client
+        self.game_id = game_id
+        self.size = size
+        self.win_length = win_length
+        self.first_turn = first_turn
+        self.moves = moves
 
 
 class ServerStartDualPlayMessage(Message):
-    def __init__(self, clients):
+    __slots__ = ("clients", "game_id", "size", "win_length", "first_turn", "moves")
+
+    # See ServerStartSoloPlayMessage
+    OPTIONAL_FIELDS = ("game_id", "size", "win_length", "first_turn", "moves")
+
+    def __init__(self, clients, game_id=None, size=None, win_length=None, first_turn=None, moves=None):
         super().__init__(MessageType.SERVER_START_DUAL_PLAY)
         self.clients = clients
+        self.game_id = game_id
+        self.size = size
+        self.win_length = win_length
+        self.first_turn = first_turn
+        self.moves = moves
 
 
 class ClientToServerMessage(Message):
-    def __init__(self, client_address, message):
+    __slots__ = ("client_address", "message", "game_id")
+
+    OPTIONAL_FIELDS = ("game_id",)
+
+    def __init__(self, client_address, message, game_id=None):
         super().__init__(MessageType.CLIENT_TO_SERVER_MESSAGE)
         self.client_address = client_address
-        self. message = message
+        self.message = message
+        self.game_id = game_id
 
 
 class ServerToClientMessage(Message):
+    __slots__ = ("client_address", "message")
+
+    # Frame header followed by the length of the client address. A relay frame is this header,
+    # the address and then the raw UTF-8 text, so the WebServer can route it on the address and
+    # forward the text as it is.
+    RELAY_HEADER = struct.Struct("!BBIH")
+    ADDRESS_LENGTH = struct.Struct("!H")
+
     def __init__(self, client_address, message):
         super().__init__(MessageType.SERVER_TO_CLIENT_MESSAGE)
         self.client_address = client_address
         self.message = message
 
+    def encode_relay(self):
+        return self.pack_relay(MessageType.SERVER_TO_CLIENT_RELAY, self.client_address, self.message)
+
+    @staticmethod
+    def pack_relay(message_type, address, text):
+        address = address.encode()
+        text = text.encode()
+        length = ServerToClientMessage.ADDRESS_LENGTH.size + len(address) + len(text)
+        header = ServerToClientMessage.RELAY_HEADER.pack(Framing.VERSION, message_type, length, len(address))
+        return header + address + text
+
+    @staticmethod
+    def split_relay(payload):
+        # The client address and a memoryview of the text, without copying the text
+        view = memoryview(payload)
+        (address_length,) = ServerToClientMessage.ADDRESS_LENGTH.unpack_from(view)
+        start = ServerToClientMessage.ADDRESS_LENGTH.size
+        return str(view[start:start + address_length], "utf-8"), view[start + address_length:]
+
+    @staticmethod
+    def decode_relay(payload):
+        address, text = ServerToClientMessage.split_relay(payload)
+        return ServerToClientMessage(address, str(text, "utf-8"))
+
+
+class ServerToClientsMessage(Message):
+    __slots__ = ("client_addresses", "message")
+
+    # Relay frames have the layout of ServerToClientMessage relay frames, with the client
+    # addresses joined by commas in place of the single address
+
+    def __init__(self, client_addresses, message):
+        super().__init__(MessageType.SERVER_TO_CLIENTS_MESSAGE)
+        self.client_addresses = client_addresses
+        self.message = message
+
+    def expand(self):
+        # One ServerToClientMessage per recipient, for WebServers that don't take multicasts
+        return [ServerToClientMessage(address, self.message) for address in self.client_addresses]
+
+    def encode_relay(self):
+        return ServerToClientMessage.pack_relay(MessageType.SERVER_TO_CLIENTS_RELAY, ",".join(self.client_addresses), self.message)
+
+    @staticmethod
+    def split_relay(payload):
+        addresses, text = ServerToClientMessage.split_relay(payload)
+        return addresses.split(","), text
+
+    @staticmethod
+    def decode_relay(payload):
+        addresses, text = ServerToClientsMessage.split_relay(payload)
+        return ServerToClientsMessage(addresses, str(text, "utf-8"))
+
 
 class ServerEndGameMessage(Message):
-    def __init__(self, is_tie, winner_address):
+    __slots__ = ("is_tie", "winner_address", "game_id")
+
+    OPTIONAL_FIELDS = ("game_id",)
+
+    def __init__(self, is_tie, winner_address, game_id=None):
         super().__init__(MessageType.SERVER_END_GAME)
         self.is_tie = is_tie
         self.winner_address = winner_address
+        self.game_id = game_id
 
 
 class ServerForceTerminateMessage(Message):
-    def __init__(self):
+    __slots__ = ("game_id",)
+
+    OPTIONAL_FIELDS = ("game_id",)
+
+    def __init__(self, game_id=None):
         super().__init__(MessageType.SERVER_FORCE_TERMINATE)
+        self.game_id = game_id
 
 
 class ServerUpdateClientMessage(Message):
-    def __init__(self, client):
+    __slots__ = ("client", "game_id")
+
+    OPTIONAL_FIELDS = ("game_id",)
+
+    def __init__(self, client, game_id=None):
         super().__init__(MessageType.SERVER_UPDATE_CLIENT)
         self.client = client
+        self.game_id = game_id
+
+
+class ServerHeartbeatMessage(Message):
+    __slots__ = ("sequence",)
+
+    def __init__(self, sequence):
+        super().__init__(MessageType.SERVER_HEARTBEAT)
+        self.sequence = sequence
+
+
+class ServerHeartbeatResponse(Message):
+    __slots__ = ("sequence",)
+
+    def __init__(self, sequence):
+        super().__init__(MessageType.SERVER_HEARTBEAT_RESPONSE)
+        # The sequence of the ServerHeartbeatMessage it answers
+        self.sequence = sequence
+
+
+class ServerMoveMessage(Message):
+    __slots__ = ("game_id", "x", "y")
+
+    # Sent by resumable servers for every move played, the computer's included, so the
+    # WebServer can start the game over on another server from where it was
+    def __init__(self, game_id, x, y):
+        super().__init__(MessageType.SERVER_MOVE)
+        self.game_id = game_id
+        self.x = x
+        self.y = y
+
+
+class ClientHeartbeatResponse(Message):
+    __slots__ = ()
+
+    # Texts sent to clients aren't framed, so the WebServer asks for a heartbeat with a byte
+    # that never appears in them, ASCII ENQ. The client answers with this message.
+    REQUEST = b"\x05"
+
+    def __init__(self):
+        super().__init__(MessageType.CLIENT_HEARTBEAT_RESPONSE)
+
+
+MESSAGE_CLASSES = {
+    MessageType.CLIENT_INIT: ClientInitMessage,
+    MessageType.CLIENT_INIT_RESPONSE: ClientInitResponse,
+    MessageType.CLIENT_MESSAGE: ClientMessage,
+    MessageType.SERVER_INIT: ServerInitMessage,
+    MessageType.SERVER_START_SOLO_PLAY: ServerStartSoloPlayMessage,
+    MessageType.SERVER_START_DUAL_PLAY: ServerStartDualPlayMessage,
+    MessageType.CLIENT_TO_SERVER_MESSAGE: ClientToServerMessage,
+    MessageType.SERVER_TO_CLIENT_MESSAGE: ServerToClientMessage,
+    MessageType.SERVER_END_GAME: ServerEndGameMessage,
+    MessageType.SERVER_FORCE_TERMINATE: ServerForceTerminateMessage,
+    MessageType.SERVER_UPDATE_CLIENT: ServerUpdateClientMessage,
+    MessageType.SERVER_INIT_RESPONSE: ServerInitResponse,
+    MessageType.SERVER_TO_CLIENTS_MESSAGE: ServerToClientsMessage,
+    MessageType.SERVER_HEARTBEAT: ServerHeartbeatMessage,
+    MessageType.SERVER_HEARTBEAT_RESPONSE: ServerHeartbeatResponse,
+    MessageType.CLIENT_HEARTBEAT_RESPONSE: ClientHeartbeatResponse,
+    MessageType.SERVER_MOVE: ServerMoveMessage,
+}
+
+# "server_to_client_relay" for MessageType.SERVER_TO_CLIENT_RELAY, as metrics label them
+MESSAGE_TYPE_NAMES = {value: name.lower() for name, value in vars(MessageType).items() if name.isupper()}
@@ -0,0 +1,257 @@
+import threading
+import traceback
+from bisect import bisect_left
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import get_ident
+
+from logger import Logger
+
+
+# Upper bounds in seconds, for the time a message or a move takes to handle
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+# Upper bounds in seconds, for the time players wait for a game
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return str(value)
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def percentile(sorted_values, p):
+    # None if there are no values
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+def format_percentile(sorted_values, p, unit="ms", digits=2):
+    # Values are in seconds, "-" if there are none
+    value = percentile(sorted_values, p)
+    if value is None:
+        return "-"
+    return f"{value * (1e6 if unit == 'us' else 1000):.{digits}f}{unit}"
+
+
+class Samples:
+    # The latest values of a measurement, for the percentiles the console stats show. It has
+    # no lock of its own: the metrics classes append and take sorted copies under theirs.
+    def __init__(self, size=1024):
+        self._values = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self._values)
+
+    def append(self, value):
+        self._values.append(value)
+
+    def get_sorted(self):
+        return sorted(self._values)
+
+
+class Value:
+    # One series of a counter or a gauge. Every thread adds to a cell of its own, so recording
+    # takes no lock, and the cells are summed when the registry is scraped. Thread idents are
+    # reused, which keeps the cells about as many as the threads that run at the same time.
+    # set is for values copied from elsewhere at scrape time, it isn't mixed with inc.
+    __slots__ = ("_lock", "_cells", "_base")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cells = {}
+        self._base = 0
+
+    def _add_cell(self):
+        with self._lock:
+            return self._cells.setdefault(get_ident(), [0])
+
+    def inc(self, amount=1):
+        try:
+            self._cells[get_ident()][0] += amount
+        except KeyError:
+            self._add_cell()[0] += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self._base = value
+            for cell in self._cells.values():
+                cell[0] = 0
+
+    def get(self):
+        with self._lock:
+            return self._base + sum(cell[0] for cell in self._cells.values())
+
+    def get_samples(self, name, labels):
+        yield name, labels, self.get()
+
+
+class HistogramValue:
+    # One series of a histogram, kept in per-thread cells like Value. A cell holds a count per
+    # bucket, the count above every bucket and the sum; they are made cumulative only when the
+    # registry is scraped, so an observation is a bisect and two additions.
+    __slots__ = ("_lock", "_cells", "_buckets")
+
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self._cells = {}
+        self._buckets = buckets
+
+    def _add_cell(self):
+        with self._lock:
+            return self._cells.setdefault(get_ident(), [0] * (len(self._buckets) + 2))
+
+    def observe(self, value):
+        try:
+            cell = self._cells[get_ident()]
+        except KeyError:
+            cell = self._add_cell()
+        cell[bisect_left(self._buckets, value)] += 1
+        cell[-1] += value
+
+    def get(self):
+        # The count of each bucket, not cumulative, followed by the sum
+        with self._lock:
+            return [sum(values) for values in zip(*self._cells.values())] or [0] * (len(self._buckets) + 2)
+
+    def get_samples(self, name, labels):
+        *counts, total = self.get()
+
+        cumulative = 0
+        for bound, count in zip(self._buckets + (float("inf"),), counts):
+            cumulative += count
+            yield f"{name}_bucket", labels + (("le", format_value(bound)),), cumulative
+        yield f"{name}_sum", labels, total
+        yield f"{name}_count", labels, cumulative
+
+
+class Metric:
+    # A named family of series, one per combination of label values. Hot paths look their
+    # series up once with labels() and keep it.
+    def __init__(self, name, documentation, metric_type, label_names, create_value):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.label_names = tuple(label_names)
+        self._create_value = create_value
+
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def labels(self, *label_values):
+        if len(label_values) != len(self.label_names):
+            raise ValueError(f"{self.name} takes the labels {self.label_names}, got {label_values}")
+
+        value = self._values.get(label_values)
+        if value is None:
+            with self._lock:
+                value = self._values.setdefault(label_values, self._create_value())
+        return value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            values = list(self._values.items())
+
+        for label_values, value in values:
+            for name, labels, sample in value.get_samples(self.name, tuple(zip(self.label_names, label_values))):
+                if labels:
+                    name += "{" + ",".join(f"{label}=\"{escape_label_value(v)}\"" for label, v in labels) + "}"
+                lines.append(f"{name} {format_value(sample)}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsRegistry:
+    # Metrics in the Prometheus text format. Collectors run before every scrape, for values
+    # that are cheaper to read when asked for than to keep up to date.
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._logger: Logger = Logger()
+
+    def _add(self, metric: Metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Metric(name, documentation, "counter", labels, Value))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._add(Metric(name, documentation, "gauge", labels, Value))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        buckets = tuple(sorted(buckets))
+        return self._add(Metric(name, documentation, "histogram", labels, lambda: HistogramValue(buckets)))
+
+    def add_collector(self, function):
+        self._collectors.append(function)
+
+    def render(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception:
+                # What was collected before is served rather than nothing
+                self._logger.red("A metrics collector failed")
+                traceback.print_exc()
+        return "".join(metric.render() for metric in self._metrics).encode()
+
+
+class MetricsServer:
+    # Serves a registry over HTTP at /metrics, for Prometheus or curl to scrape. It runs on
+    # its own threads, and scrapes only read what the hot paths record.
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, registry: MetricsRegistry, host, port):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._logger: Logger = Logger()
+        self._http_server: ThreadingHTTPServer = None
+
+    def _create_handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render()
+                self.send_response(200)
+                self.send_header("Content-Type", MetricsServer.CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        # Returns False when the port can't be used, the process runs on without the endpoint
+        try:
+            self._http_server = ThreadingHTTPServer((self.host, self.port), self._create_handler())
+        except OSError as e:
+            self._logger.red(f"Metrics endpoint couldn't listen on {self.host}:{self.port}: {e}")
+            return False
+        self._http_server.daemon_threads = True
+        # Port 0 picks a free port
+        self.port = self._http_server.server_address[1]
+        threading.Thread(target=self._http_server.serve_forever, daemon=True).start()
+        self._logger.green(f"Metrics served at http://{self.host}:{self.port}/metrics")
+        return True
+
+    def stop(self):
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server.server_close()
@@ -1,53 +1,117 @@
 from typing import Dict, List
 from dotenv import load_dotenv
+from functools import lru_cache
 import os
 import socket
-from game import TicTacToeGame
+import time
+from computer_player import ComputerPlayer, Difficulty
+from game import TicTacToeGame, render_help_board
 import numpy as np
 from termcolor import colored
 import re
 from logger import Logger
+from metrics import MetricsRegistry, MetricsServer
 
 from messages import (
     ClientToServerMessage,
+    Framing,
     Message,
     MessageType,
     ServerEndGameMessage,
+    ServerHeartbeatResponse,
     ServerInitMessage,
+    ServerInitResponse,
+    ServerMoveMessage,
     ServerStartDualPlayMessage,
     ServerStartSoloPlayMessage,
-    ServerToClientMessage
+    ServerToClientMessage,
+    ServerToClientsMessage,
+    get_json_backend,
+    use_json_backend,
 )
 from socket_reader import SocketReader
 
 
-class GameServer:
-    class ServerStatus:
+class GameServerMetrics:
+    # What a GameServer records, on the registry its metrics endpoint serves. One instance
+    # outlives the GameServers of successive connections to the WebServer.
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+
+        self.received_bytes = registry.counter("gameserver_received_bytes_total", "Bytes read from the WebServer").labels()
+        self.sent_bytes = registry.counter("gameserver_sent_bytes_total", "Bytes written to the WebServer").labels()
+        self._messages = registry.counter("gameserver_messages_received_total", "Messages read from the WebServer, by type", ("type",))
+        self._message_counts = {}
+        self.move_time = registry.histogram(
+            "gameserver_move_seconds", "Seconds to handle a valid /put, the computer's answer and the result included"
+        ).labels()
+        self.games = registry.gauge("gameserver_games", "Games running").labels()
+        self.games_started = registry.counter("gameserver_games_started_total", "Games started or resumed").labels()
+
+    def count_message(self, message_type):
+        count = self._message_counts.get(message_type)
+        if count is None:
+            count = self._message_counts[message_type] = self._messages.labels(MessageType.get_name(message_type))
+        count.inc()
+
+
+class GameSession:
+    class Status:
         PLAYING_SOLO = 0
         PLAYING_DUAL = 1
         WAITING = 2
 
 
+    # Fixed texts are colored once instead of on every send
+    class Text:
+        GAME_STARTED = colored("Game started. Enjoy!\n", "green")
+        GAME_RESUMED = colored("Your game continues where it was left. Enjoy!\n", "green")
+        RECONNECTED = colored("Reconnected to the server!\n", "green")
+        GAME_TIE = colored("Game finished. Result: Tie\n", "cyan")
+        GAME_WON = colored("Game finished. You won the game!\n", "cyan")
+        GAME_LOST = colored("Game finished. You lost the game!\n", "cyan")
+        NOT_YOUR_TURN = colored("It's not your turn to play!\n", "red")
+        INVALID_COORD = colored("Invalid coord! See /help for more help.\n", "red")
+        CELL_FILLED = colored("The cell is already filled. Try another one\n", "red")
+        INVALID_COMMAND = colored("Invalid command. See /help for more help\n", "red")
+
+
     PUT_COMMAND_REGEX = re.compile("^\/put \((\d+), (\d+)\)$")
     MSG_COMMAND_REGEX = re.compile("^\/msg (.+)$")
 
 
-    def __init__(self, webserver_socket):
-        self._socket = webserver_socket
+    def __init__(self, game_id, send, logger: Logger, computer: ComputerPlayer, report_moves=False, move_time=None):
+        self.game_id = game_id
+        self._send = send
+        self._computer = computer
+        # Tell the WebServer about every move, see ServerMoveMessage
+        self._report_moves = report_moves
+        # Histogram of the time valid moves take, see GameServerMetrics
+        self._move_time = move_time
 
-        self._status = self.ServerStatus.WAITING
+        self._status = self.Status.WAITING
         self._clients: List[Dict[str, str]] = []
         self._game: TicTacToeGame = None
-        self._logger: Logger = Logger()
+        self._logger: Logger = logger
 
-        self._logger.green("Game Server initialized successfully")
+        # (board state, colored board and turn) of the last board sent
+        self._board_message = None
+        self._players_and_turn_strings = {}
 
 
     def _get_game_board_and_turn_as_string(self):
-        result = self._game.get_board_as_string()
-        result += f"{self._clients[0]['username']}: {self._game.get_sign(1)} | "
+        return self._game.get_board_as_string() + self._get_players_and_turn_string()
+
+
+    def _get_players_and_turn_string(self):
+        # Players don't change during a game, so there is one string per turn
+        turn = self._game.get_turn()
+        if turn in self._players_and_turn_strings:
+            return self._players_and_turn_strings[turn]
+
+        result = f"{self._clients[0]['username']}: {self._game.get_sign(1)} | "
         result += f"{self._clients[1]['username'] if len(self._clients) == 2 else 'Computer'}: {self._game.get_sign(2)}\n"
-        if self._status == self.ServerStatus.PLAYING_SOLO:
+        if self._status == self.Status.PLAYING_SOLO:
             if self._game.get_turn() == 1:
                 result += f"Turn: {self._clients[0]['username']}"
             else:
@@ -55,13 +119,30 @@ class GameServer:
         else:
             result += f"Turn: {self._clients[self._game.get_turn()-1]['username']}"
         
-        return result + "\n"
+        self._players_and_turn_strings[turn] = result + "\n"
+        return self._players_and_turn_strings[turn]
+
+
+    def _get_board_message(self):
+        # Rendered once per board state and shared by every client it is sent to
+        state = (self._game.get_boards(), self._game.get_turn())
+        if self._board_message is None or self._board_message[0] != state:
+            self._board_message = (state, colored(self._get_game_board_and_turn_as_string(), "blue"))
+        return self._board_message[1]
+
+
+    def _send_to_clients(self, text):
+        # One message for every client of the game, fanned out by the WebServer
+        if len(self._clients) == 1:
+            self._send(ServerToClientMessage(self._clients[0]['address'], text))
+        else:
+            self._send(ServerToClientsMessage([c['address'] for c in self._clients], text))
 
 
     def _get_turn_client(self):
-        if self._status == self.ServerStatus.PLAYING_SOLO:
+        if self._status == self.Status.PLAYING_SOLO:
             return self._clients[0] if self._game.get_turn() == 1 else None
-        elif self._status == self.ServerStatus.PLAYING_DUAL:
+        elif self._status == self.Status.PLAYING_DUAL:
             return self._clients[self._game.get_turn()-1] 
         raise Exception("Invalid status")
 
@@ -74,59 +155,85 @@ class GameServer:
         return None
 
 
-    def _get_help_string(self):
-        result = self._game.get_help_board_as_string() 
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _get_help_message(size, win_length):
+        result = render_help_board(size)
         result += "Use the command \"/put (x, y)\" to put your sign on the board.\n"
+        if size != 3:
+            result += f"Put {win_length} signs in a row to win.\n"
         result += "Use the command \"/msg message\" to send your message\n"
 
-        return result
+        return colored(result, "yellow")
     
 
-    def _init_solo_game(self, message: ServerStartSoloPlayMessage):
+    def is_finished(self):
+        return self._game is None or self._game.is_finished()
+
+
+    def _new_game(self, message):
+        first_turn = message.first_turn if message.first_turn is not None else np.random.randint(1, 3)
+        if message.size is None:
+            game = TicTacToeGame(first_turn)
+        else:
+            game = TicTacToeGame(first_turn, message.size, message.win_length)
+
+        # A resumed game is brought back to where it was by playing its moves again
+        for x, y in message.moves or ():
+            game.put(x, y)
+        return game
+
+
+    def _report_move(self, x, y):
+        if self._report_moves:
+            self._send(ServerMoveMessage(self.game_id, x, y))
+
+
+    def _play_computer_move(self):
+        x_new, y_new = self._computer.play(self._game)
+        self._report_move(x_new, y_new)
+
+        self._logger.blue(f"Computer played {self._computer.difficulty} move /put ({x_new}, {y_new})")
+
+
+    def _get_start_text(self, message):
+        return self.Text.GAME_STARTED if message.moves is None else self.Text.GAME_RESUMED
+
+
+    def init_solo_game(self, message: ServerStartSoloPlayMessage):
         self._clients = [message.client]
-        self._status = self.ServerStatus.PLAYING_SOLO
-        self._game = TicTacToeGame(np.random.randint(1, 3))
+        self._status = self.Status.PLAYING_SOLO
+        self._game = self._new_game(message)
 
-        if self._game.get_turn() == 2:
-            x_new, y_new = self._game.random_play()
-            self._logger.cyan(f"Computer played random move /put ({x_new}, {y_new})")
+        # A resumed game may have stopped right before the computer's move or the end message
+        if not self._game.is_finished() and self._game.get_turn() == 2:
+            self._play_computer_move()
+        if self._check_end_of_game():
+            return
 
-        self._socket.sendall(ServerToClientMessage(
+        self._send(ServerToClientMessage(
             self._clients[0]['address'],   
-            colored("Game started. Enjoy!\n", "green") + colored(self._get_game_board_and_turn_as_string(), "blue")
-        ).serialize().encode())
+            self._get_start_text(message) + self._get_board_message()
+        ))
 
-        self._logger.green(f"A solo game started [{self._clients[0]['username']} vs Computer]")
+        self._logger.green(f"Game#{self.game_id}: A solo game started [{self._clients[0]['username']} vs Computer]")
     
 
-    def _init_dual_game(self, message: ServerStartDualPlayMessage):
+    def init_dual_game(self, message: ServerStartDualPlayMessage):
         self._clients = message.clients
-        self._status = self.ServerStatus.PLAYING_DUAL
-        self._game = TicTacToeGame(np.random.randint(1, 3))
-
-        message_to_clients = self._get_game_board_and_turn_as_string()
-        for client in self._clients:
-            self._socket.sendall(ServerToClientMessage(
-                client['address'],
-                colored("Game started. Enjoy!\n", "green") + colored(message_to_clients, "blue")
-            ).serialize().encode())
-        
-        self._logger.green(f"A dual game started [{self._clients[0]['username']} vs {self._clients[1]['username']}]")
+        self._status = self.Status.PLAYING_DUAL
+        self._game = self._new_game(message)
 
+        if self._check_end_of_game():
+            return
 
-    def _handle_incoming_message_in_waiting_status(self, message: Message):
-        if message.message_type == MessageType.SERVER_START_SOLO_PLAY:
-            self._init_solo_game(message)
-        elif message.message_type == MessageType.SERVER_START_DUAL_PLAY:
-            self._init_dual_game(message)
-        else:
-            self._logger.red("Invalid message type. It should be either ServerStartSoloPlayMessage or ServerStartDualPlayMessage.")
+        self._send_to_clients(self._get_start_text(message) + self._get_board_message())
+        
+        self._logger.green(f"Game#{self.game_id}: A dual game started [{self._clients[0]['username']} vs {self._clients[1]['username']}]")
     
 
     def _send_help_to_client(self, message: ClientToServerMessage):
-            self._socket.sendall(
-                ServerToClientMessage(message.client_address, colored(self._get_help_string(), "yellow")).serialize().encode()
-            )
+            self._send(ServerToClientMessage(message.client_address, self._get_help_message(self._game.size, self._game.win_length)))
 
             self._logger.cyan(f"\"{self._get_client_by_address(message.client_address)['username']}\" requested for help menu")
 
@@ -134,8 +241,7 @@ class GameServer:
     def _broadcast_message(self, message: ClientToServerMessage, message_content):
         username = self._get_client_by_address(message.client_address)['username']
         message_to_send = colored(f"{colored(username, attrs=['underline'])}: {message_content}", attrs=["bold"]) + "\n"
-        for c in self._clients:
-            self._socket.sendall(ServerToClientMessage(c['address'], message_to_send).serialize().encode())
+        self._send_to_clients(message_to_send)
         
         self._logger.cyan(f"Message from \"{username}\" sent to clients. Message content: {message_content}")
     
@@ -145,91 +251,75 @@ class GameServer:
             return False
 
         if self._game.is_draw():
-            self._logger.green("Game ended. Result: Tie")
+            self._logger.green(f"Game#{self.game_id}: Game ended. Result: Tie")
 
-            for client in self._clients:
-                self._socket.sendall(ServerToClientMessage(client['address'], colored("Game finished. Result: Tie\n", "cyan")).serialize().encode())
+            self._send_to_clients(self.Text.GAME_TIE)
 
-            self._socket.sendall(ServerEndGameMessage(is_tie=True, winner_address=None).serialize().encode())
+            self._send(ServerEndGameMessage(is_tie=True, winner_address=None, game_id=self.game_id))
         else:
-            if self._status == self.ServerStatus.PLAYING_SOLO:
+            if self._status == self.Status.PLAYING_SOLO:
                 winner_name = self._clients[0]['username'] if self._game.get_winner() == 1 else "Computer"
-                self._logger.green(f"Game ended. Winner: {winner_name}")
+                self._logger.green(f"Game#{self.game_id}: Game ended. Winner: {winner_name}")
 
-                lost_or_won = "won" if self._game.get_winner() == 1 else "lost"
+                result_text = self.Text.GAME_WON if self._game.get_winner() == 1 else self.Text.GAME_LOST
 
-                self._socket.sendall(
-                    ServerToClientMessage(self._clients[0]['address'], colored(f"Game finished. You {lost_or_won} the game!\n", "cyan")).serialize().encode()
-                )
+                self._send(ServerToClientMessage(self._clients[0]['address'], result_text))
 
-                self._socket.sendall(ServerEndGameMessage(
+                self._send(ServerEndGameMessage(
                     is_tie=False,
-                    winner_address=self._clients[0]['address'] if self._game.get_winner() == 1 else None
-                ).serialize().encode())
+                    winner_address=self._clients[0]['address'] if self._game.get_winner() == 1 else None,
+                    game_id=self.game_id
+                ))
             else:
                 winner_client = self._clients[self._game.get_winner()-1]
                 
-                self._logger.green(f"Game ended. Winner: {winner_client['username']}")
+                self._logger.green(f"Game#{self.game_id}: Game ended. Winner: {winner_client['username']}")
 
                 for client in self._clients:
                     if client == winner_client:
-                        self._socket.sendall(ServerToClientMessage(client['address'], colored("Game finished. You won the game!\n", "cyan")).serialize().encode())
+                        self._send(ServerToClientMessage(client['address'], self.Text.GAME_WON))
                     else:
-                        self._socket.sendall(ServerToClientMessage(client['address'], colored("Game finished. You lost the game!\n", "cyan")).serialize().encode())
+                        self._send(ServerToClientMessage(client['address'], self.Text.GAME_LOST))
 
-                self._socket.sendall(ServerEndGameMessage(is_tie=False, winner_address=winner_client['address']).serialize().encode())
+                self._send(ServerEndGameMessage(is_tie=False, winner_address=winner_client['address'], game_id=self.game_id))
 
         self._logger.yellow("Server ended the connection with clients")
         
         return True
     
 
-    def _reset_configuration(self):
-        self._status = self.ServerStatus.WAITING
-        self._clients = []
-        self._game = None
-
-        self._logger.magenta("Server configurations reseted to default values")
-
-
     def _send_clients_board_and_turn(self):
-        message_to_clients = self._get_game_board_and_turn_as_string()
-        for client in self._clients:
-            webserver_socket.sendall(
-                ServerToClientMessage(client['address'], colored(message_to_clients, "blue")).serialize().encode()
-            )
+        self._send_to_clients(self._get_board_message())
 
 
     def _handle_game_message(self, message: ClientToServerMessage, x:int, y:int):
         username = self._get_client_by_address(message.client_address)['username']
 
         if message.client_address != self._get_turn_client()['address']:
-            self._socket.sendall(
-                ServerToClientMessage(message.client_address, colored("It's not your turn to play!\n", "red")).serialize().encode()
-            )
+            self._send(ServerToClientMessage(message.client_address, self.Text.NOT_YOUR_TURN))
 
             self._logger.yellow(f"\"{username}\" used /put command but it wasn't his turn")
         else:
             if not self._game.is_coord_valid(x, y):
-                self._socket.sendall(ServerToClientMessage(message.client_address, colored("Invalid coord! See /help for more help.\n", "red")).serialize().encode())
+                self._send(ServerToClientMessage(message.client_address, self.Text.INVALID_COORD))
 
                 self._logger.yellow(f"\"{username}\" used /put command with invalid coord ({x}, {y})")
             elif not self._game.is_coord_cell_empty(x, y):
-                self._socket.sendall(ServerToClientMessage(message.client_address, colored("The cell is already filled. Try another one\n", "red")).serialize().encode())
+                self._send(ServerToClientMessage(message.client_address, self.Text.CELL_FILLED))
 
                 self._logger.yellow(f"\"{username}\" used /put command with invalid coord ({x}, {y}) [cell was already filled]")
             else:
+                started_at = time.perf_counter()
                 self._game.put(x, y)
+                self._report_move(x, y)
 
                 self._logger.cyan(f"\"{username}\" used /put command with coord ({x}, {y})")
                 
                 is_finished = self._check_end_of_game()
 
                 if not is_finished:
-                    if self._status == self.ServerStatus.PLAYING_SOLO:
-                        x_new, y_new = self._game.random_play()
-                        
-                        self._logger.blue(f"Computer played random move /put ({x_new}, {y_new})")
+                    if self._status == self.Status.PLAYING_SOLO:
+                        self._play_computer_move()
 
                         is_finished = self._check_end_of_game()
 
@@ -239,11 +329,12 @@ class GameServer:
                     else:
                         self._send_clients_board_and_turn()
                         self._logger.magenta("Board and turn sent to clients")
-                else:
-                    self._reset_configuration()
+
+                if self._move_time is not None:
+                    self._move_time.observe(time.perf_counter() - started_at)
     
 
-    def _update_client(self, client):
+    def update_client(self, client):
         for idx, c in enumerate(self._clients):
             if c['username'] == client['username']:
                 self._clients[idx] = client
@@ -254,56 +345,239 @@ class GameServer:
         self._logger.red(f"Invalid client update. No client with username \"{client['username']}\"")
 
 
-    def serve(self):
-        while True:
-            message: Message = Message.deserialize(SocketReader(self._socket).read_json())
-
-            if self._status == self.ServerStatus.WAITING:
-                self._handle_incoming_message_in_waiting_status(message)
-            elif message.message_type == MessageType.SERVER_FORCE_TERMINATE:
-                self._logger.red("Server terminated from web server")
-                self._reset_configuration()
-            elif message.message_type == MessageType.SERVER_UPDATE_CLIENT:
-                self._update_client(message.client)
-                self._socket.sendall(ServerToClientMessage(
-                    message.client['address'],   
-                    colored("Reconnected to the server!\n", "green") + colored(self._get_game_board_and_turn_as_string(), "blue")
-                ).serialize().encode())
-            else:
-                if message.message_type != MessageType.CLIENT_TO_SERVER_MESSAGE:
-                    logger.red("Invalid message type. It should be of type ClientToServerMessage")
-                    continue
-                
-                message: ClientToServerMessage = message
+    def send_reconnected_board(self, client):
+        self._send(ServerToClientMessage(
+            client['address'],   
+            self.Text.RECONNECTED + self._get_board_message()
+        ))
+
+
+    def handle_client_message(self, message: ClientToServerMessage):
+        m_msg = re.match(self.MSG_COMMAND_REGEX, message.message)
+        m_put = re.match(self.PUT_COMMAND_REGEX, message.message)
+
+        if message.message == "/help":
+            self._send_help_to_client(message)
+        elif m_msg:
+            self._broadcast_message(message, m_msg.group(1))
+        elif m_put:
+            self._handle_game_message(message, int(m_put.group(1)), int(m_put.group(2)))
+        else:
+            self._send(ServerToClientMessage(
+                message.client_address, self.Text.INVALID_COMMAND
+            ))
+
+            self._logger.yellow(f"Invalid command from \"{self._get_client_by_address(message.client_address)['username']}\"")
+
+
+class GameServer:
+    # Seconds between attempts to reach the WebServer, doubled after every failure
+    RECONNECT_DELAY = 1
+    MAX_RECONNECT_DELAY = 30
+    HANDSHAKE_TIMEOUT = 10
+
+    def __init__(self, webserver_socket, reader: SocketReader = None, framing=Framing.JSON, difficulty=Difficulty.RANDOM, relay=False, multicast=False, resumable=False, metrics: GameServerMetrics = None):
+        self._socket = webserver_socket
+        self._metrics = metrics if metrics is not None else GameServerMetrics(MetricsRegistry())
+        self._reader = reader if reader is not None else SocketReader(webserver_socket, self._metrics.received_bytes)
+        self._framing = framing
+        # Send ServerToClientMessages as relay frames the WebServer forwards without parsing
+        self._relay = relay
+        # Send ServerToClientsMessages as they are instead of one message per client
+        self._multicast = multicast
+        # Report every move with a ServerMoveMessage
+        self._resumable = resumable
+        # Frames queued while a message is handled, written together by _flush
+        self._outbox: List[bytes] = []
+        # Shared by every solo game. A perfect player solves the game tree here, once.
+        self._computer = ComputerPlayer(difficulty)
+
+        # Sessions are keyed by the game id the WebServer assigned. A WebServer that
+        # doesn't send game ids runs one game at a time under the key None.
+        self._sessions: Dict[int, GameSession] = {}
+        self._logger: Logger = Logger()
+
+        self._logger.green(f"Game Server initialized successfully [computer difficulty: {difficulty}, JSON backend: {get_json_backend()}]")
+
+
+    def _send(self, message: Message):
+        if message.message_type == MessageType.SERVER_TO_CLIENTS_MESSAGE and not self._multicast:
+            for m in message.expand():
+                self._send(m)
+        elif self._relay and message.message_type in {MessageType.SERVER_TO_CLIENT_MESSAGE, MessageType.SERVER_TO_CLIENTS_MESSAGE}:
+            self._outbox.append(message.encode_relay())
+        else:
+            self._outbox.append(message.encode(self._framing))
 
-                m_msg = re.match(self.MSG_COMMAND_REGEX, message.message)
-                m_put = re.match(self.PUT_COMMAND_REGEX, message.message)
 
-                if message.message == "/help":
-                    self._send_help_to_client(message)
-                elif m_msg:
-                    self._broadcast_message(message, m_msg.group(1))
-                elif m_put:
-                    self._handle_game_message(message, int(m_put.group(1)), int(m_put.group(2)))
-                else:
-                    webserver_socket.sendall(ServerToClientMessage(
-                        message.client_address, colored("Invalid command. See /help for more help\n", "red")).serialize().encode()
-                    )
+    def _flush(self):
+        # Everything a message produced, like the results and the ServerEndGameMessage, in one write
+        if self._outbox:
+            data = b"".join(self._outbox)
+            self._socket.sendall(data)
+            self._outbox.clear()
+            self._metrics.sent_bytes.inc(len(data))
 
-                    self._logger.yellow(f"Invalid command from \"{self._get_client_by_address(message.client_address)['username']}\"")
 
+    def _start_session(self, message: Message):
+        if message.game_id in self._sessions:
+            self._logger.red(f"Game#{message.game_id} is already running on this server")
+            return
+
+        session = GameSession(message.game_id, self._send, self._logger, self._computer, self._resumable, self._metrics.move_time)
+        self._metrics.games_started.inc()
+        if message.message_type == MessageType.SERVER_START_SOLO_PLAY:
+            session.init_solo_game(message)
+        else:
+            session.init_dual_game(message)
+
+        # A resumed game can be over as soon as its moves are played again
+        if session.is_finished():
+            self._logger.magenta(f"Game#{message.game_id} ended as soon as it was resumed")
+            return
+        self._sessions[message.game_id] = session
+        self._metrics.games.set(len(self._sessions))
+
+
+    def _end_session(self, game_id):
+        del self._sessions[game_id]
+        self._metrics.games.set(len(self._sessions))
+
+        self._logger.magenta(f"Game#{game_id} removed. Games running: {len(self._sessions)}")
+
+
+    def _handle_message(self, message: Message):
+        self._metrics.count_message(message.message_type)
+        if message.message_type == MessageType.SERVER_HEARTBEAT:
+            # Answered after everything the WebServer sent before it, so the round trip
+            # includes the time this server takes to catch up
+            self._send(ServerHeartbeatResponse(message.sequence))
+            return
+
+        if message.message_type in {MessageType.SERVER_START_SOLO_PLAY, MessageType.SERVER_START_DUAL_PLAY}:
+            self._start_session(message)
+            return
+
+        if message.message_type not in {
+            MessageType.SERVER_FORCE_TERMINATE,
+            MessageType.SERVER_UPDATE_CLIENT,
+            MessageType.CLIENT_TO_SERVER_MESSAGE
+        }:
+            self._logger.red("Invalid message type. It should be a game start, ClientToServerMessage, ServerUpdateClientMessage or ServerForceTerminateMessage")
+            return
+
+        session = self._sessions.get(message.game_id)
+        if session is None:
+            self._logger.red(f"No running game with id {message.game_id}")
+            return
+
+        if message.message_type == MessageType.SERVER_FORCE_TERMINATE:
+            self._logger.red(f"Game#{message.game_id} terminated from web server")
+            self._end_session(message.game_id)
+        elif message.message_type == MessageType.SERVER_UPDATE_CLIENT:
+            session.update_client(message.client)
+            session.send_reconnected_board(message.client)
+        else:
+            session.handle_client_message(message)
+            if session.is_finished():
+                self._end_session(message.game_id)
 
 
+    def serve(self):
+        # Returns when the connection to the WebServer is lost. The games are lost with it,
+        # the WebServer cancels them on its side.
+        try:
+            while True:
+                self._handle_message(self._reader.read_message(self._framing))
+                self._flush()
+        except socket.timeout:
+            reason = f"no word from it in {self._socket.gettimeout()} seconds"
+        except OSError as e:
+            reason = str(e)
+        except Exception as e:
+            # A frame or message that can't be handled leaves the stream out of step, so the
+            # connection is dropped and made again like a lost one
+            reason = f"{type(e).__name__}: {e}"
+
+        self._socket.close()
+        self._logger.red(f"Connection to the WebServer lost ({reason}). Games dropped: {len(self._sessions)}")
+        self._sessions.clear()
+        self._metrics.games.set(0)
+        self._outbox.clear()
+
+
+def connect_to_webserver(host, port, framing, capacity, worker_id, received_bytes=None):
+    webserver_socket = socket.create_connection((host, port), timeout=GameServer.HANDSHAKE_TIMEOUT)
+    if framing == Framing.JSON:
+        # The init message old WebServers know, they take no other fields
+        init_message = ServerInitMessage()
+    else:
+        init_message = ServerInitMessage(
+            framing=framing,
+            capacity=capacity,
+            relay=True,
+            multicast=True,
+            worker_id=worker_id,
+            heartbeat=True,
+            resumable=True
+        )
+    webserver_socket.sendall(init_message.encode())
+    reader = SocketReader(webserver_socket, received_bytes)
+    if framing == Framing.JSON:
+        # Without the new fields the WebServer greets with a line of text
+        init_response = ServerInitResponse(Framing.JSON, reader.read_line())
+    else:
+        init_response: ServerInitResponse = reader.read_message()
+    print(init_response.message, end='')
+
+    # The WebServer sends a heartbeat every few seconds, hearing nothing for longer than its
+    # timeout means the connection is dead even if TCP didn't notice
+    webserver_socket.settimeout(init_response.heartbeat_timeout)
+    return webserver_socket, reader, init_response
+
 
 if __name__ == '__main__':
     load_dotenv()
     
     host = os.getenv("HOST")
     port = int(os.getenv("PORT"))
-
-    webserver_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    webserver_socket.connect((host, port))
-    webserver_socket.sendall(ServerInitMessage().serialize().encode())
-    print(webserver_socket.recv(1024).decode(), end='')
-
-    GameServer(webserver_socket).serve()
+    framing = Framing.BINARY if os.getenv("FRAMING", "binary") == "binary" else Framing.JSON
+    capacity = int(os.getenv("GAME_SERVER_CAPACITY", "64"))
+    difficulty = os.getenv("COMPUTER_DIFFICULTY", Difficulty.RANDOM)
+    use_json_backend(os.getenv("JSON_BACKEND"))
+    worker_id = int(os.getenv("POOL_WORKER_ID")) if os.getenv("POOL_WORKER_ID") else None
+
+    metrics = GameServerMetrics(MetricsRegistry())
+    # Served at http://METRICS_HOST:GAME_SERVER_METRICS_PORT/metrics, pool workers add their id
+    # to the port so they don't collide
+    if os.getenv("GAME_SERVER_METRICS_PORT"):
+        metrics_port = int(os.getenv("GAME_SERVER_METRICS_PORT")) + (worker_id or 0)
+        MetricsServer(metrics.registry, os.getenv("METRICS_HOST", "127.0.0.1"), metrics_port).start()
+
+    logger = Logger()
+    reconnect_delay = GameServer.RECONNECT_DELAY
+    while True:
+        try:
+            webserver_socket, reader, init_response = connect_to_webserver(host, port, framing, capacity, worker_id, metrics.received_bytes)
+        except OSError as e:
+            logger.red(f"Couldn't connect to the WebServer at {host}:{port}: {e}. Retrying in {reconnect_delay} seconds")
+            time.sleep(reconnect_delay)
+            reconnect_delay = min(reconnect_delay * 2, GameServer.MAX_RECONNECT_DELAY)
+            continue
+        reconnect_delay = GameServer.RECONNECT_DELAY
+
+        GameServer(
+            webserver_socket,
+            reader,
+            init_response.framing,
+            difficulty,
+            relay=init_response.relay is True,
+            multicast=init_response.multicast is True,
+            resumable=init_response.resumable is True,
+            metrics=metrics
+        ).serve()
+
+        # The server pool starts new workers when it needs them
+        if worker_id is not None:
+            break
+        logger.yellow("Reconnecting to the WebServer")
@@ -0,0 +1,266 @@
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from logger import Logger
+from metrics import Samples, format_percentile
+
+
+class PoolMetrics:
+    SAMPLES = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        self.spawned = 0
+        self.registered = 0
+        self.retired = 0
+        self.failed = 0
+
+        # Seconds from starting a worker process to its ServerInitMessage, for the latest workers
+        self.spawn_latencies = Samples(self.SAMPLES)
+        # Seconds from /solo or /dual to a game slot on a server, for the latest clients
+        self.queue_waits = Samples(self.SAMPLES)
+
+    def spawn(self):
+        with self._lock:
+            self.spawned += 1
+
+    def register(self, latency):
+        with self._lock:
+            self.registered += 1
+            self.spawn_latencies.append(latency)
+
+    def retire(self):
+        with self._lock:
+            self.retired += 1
+
+    def fail(self):
+        with self._lock:
+            self.failed += 1
+
+    def record_queue_wait(self, wait):
+        with self._lock:
+            self.queue_waits.append(wait)
+
+    def get_stats(self, pool_size, starting, max_pool_size):
+        with self._lock:
+            spawn_latencies = self.spawn_latencies.get_sorted()
+            queue_waits = self.queue_waits.get_sorted()
+
+        return [
+            f"Pool size : {pool_size} / {max_pool_size}",
+            f"Starting : {starting}",
+            f"Spawned : {self.spawned}",
+            f"Retired : {self.retired}",
+            f"Failed : {self.failed}",
+        ], [
+            f"Spawn latency p50 : {format_percentile(spawn_latencies, 0.5, digits=0)}",
+            f"Spawn latency p99 : {format_percentile(spawn_latencies, 0.99, digits=0)}",
+        ], [
+            f"Queue wait p50 : {format_percentile(queue_waits, 0.5, digits=0)}",
+            f"Queue wait p99 : {format_percentile(queue_waits, 0.99, digits=0)}",
+            f"Queue wait max : {format_percentile(queue_waits, 1, digits=0)}",
+        ]
+
+
+class Worker:
+    ID = 1
+
+    def __init__(self):
+        self.ID = Worker.ID
+        Worker.ID += 1
+
+        self.process: subprocess.Popen = None
+        self.spawned_at = time.perf_counter()
+        # The server the process connected as, None until its ServerInitMessage arrives
+        self.server = None
+        # Since when the server hasn't hosted any game
+        self.idle_since = None
+
+    def __repr__(self):
+        return f"Worker#{self.ID}"
+
+
+class ServerPool:
+    # Starts game server processes on this machine when clients wait for a free slot, and stops
+    # the ones that stay without games. Servers started by hand are left alone. Everything but
+    # starting and stopping processes runs through the WebServer's state guard.
+
+    WORKER_COMMAND = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")]
+    CHECK_INTERVAL = 0.5
+    # How long the longest waiting client waits before workers are started, so games that are
+    # about to end can take a short burst instead
+    SPAWN_WAIT_THRESHOLD = 0.5
+    # Workers that haven't connected by then are stopped
+    SPAWN_TIMEOUT = 30
+    STOP_TIMEOUT = 5
+
+    def __init__(self, web_server, host, port, min_size=0, max_size=8, capacity=64, idle_timeout=60):
+        self._web_server = web_server
+        self._host = host
+        self._port = port
+
+        self.min_size = min_size
+        self.max_size = max_size
+        # Games each worker hosts, also used to tell how many workers a queue needs
+        self.capacity = capacity
+        self.idle_timeout = idle_timeout
+
+        self._workers = {}
+        self.metrics: PoolMetrics = web_server.pool_metrics
+        self._logger: Logger = Logger()
+
+    def __len__(self):
+        return len(self._workers)
+
+    def start(self):
+        self._logger.green(f"Server pool started. Size: {self.min_size} to {self.max_size} servers of {self.capacity} games")
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def register(self, server, worker_id):
+        # Called from WebServer._init_new_server for every server that connects
+        worker: Worker = self._workers.get(worker_id)
+        if worker is None or worker.server is not None:
+            return
+
+        worker.server = server
+        worker.idle_since = time.perf_counter()
+        self.metrics.register(worker.idle_since - worker.spawned_at)
+
+        self._logger.green(f"{worker} connected as {server} in {(worker.idle_since - worker.spawned_at) * 1000:.0f}ms")
+
+    def get_starting_count(self):
+        return sum(1 for worker in self._workers.values() if worker.server is None)
+
+    def _get_queue_demand(self, now):
+        # Returns the number of games the waiting clients need and how long the longest waiting
+        # of them has waited
+        solo_queue = self._web_server.waiting_clients_for_solo_play
+        dual_queues = [queue for queue in self._web_server.waiting_clients_for_dual_play.values() if queue]
+        # Games that lost their server wait for one too
+        detached_games = self._web_server.detached_games
+
+        games = len(solo_queue) + sum((len(queue) + 1) // 2 for queue in dual_queues) + len(detached_games)
+        waits = [now - queue.peek().waiting_since for queue in [solo_queue] + dual_queues if queue]
+        if detached_games:
+            waits.append(now - detached_games.peek().detached_since)
+        longest_wait = max(waits, default=0)
+        return games, longest_wait
+
+    def _reap_workers(self, now):
+        # Returns the workers to stop
+        to_stop = []
+        for worker in list(self._workers.values()):
+            if worker.process is None:
+                continue
+
+            if worker.process.poll() is not None:
+                del self._workers[worker.ID]
+                if worker.server is None:
+                    self.metrics.fail()
+                    self._logger.red(f"{worker} exited with code {worker.process.returncode} before connecting")
+                else:
+                    self._logger.red(f"{worker} running {worker.server} exited with code {worker.process.returncode}")
+            elif worker.server is not None and worker.server.retired:
+                # The WebServer ejected its server, the process may be stuck
+                del self._workers[worker.ID]
+                to_stop.append(worker)
+                self._logger.red(f"{worker} running the ejected {worker.server} will be stopped")
+            elif worker.server is None and now - worker.spawned_at > self.SPAWN_TIMEOUT:
+                del self._workers[worker.ID]
+                self.metrics.fail()
+                to_stop.append(worker)
+                self._logger.red(f"{worker} didn't connect in {self.SPAWN_TIMEOUT} seconds and will be stopped")
+        return to_stop
+
+    def _retire_idle_workers(self, now):
+        to_stop = []
+        for worker in list(self._workers.values()):
+            if worker.server is None:
+                continue
+            if worker.server.games:
+                worker.idle_since = None
+                continue
+            if worker.idle_since is None:
+                worker.idle_since = now
+
+            if now - worker.idle_since >= self.idle_timeout and len(self._workers) > self.min_size:
+                del self._workers[worker.ID]
+                self._web_server._retire_server(worker.server)
+                self.metrics.retire()
+                to_stop.append(worker)
+                self._logger.magenta(f"{worker} was idle for {self.idle_timeout} seconds and will be stopped")
+        return to_stop
+
+    def _add_workers_for_queues(self, now):
+        games, longest_wait = self._get_queue_demand(now)
+        starting_games = self.get_starting_count() * self.capacity
+
+        count = self.min_size - len(self._workers)
+        if games > starting_games and longest_wait >= self.SPAWN_WAIT_THRESHOLD:
+            count = max(count, math.ceil((games - starting_games) / self.capacity))
+        count = min(count, self.max_size - len(self._workers))
+
+        workers = [Worker() for _ in range(count)]
+        for worker in workers:
+            self._workers[worker.ID] = worker
+
+        if workers:
+            self._logger.cyan(f"Starting {len(workers)} servers for {games} waiting games. Longest wait: {longest_wait:.1f} seconds")
+        return workers
+
+    def _check(self):
+        now = time.perf_counter()
+
+        to_stop = self._reap_workers(now)
+        # Idle servers are kept while clients wait for a variant they might not support
+        if self._get_queue_demand(now)[0] == 0:
+            to_stop += self._retire_idle_workers(now)
+        return self._add_workers_for_queues(now), to_stop
+
+    def _spawn(self, worker: Worker):
+        env = dict(
+            os.environ,
+            HOST=self._host,
+            PORT=str(self._port),
+            GAME_SERVER_CAPACITY=str(self.capacity),
+            POOL_WORKER_ID=str(worker.ID),
+            # Workers only talk to this WebServer, the full handshake carries their id
+            FRAMING="binary"
+        )
+
+        worker.spawned_at = time.perf_counter()
+        try:
+            worker.process = subprocess.Popen(
+                self.WORKER_COMMAND, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+        except OSError as e:
+            self._web_server._run_exclusive(self._workers.pop, worker.ID, None)
+            self.metrics.fail()
+            self._logger.red(f"{worker} couldn't be started: {e}")
+            return
+
+        self.metrics.spawn()
+
+    def _stop(self, worker: Worker):
+        worker.process.terminate()
+        try:
+            worker.process.wait(self.STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            worker.process.kill()
+            worker.process.wait()
+
+    def _run(self):
+        while True:
+            time.sleep(self.CHECK_INTERVAL)
+
+            # Processes are started and stopped outside the guard, it can take milliseconds
+            to_spawn, to_stop = self._web_server._run_exclusive(self._check)
+            for worker in to_spawn:
+                self._spawn(worker)
+            for worker in to_stop:
+                self._stop(worker)
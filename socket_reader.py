@@ -1,28 +1,187 @@
+import asyncio
+import re
 import socket
+import time
+from messages import Framing, Message
 
 
 class SocketReader:
-    def __init__(self, socket: socket.socket):
+    CHUNK_SIZE = 64 * 1024
+
+    BRACES_REGEX = re.compile(rb'[{}"]')
+    # The rest of a JSON string after its opening quote, up to the closing one
+    STRING_END_REGEX = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+    def __init__(self, socket: socket.socket, received_bytes=None):
         self._socket = socket
-    
+        # A metrics counter for every byte read, see metrics.Value
+        self._received_bytes = received_bytes
+
+        # Received bytes live in self._buffer; everything before self._start was already consumed.
+        self._buffer = bytearray()
+        self._start = 0
+
+        # Brace counting state of the frame at the head of the buffer. It is kept between
+        # calls so bytes that were already scanned are never scanned again, a string that
+        # isn't complete yet aside.
+        self._scan_pos = 0
+        self._depth = 0
+
+        # A time.perf_counter() by which every read must be done, however slowly the bytes
+        # trickle in. A socket timeout alone only bounds each recv.
+        self.deadline = None
+
+    def _fill(self):
+        if self.deadline is not None:
+            remaining = self.deadline - time.perf_counter()
+            if remaining <= 0:
+                raise socket.timeout("Deadline passed")
+            self._socket.settimeout(remaining)
+
+        chunk = self._socket.recv(self.CHUNK_SIZE)
+        if not chunk:
+            raise ConnectionError("Socket closed by the peer")
+
+        self._append(chunk)
+
+    def _append(self, chunk):
+        if self._received_bytes is not None:
+            self._received_bytes.inc(len(chunk))
+        if self._start != 0:
+            del self._buffer[:self._start]
+            self._scan_pos -= self._start
+            self._start = 0
+        self._buffer += chunk
+
+    def _buffered_size(self):
+        return len(self._buffer) - self._start
+
+    def _take(self, n):
+        end = self._start + n
+        frame = bytes(self._buffer[self._start:end])
+        self._start = end
+        self._scan_pos = end
+        self._depth = 0
+        return frame
+
+    def _find_json_end(self):
+        position = self._scan_pos
+        while True:
+            match = self.BRACES_REGEX.search(self._buffer, position)
+            if match is None:
+                self._scan_pos = len(self._buffer)
+                return -1
+
+            position = match.end()
+            if match.group() == b'"':
+                # Braces in strings, like in a username or a /msg, don't count
+                string_end = self.STRING_END_REGEX.match(self._buffer, position)
+                if string_end is None:
+                    self._scan_pos = match.start()
+                    return -1
+                position = string_end.end()
+                continue
+
+            self._depth += 1 if match.group() == b"{" else -1
+            if self._depth == 0:
+                return position
+
+    def _take_json(self):
+        if self._buffered_size() == 0:
+            return None
+
+        if self._buffer[self._start] != ord("{"):
+            raise Exception(f"First char in buff is not open bracket (it's {chr(self._buffer[self._start])}). Incompatible with JSON convension.")
+
+        end = self._find_json_end()
+        if end == -1:
+            return None
+        return self._take(end - self._start)
+
     def read_json(self):
-        res = self._socket.recv(1).decode()
-        
-        if res != "{":
-            raise Exception(f"First char in buff is not open bracket (it's {res}). Incompatible with JSON convension.")
-        
-        cnt = 1
-
-        while cnt != 0:
-            ch = self._socket.recv(1).decode()
-            res += ch
-
-            if ch == "{":
-                cnt += 1
-            elif ch == "}":
-                cnt -= 1
-            
-            if cnt == 0:
-                break
-        
-        return res
+        frame = self._take_json()
+        while frame is None:
+            self._fill()
+            frame = self._take_json()
+
+        return frame
+
+    def read_exactly(self, n):
+        while self._buffered_size() < n:
+            self._fill()
+
+        return self._take(n)
+
+    def read_frame(self):
+        version, message_type, length = Framing.HEADER.unpack(self.read_exactly(Framing.HEADER.size))
+
+        if version != Framing.VERSION:
+            raise Exception(f"Unsupported frame version {version}. Expected version {Framing.VERSION}.")
+
+        return message_type, self.read_exactly(length)
+
+    def read_message(self, framing=Framing.JSON):
+        if framing == Framing.JSON:
+            return Message.deserialize(self.read_json())
+
+        return Message.decode_frame(*self.read_frame())
+
+    def read_line(self):
+        end = self._buffer.find(b"\n", self._start)
+        while end == -1:
+            searched = self._buffered_size()
+            self._fill()
+            end = self._buffer.find(b"\n", self._start + searched)
+
+        return self._take(end + 1 - self._start).decode()
+
+    def read_available(self, max_size=CHUNK_SIZE):
+        if self._buffered_size() != 0:
+            return self._take(min(max_size, self._buffered_size()))
+        return self._socket.recv(max_size)
+
+
+class AsyncSocketReader(SocketReader):
+    def __init__(self, stream: asyncio.StreamReader, received_bytes=None):
+        super().__init__(None, received_bytes)
+        self._stream = stream
+
+    async def _fill_async(self):
+        chunk = await self._stream.read(self.CHUNK_SIZE)
+        if not chunk:
+            raise ConnectionError("Socket closed by the peer")
+
+        self._append(chunk)
+
+    async def read_json(self):
+        frame = self._take_json()
+        while frame is None:
+            await self._fill_async()
+            frame = self._take_json()
+
+        return frame
+
+    async def read_exactly(self, n):
+        while self._buffered_size() < n:
+            await self._fill_async()
+
+        return self._take(n)
+
+    async def read_frame(self):
+        version, message_type, length = Framing.HEADER.unpack(await self.read_exactly(Framing.HEADER.size))
+
+        if version != Framing.VERSION:
+            raise Exception(f"Unsupported frame version {version}. Expected version {Framing.VERSION}.")
+
+        return message_type, await self.read_exactly(length)
+
+    async def read_message(self, framing=Framing.JSON):
+        if framing == Framing.JSON:
+            return Message.deserialize(await self.read_json())
+
+        return Message.decode_frame(*await self.read_frame())
+
+    async def read_available(self, max_size=SocketReader.CHUNK_SIZE):
+        if self._buffered_size() != 0:
+            return self._take(min(max_size, self._buffered_size()))
+        return await self._stream.read(max_size)
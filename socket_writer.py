@@ -0,0 +1,200 @@
+import socket
+import threading
+from collections import deque
+
+
+class WriteMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        # Frames and bytes waiting in the queues of all connections
+        self.queued_frames = 0
+        self.queued_bytes = 0
+        # Deepest any single connection's queue has been
+        self.max_queue_depth = 0
+
+        self.writes = 0
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.frames_dropped = 0
+        # Connections closed because they didn't read fast enough
+        self.slow_consumers = 0
+
+    def queue(self, size, depth):
+        with self._lock:
+            self.queued_frames += 1
+            self.queued_bytes += size
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def write(self, frames, size, writes):
+        with self._lock:
+            self.queued_frames -= frames
+            self.queued_bytes -= size
+            self.writes += writes
+            self.frames_written += frames
+            self.bytes_written += size
+
+    def drop(self, frames, size):
+        # Frames that were queued and won't be written
+        with self._lock:
+            self.queued_frames -= frames
+            self.queued_bytes -= size
+            self.frames_dropped += frames
+
+    def reject(self):
+        # A frame sent to a connection that is closing
+        with self._lock:
+            self.frames_dropped += 1
+
+    def slow_consumer(self):
+        with self._lock:
+            self.slow_consumers += 1
+
+    def get_stats(self):
+        with self._lock:
+            writes = max(self.writes, 1)
+            return [
+                f"Queued frames : {self.queued_frames}",
+                f"Queued bytes : {self.queued_bytes}",
+                f"Max queue depth : {self.max_queue_depth}",
+            ], [
+                f"Writes : {self.writes}",
+                f"Frames written : {self.frames_written}",
+                f"Bytes written : {self.bytes_written}",
+                f"Frames per write : {self.frames_written / writes:.2f}",
+                f"Bytes per write : {self.bytes_written / writes:.0f}",
+            ], [
+                f"Frames dropped : {self.frames_dropped}",
+                f"Slow consumers closed : {self.slow_consumers}",
+            ]
+
+
+class SocketWriter:
+    # The part of the socket interface WebServer writes through. Frames from any thread are
+    # queued and written by one writer thread per connection, so they never interleave, and
+    # frames that pile up during a write go out together in the next sendmsg call.
+
+    # Stays below IOV_MAX, the most buffers one sendmsg call takes
+    MAX_FRAMES_PER_WRITE = 512
+
+    def __init__(self, socket_obj: socket.socket, metrics: WriteMetrics, max_queued_bytes):
+        self._socket = socket_obj
+        self._metrics = metrics
+        self._max_queued_bytes = max_queued_bytes
+
+        self._condition = threading.Condition()
+        self._frames = deque()
+        self._queued_bytes = 0
+        # Size of the frames the writer took from the queue and is writing
+        self._writing_bytes = 0
+        self._closing = False
+
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    def send(self, data):
+        self.sendall(data)
+        return len(data)
+
+    def sendall(self, data):
+        with self._condition:
+            if self._closing:
+                self._metrics.reject()
+                return
+
+            if self._queued_bytes + self._writing_bytes + len(data) > self._max_queued_bytes:
+                self._metrics.reject()
+                self._drop_slow_consumer()
+                return
+
+            self._frames.append(data)
+            self._queued_bytes += len(data)
+            self._metrics.queue(len(data), len(self._frames))
+            # The writer only waits while the queue is empty
+            if len(self._frames) == 1:
+                self._condition.notify()
+
+    def close(self):
+        # Frames queued so far are still written before the socket is closed
+        with self._condition:
+            self._closing = True
+            self._condition.notify()
+
+    def abort(self):
+        # Closes the connection without writing what is queued, for peers that stopped reading
+        with self._condition:
+            self._abort()
+
+    def _drop_slow_consumer(self):
+        self._metrics.slow_consumer()
+        self._abort()
+
+    def _abort(self):
+        self._discard_queue()
+        self._closing = True
+        self._condition.notify()
+        # The writer may be blocked on the full socket buffer of the peer
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _discard_queue(self):
+        self._metrics.drop(len(self._frames), self._queued_bytes)
+        self._frames.clear()
+        self._queued_bytes = 0
+
+    def _take_frames(self):
+        with self._condition:
+            while not self._frames and not self._closing:
+                self._condition.wait()
+
+            frames = [self._frames.popleft() for _ in range(min(len(self._frames), self.MAX_FRAMES_PER_WRITE))]
+            self._writing_bytes = sum(len(frame) for frame in frames)
+            self._queued_bytes -= self._writing_bytes
+            return frames
+
+    def _write_loop(self):
+        while True:
+            frames = self._take_frames()
+            if not frames:
+                break
+
+            size = self._writing_bytes
+            try:
+                writes = self._write_frames(frames)
+            except OSError:
+                with self._condition:
+                    self._metrics.drop(len(frames), size)
+                    self._writing_bytes = 0
+                    self._discard_queue()
+                    self._closing = True
+                break
+
+            with self._condition:
+                self._writing_bytes = 0
+            self._metrics.write(len(frames), size, writes)
+
+        # Also wakes up the thread reading from the socket, which handles it as a lost connection
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+
+    def _write_frames(self, frames):
+        # Returns the number of send calls it took. A call may write only part of the frames;
+        # the rest is sent from where it stopped.
+        views = deque(memoryview(frame) for frame in frames)
+        writes = 0
+        while views:
+            if hasattr(self._socket, "sendmsg"):
+                sent = self._socket.sendmsg(views)
+            else:
+                sent = self._socket.send(b"".join(views))
+            writes += 1
+
+            while views and sent >= len(views[0]):
+                sent -= len(views.popleft())
+            if sent:
+                views[0] = views[0][sent:]
+        return writes
@@ -0,0 +1,58 @@
+import threading
+import time
+
+from metrics import Samples, format_percentile
+
+
+class GuardMetrics:
+    SAMPLES = 4096
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        # Seconds each call waited for the state and then held it, for the latest calls
+        self.wait_times = Samples(self.SAMPLES)
+        self.hold_times = Samples(self.SAMPLES)
+        self.max_hold_time = 0
+
+    def record(self, wait_time, hold_time):
+        with self._lock:
+            self.calls += 1
+            self.wait_times.append(wait_time)
+            self.hold_times.append(hold_time)
+            self.max_hold_time = max(self.max_hold_time, hold_time)
+
+    def get_stats(self):
+        with self._lock:
+            wait_times = self.wait_times.get_sorted()
+            hold_times = self.hold_times.get_sorted()
+
+        return [
+            f"Calls : {self.calls}",
+        ], [
+            f"Hold time p50 : {format_percentile(hold_times, 0.5, 'us', 0)}",
+            f"Hold time p99 : {format_percentile(hold_times, 0.99, 'us', 0)}",
+            f"Hold time max : {self.max_hold_time * 1e6:.0f}us",
+        ], [
+            f"Wait time p50 : {format_percentile(wait_times, 0.5, 'us', 0)}",
+            f"Wait time p99 : {format_percentile(wait_times, 0.99, 'us', 0)}",
+        ]
+
+
+class StateLock:
+    # Runs calls one at a time. State that is only touched from calls made through it needs
+    # no other lock. The calls must not block, so they write to sockets through SocketWriters.
+    def __init__(self):
+        self.metrics = GuardMetrics()
+
+        self._lock = threading.RLock()
+
+    def call(self, function, *args):
+        waiting_since = time.perf_counter()
+        with self._lock:
+            acquired_at = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                self.metrics.record(acquired_at - waiting_since, time.perf_counter() - acquired_at)
@@ -0,0 +1,170 @@
+import atexit
+import sqlite3
+import threading
+import time
+import traceback
+
+from logger import Logger
+from metrics import Samples, format_percentile
+
+
+class StoreMetrics:
+    SAMPLES = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        self.updates = 0
+        self.commits = 0
+        self.rows_written = 0
+        self.failed_commits = 0
+        # Seconds each commit took, fsync included, for the latest commits
+        self.commit_times = Samples(self.SAMPLES)
+
+    def update(self):
+        with self._lock:
+            self.updates += 1
+
+    def commit(self, rows, commit_time):
+        with self._lock:
+            self.commits += 1
+            self.rows_written += rows
+            self.commit_times.append(commit_time)
+
+    def fail(self):
+        with self._lock:
+            self.failed_commits += 1
+
+    def get_stats(self, players, pending):
+        with self._lock:
+            commit_times = self.commit_times.get_sorted()
+            commits = max(self.commits, 1)
+
+        return [
+            f"Players : {players}",
+            f"Pending rows : {pending}",
+        ], [
+            f"Score updates : {self.updates}",
+            f"Commits : {self.commits}",
+            f"Rows written : {self.rows_written}",
+            f"Rows per commit : {self.rows_written / commits:.2f}",
+            f"Failed commits : {self.failed_commits}",
+        ], [
+            f"Commit time p50 : {format_percentile(commit_times, 0.5)}",
+            f"Commit time p99 : {format_percentile(commit_times, 0.99)}",
+        ]
+
+
+class StatsStore:
+    # Keeps every player's wins, ties and losses in an SQLite file. Updates are handed to a
+    # writer thread and committed together, at most FLUSH_INTERVAL seconds after they came in,
+    # so ending a game never waits on the disk. Rows hold totals rather than increments: only
+    # the latest score of each player is written, and a crash loses at most the last interval.
+
+    FLUSH_INTERVAL = 1
+    # A batch this large is committed without waiting for the interval to pass
+    MAX_BATCH_SIZE = 4096
+
+    def __init__(self, path):
+        self.path = path
+        self.metrics: StoreMetrics = StoreMetrics()
+        self._logger: Logger = Logger()
+
+        # Opened here to load the scores, used only by the writer thread afterwards
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS players (
+                username TEXT PRIMARY KEY,
+                wins INTEGER NOT NULL,
+                ties INTEGER NOT NULL,
+                losses INTEGER NOT NULL
+            )
+        """)
+        self._connection.commit()
+
+        self._condition = threading.Condition()
+        # Latest score of each player since the last commit
+        self._pending = {}
+        self._pending_since = None
+        self._closed = False
+
+        self._writer = threading.Thread(target=self._run, daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def load(self):
+        # Returns (username, wins, ties, losses) for every stored player
+        return self._connection.execute("SELECT username, wins, ties, losses FROM players").fetchall()
+
+    def get_pending_count(self):
+        with self._condition:
+            return len(self._pending)
+
+    def record(self, username, wins, ties, losses):
+        with self._condition:
+            if self._closed:
+                return
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending[username] = (wins, ties, losses)
+            if len(self._pending) >= self.MAX_BATCH_SIZE:
+                self._condition.notify()
+        self.metrics.update()
+
+    def close(self):
+        # Commits what is still pending and stops the writer
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._writer.join()
+        self._connection.close()
+
+    def _next_batch(self):
+        with self._condition:
+            while True:
+                if self._closed or len(self._pending) >= self.MAX_BATCH_SIZE:
+                    break
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+
+                delay = self._pending_since + self.FLUSH_INTERVAL - time.monotonic()
+                if delay <= 0:
+                    break
+                self._condition.wait(delay)
+
+            batch, self._pending = self._pending, {}
+            return batch, self._closed
+
+    def _commit(self, batch):
+        started_at = time.perf_counter()
+        try:
+            with self._connection:
+                self._connection.executemany("""
+                    INSERT INTO players (username, wins, ties, losses) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (username) DO UPDATE SET wins = excluded.wins, ties = excluded.ties, losses = excluded.losses
+                """, [(username, *score) for username, score in batch.items()])
+        except sqlite3.Error:
+            self.metrics.fail()
+            self._logger.red(f"Couldn't write {len(batch)} player scores to {self.path}. They will be retried")
+            traceback.print_exc()
+            # Scores recorded in the meantime are newer than the ones that failed
+            with self._condition:
+                if not self._pending:
+                    self._pending_since = time.monotonic()
+                for username, score in batch.items():
+                    self._pending.setdefault(username, score)
+            return
+        self.metrics.commit(len(batch), time.perf_counter() - started_at)
+
+    def _run(self):
+        while True:
+            batch, closed = self._next_batch()
+            if batch:
+                self._commit(batch)
+            if closed:
+                return
@@ -0,0 +1,85 @@
+import heapq
+import threading
+import time
+import traceback
+
+
+class Timer:
+    __slots__ = ("deadline", "function", "args", "cancelled", "_service")
+
+    def __init__(self, service, deadline, function, args):
+        self._service = service
+        self.deadline = deadline
+        self.function = function
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self._service.cancel(self)
+
+
+class TimerService:
+    # Runs functions after a delay, all from one thread. Timers are kept in a heap ordered by
+    # deadline; cancelled timers stay in it until they reach the top or the heap is compacted.
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._heap = []
+        self._sequence = 0
+        self._cancelled = 0
+
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._heap) - self._cancelled
+
+    def schedule(self, delay, function, *args):
+        with self._condition:
+            timer = Timer(self, time.monotonic() + delay, function, args)
+            # The sequence number keeps timers with the same deadline in scheduling order
+            heapq.heappush(self._heap, (timer.deadline, self._sequence, timer))
+            self._sequence += 1
+            if self._heap[0][2] is timer:
+                self._condition.notify()
+            return timer
+
+    def cancel(self, timer: Timer):
+        with self._condition:
+            if timer.cancelled:
+                return
+            timer.cancelled = True
+            self._cancelled += 1
+
+            if self._cancelled > 64 and self._cancelled > len(self._heap) // 2:
+                self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def _next_due_timer(self):
+        with self._condition:
+            while True:
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+                    self._cancelled -= 1
+
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                delay = self._heap[0][0] - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+
+                timer = heapq.heappop(self._heap)[2]
+                # A due timer can't be cancelled anymore
+                timer.cancelled = True
+                return timer
+
+    def _run(self):
+        while True:
+            timer = self._next_due_timer()
+            try:
+                timer.function(*timer.args)
+            except Exception:
+                traceback.print_exc()
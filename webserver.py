@@ -1,27 +1,50 @@
 from typing import Dict, List
+from collections import defaultdict
 from dotenv import load_dotenv
 import os
+import random
 import time
 import socket
 import threading
 from termcolor import colored
+from event_log import Event, EventLog
+from game import MAX_BOARD_SIZE
+from indexed_queue import IndexedQueue, StatusIndex
+from leaderboard import Leaderboard
 from logger import Logger
+from metrics import WAIT_BUCKETS, MetricsRegistry, MetricsServer, Samples, format_percentile
+
+from server_pool import PoolMetrics, ServerPool
+from stats_store import StatsStore
 
 from messages import (
+    ClientHeartbeatResponse,
     ClientInitMessage,
     ClientInitResponse,
     ClientMessage,
     ClientToServerMessage,
+    Framing,
     Message, 
     MessageType,
     ServerEndGameMessage,
     ServerForceTerminateMessage,
+    ServerHeartbeatMessage,
+    ServerHeartbeatResponse,
     ServerInitMessage,
+    ServerInitResponse,
+    ServerMoveMessage,
     ServerStartDualPlayMessage,
     ServerStartSoloPlayMessage,
+    ServerToClientMessage,
+    ServerToClientsMessage,
     ServerUpdateClientMessage,
+    get_json_backend,
+    use_json_backend,
 )
 from socket_reader import SocketReader
+from socket_writer import SocketWriter, WriteMetrics
+from state_guard import StateLock
+from timer_service import Timer, TimerService
 
 from rich.console import Console
 from rich.table import Table
@@ -32,14 +55,71 @@ class GameType:
     DUAL = 1
 
 
+# A game variant is a (board size, win length) pair
+CLASSIC_VARIANT = (3, 3)
+
+
 class SocketContainer:
-    def __init__(self, socket_obj, address):
+    # Weight of the newest heartbeat in the smoothed round-trip time, as in TCP's SRTT
+    RTT_SMOOTHING = 1 / 8
+
+    def __init__(self, socket_obj, address, reader: SocketReader = None):
         self.socket: socket.socket = socket_obj
+        self.reader: SocketReader = reader if reader is not None else SocketReader(socket_obj)
         self.address = address
+        self.framing = Framing.JSON
+
+        # Peers that don't answer heartbeats are only noticed when their connection drops
+        self.heartbeat = False
+        self.heartbeat_interval: float = None
+        self.heartbeat_timeout: float = None
+        # Bumped when heartbeats are started or stopped, so a timer that was already firing
+        # doesn't keep the old ones going
+        self.heartbeat_generation = 0
+        self.heartbeat_timer: Timer = None
+        # When the heartbeat that hasn't been answered yet was sent
+        self.heartbeat_sent_at: float = None
+        # Smoothed round-trip time of the heartbeats in seconds, None until the first answer
+        self.rtt: float = None
     
     def __repr__(self):
         return self.address
 
+    def get_latency(self, now):
+        # An overdue heartbeat counts too, a peer that went quiet isn't fast
+        latency = self.rtt if self.rtt is not None else 0
+        if self.heartbeat_sent_at is not None:
+            latency = max(latency, now - self.heartbeat_sent_at)
+        return latency
+
+    def record_rtt(self, rtt):
+        if self.rtt is None:
+            self.rtt = rtt
+        else:
+            self.rtt += self.RTT_SMOOTHING * (rtt - self.rtt)
+
+    def send_message(self, message: Message):
+        self.socket.sendall(message.encode(self.framing))
+
+    def read_message(self):
+        return self.reader.read_message(self.framing)
+
+
+class OfflineSocket:
+    # Stands in for the socket of a player restored from the event log until it reconnects.
+    # What is sent to it is dropped, as it is for a client whose connection closed.
+    def send(self, data):
+        return len(data)
+
+    def sendall(self, data):
+        pass
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
 
 class Client(SocketContainer):
     class Status:
@@ -56,11 +136,18 @@ class Client(SocketContainer):
         TIMEOUT = 1
 
 
-    def __init__(self, client_socket, address, username):
-        super().__init__(client_socket, address)
-        self.server: Server = None
+    def __init__(self, client_socket, address, username, reader: SocketReader = None, status_index: StatusIndex = None):
+        super().__init__(client_socket, address, reader)
+        self.game: Game = None
 
+        # Every status change is recorded in the index the WebServer looks clients up in
+        self._status_index = status_index
+        self._status = None
         self.status: Client.Status = self.Status.IN_MENU
+        # The variant picked in the menu for the next game
+        self.variant = CLASSIC_VARIANT
+        # When the client last asked for a game, until it gets a slot on a server
+        self.waiting_since: float = None
 
         self.username = username
 
@@ -69,9 +156,24 @@ class Client(SocketContainer):
         self.losses: int = 0
 
         self.online_status = self.OnlineStatus.ONLINE
+        # Removes the client if it doesn't reconnect in time after a timeout
+        self.reconnect_deadline: Timer = None
     
     def __repr__(self):
         return self.username
+
+    def send_heartbeat(self):
+        self.socket.send(ClientHeartbeatResponse.REQUEST)
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, status):
+        if self._status_index is not None:
+            self._status_index.set(self, status)
+        self._status = status
     
     def get_dict_for_server(self):
         return {
@@ -83,34 +185,305 @@ class Client(SocketContainer):
 class Server(SocketContainer):
     ID = 1
 
-    def __init__(self, server_socket, address):
-        super().__init__(server_socket, address)
-        self.clients: List[Client] = []
+    def __init__(self, server_socket, address, reader: SocketReader = None, capacity=None):
+        super().__init__(server_socket, address, reader)
+        self.games: Dict[int, Game] = {}
         self.ID = Server.ID
         Server.ID += 1
 
+        # Servers that don't advertise a capacity host one game and don't understand game ids
+        self.supports_sessions = capacity is not None
+        self.capacity = capacity if capacity is not None else 1
+
+        self.relay = False
+        self.multicast = False
+        # Reports moves, so its games can be resumed on another server
+        self.resumable = False
+        # Set when the server is stopped by the server pool or ejected, its connection is
+        # expected to close
+        self.retired = False
+
+        self.heartbeat_sequence = 0
+
     def __repr__(self):
         return f"Server#{self.ID}" #super().__repr__() + " - Clients: " + str(self.clients)
 
+    def has_free_slot(self):
+        return len(self.games) < self.capacity
+
+    def get_load(self):
+        return len(self.games) / self.capacity
+
+    def send_heartbeat(self):
+        self.heartbeat_sequence += 1
+        self.send_message(ServerHeartbeatMessage(self.heartbeat_sequence))
+
+    def supports_variant(self, variant):
+        # Servers without sessions predate the variants and only know the classic game
+        return self.supports_sessions or variant == CLASSIC_VARIANT
+
+    def get_game(self, game_id):
+        if not self.supports_sessions:
+            return next(iter(self.games.values()), None)
+        return self.games.get(game_id)
+
+
+class Game:
+    ID = 1
+
+    def __init__(self, server: Server, variant=CLASSIC_VARIANT, game_id=None):
+        # None while the game waits for a server to be resumed on
+        self.server = server
+        self.variant = variant
+        self.clients: List[Client] = []
+        if game_id is None:
+            self.ID = Game.ID
+            Game.ID += 1
+        else:
+            self.ID = game_id
+            Game.ID = max(Game.ID, game_id + 1)
+
+        # Set when the game starts
+        self.game_type: GameType = None
+        # Player number that moved first and the [x, y] of every move, for games on resumable
+        # servers. None for the others, they can't be resumed.
+        self.first_turn: int = None
+        self.moves: List[List[int]] = None
+        # When the game lost its server
+        self.detached_since: float = None
+
+    def __repr__(self):
+        return f"Game#{self.ID}@{self.server}"
+
+    def get_wire_id(self):
+        return self.ID if self.server.supports_sessions else None
+
+    def get_variant_fields(self):
+        if self.variant == CLASSIC_VARIANT:
+            return {}
+        size, win_length = self.variant
+        return {"size": size, "win_length": win_length}
+
+
+class AcceptMetrics:
+    LATENCY_SAMPLES = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        self.accepted = 0
+        self.handshaking = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.failed = 0
+
+        # Seconds from accept() to a decoded init message, for the latest handshakes
+        self.latencies = Samples(self.LATENCY_SAMPLES)
+
+    def try_start_handshake(self, max_pending):
+        with self._lock:
+            self.accepted += 1
+            if self.handshaking >= max_pending:
+                self.rejected += 1
+                return False
+            self.handshaking += 1
+            return True
+
+    def finish_handshake(self, accepted_at):
+        with self._lock:
+            self.handshaking -= 1
+            self.completed += 1
+            self.latencies.append(time.perf_counter() - accepted_at)
+
+    def timeout_handshake(self):
+        with self._lock:
+            self.handshaking -= 1
+            self.timed_out += 1
+
+    def fail_handshake(self):
+        with self._lock:
+            self.handshaking -= 1
+            self.failed += 1
+
+    def get_stats(self):
+        with self._lock:
+            latencies = self.latencies.get_sorted()
+
+        return [
+            f"Accepted : {self.accepted}",
+            f"Handshaking : {self.handshaking}",
+            f"Completed : {self.completed}",
+            f"Rejected : {self.rejected}",
+            f"Timed out : {self.timed_out}",
+            f"Failed : {self.failed}",
+        ], [
+            f"Accept latency p50 : {format_percentile(latencies, 0.5)}",
+            f"Accept latency p99 : {format_percentile(latencies, 0.99)}",
+        ]
+
+
+class HeartbeatMetrics:
+    SAMPLES = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        self.sent = 0
+        self.answered = 0
+        # Peers that left a heartbeat unanswered until the timeout
+        self.dead = 0
+        # Round-trip times in seconds, for the latest answers
+        self.rtts = Samples(self.SAMPLES)
+
+    def send(self):
+        with self._lock:
+            self.sent += 1
+
+    def answer(self, rtt):
+        with self._lock:
+            self.answered += 1
+            self.rtts.append(rtt)
+
+    def dead_peer(self):
+        with self._lock:
+            self.dead += 1
+
+    def get_stats(self, peers):
+        with self._lock:
+            rtts = self.rtts.get_sorted()
+
+        return [
+            f"{peers} heartbeats sent : {self.sent}",
+            f"{peers} heartbeats answered : {self.answered}",
+            f"Dead {peers.lower()} links : {self.dead}",
+            f"{peers} RTT p50 : {format_percentile(rtts, 0.5)}",
+            f"{peers} RTT p99 : {format_percentile(rtts, 0.99)}",
+            f"{peers} RTT max : {format_percentile(rtts, 1)}",
+        ]
+
+
+class WebServerMetrics:
+    # What the WebServer records on its hot paths, on the registry the metrics endpoint serves.
+    # The gauges and the copies of the other *Metrics objects are set when it is scraped.
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+
+        self.received_bytes = registry.counter("webserver_received_bytes_total", "Bytes read from clients and game servers").labels()
+        self._client_messages = registry.counter("webserver_client_messages_total", "Messages read from clients, by type", ("type",))
+        self._client_message_counts = {}
+        # One observation per game server message, its count is the rate of each type
+        self._relay_time = registry.histogram(
+            "webserver_relay_seconds", "Seconds from reading a game server message to queueing it for its clients, by type", ("type",)
+        )
+        self._relay_times = {}
+        self.matchmaking_wait = registry.histogram(
+            "webserver_matchmaking_wait_seconds", "Seconds from /solo or /dual to a game slot on a server", buckets=WAIT_BUCKETS
+        ).labels()
+
+        connections = registry.counter("webserver_connections_total", "Clients and game servers that joined, reconnecting clients included", ("peer",))
+        disconnections = registry.counter("webserver_disconnections_total", "Clients and game servers that lost their connection or left", ("peer",))
+        self.client_connections = connections.labels("client")
+        self.server_connections = connections.labels("server")
+        self.client_disconnections = disconnections.labels("client")
+        self.server_disconnections = disconnections.labels("server")
+
+        self.clients = registry.gauge("webserver_clients", "Clients by status, those who may still reconnect included", ("status",))
+        self.queue_depth = registry.gauge("webserver_queue_depth", "Clients waiting for a game slot and games waiting for a server", ("queue",))
+        self.game_servers = registry.gauge("webserver_game_servers", "Game servers in service").labels()
+        self.games = registry.gauge("webserver_games", "Games on the game servers, those waiting for an opponent included").labels()
+
+        self.handshakes = registry.counter("webserver_handshakes_total", "Accepted connections by how their handshake ended", ("result",))
+        self.pending_handshakes = registry.gauge("webserver_pending_handshakes", "Connections that haven't sent their init message yet").labels()
+        self.sent_bytes = registry.counter("webserver_sent_bytes_total", "Bytes written to clients and game servers").labels()
+        self.writes = registry.counter("webserver_writes_total", "Socket writes, each of one or more queued frames").labels()
+        self.queued_write_bytes = registry.gauge("webserver_queued_write_bytes", "Bytes queued for connections and not written yet").labels()
+        self.dropped_frames = registry.counter("webserver_dropped_frames_total", "Frames for connections that were closing or too slow").labels()
+        self.slow_consumers = registry.counter("webserver_slow_consumers_total", "Connections closed because they didn't read fast enough").labels()
+        self.heartbeats = registry.counter("webserver_heartbeats_total", "Heartbeats sent and answered, by peer", ("peer", "result"))
+        self.dead_links = registry.counter("webserver_dead_links_total", "Peers that left a heartbeat unanswered until the timeout", ("peer",))
+        self.guard_calls = registry.counter("webserver_state_guard_calls_total", "Calls that held the matchmaking state").labels()
+        self.pool_workers = registry.counter("webserver_pool_workers_total", "Server pool workers by what happened to them", ("event",))
+        self.score_updates = registry.counter("webserver_score_updates_total", "Player scores handed to the stats store")
+        self.pending_scores = registry.gauge("webserver_pending_scores", "Player scores waiting for the stats store to commit them")
+        self.logged_events = registry.counter("webserver_logged_events_total", "Events appended to the event log")
+        self.pending_events = registry.gauge("webserver_pending_events", "Events waiting for the event log to commit them")
+
+    def count_client_message(self, message_type):
+        count = self._client_message_counts.get(message_type)
+        if count is None:
+            count = self._client_message_counts[message_type] = self._client_messages.labels(MessageType.get_name(message_type))
+        count.inc()
+
+    def record_server_message(self, message_type, read_at):
+        relay_time = self._relay_times.get(message_type)
+        if relay_time is None:
+            relay_time = self._relay_times[message_type] = self._relay_time.labels(MessageType.get_name(message_type))
+        relay_time.observe(time.perf_counter() - read_at)
+
 
 class WebServer:
-    TERMINATE_TIMEOUT_DURATION = 60
+    # Fixed texts sent to clients, colored and encoded once
+    class Text:
+        MENU = colored("\n".join([line.strip() for line in f"""
+        ┏━ Menu ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
+        ┣━━━  /solo : Play with computer                  ┃
+        ┣━━━  /dual : Play with opponent                  ┃
+        ┣━━━  /solo N K or /dual N K : NxN board with     ┃
+        ┃           K in a row to win (K <= N <= {MAX_BOARD_SIZE})      ┃
+        ┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛
+        """.split("\n") if line.strip() != ""]), "yellow").encode() + b"\n"
+        CONNECTED = (colored("Successfully connected to the WebServer.", "green") + "\n").encode()
+        INVALID_INPUT = colored("Invalid input\n", "red").encode()
+        PLEASE_WAIT = colored("You will be assigned to a server ASAP. Please wait... (/exchange to change the playing mode)\n", "cyan").encode()
+        ASSIGNED = (colored("You have been assigned to a server. Enjoy!", "green") + "\n").encode()
+        ASSIGNED_WAITING_FOR_OPPONENT = colored("You have been assigned to a server. Waiting for opponent...\n", "cyan").encode()
+        OPPONENT_FOUND = colored("Opponent has been found. Your game starts now!\n", "cyan").encode()
+        ASSIGNED_AND_OPPONENT_FOUND = ASSIGNED_WAITING_FOR_OPPONENT + OPPONENT_FOUND
+        OPPONENT_LEFT = colored("Your opponent left the game.\n", "cyan").encode()
+        BUSY = colored("Server is busy. Try again later.\n", "red").encode()
+        SERVER_LOST = colored("Your game server stopped responding. The game was cancelled.\n", "red").encode()
+        GAME_DETACHED = colored("Your game server stopped responding. Your game continues on another server ASAP. Please wait...\n", "cyan").encode()
+        INVALID_INIT_MESSAGE = colored("Invalid initialization message type. It should be either \"ServerInitMessage\" or \"ClientInitMessage\".\n", "red").encode()
+
 
-    def __init__(self, host, port):
+    TERMINATE_TIMEOUT_DURATION = 60
+    HANDSHAKE_TIMEOUT_DURATION = 10
+    MAX_PENDING_HANDSHAKES = 256
+    # Connections that fall this far behind on reading are closed
+    MAX_QUEUED_WRITE_BYTES = 1 << 20
+    # Heartbeat interval and timeout in seconds. Clients that leave a heartbeat unanswered for
+    # the timeout are handled as disconnected, servers are ejected.
+    CLIENT_HEARTBEAT = (5, 15)
+    SERVER_HEARTBEAT = (1, 5)
+    # Players shown by /scoreboard
+    SCOREBOARD_SIZE = 20
+
+    def __init__(self, host, port, client_heartbeat=CLIENT_HEARTBEAT, server_heartbeat=SERVER_HEARTBEAT, stats_path=None, event_log_path=None):
         self._logger: Logger = Logger()
 
         self._logger.green("WebServer initialized successfully. See /help for list of command")
+        self._logger.green(f"JSON backend: {get_json_backend()}")
 
-        self.clients: List[Client] = []
+        self.clients: IndexedQueue = IndexedQueue()
+        # Clients by Client.Status, kept up to date by the status setter
+        self.client_statuses: StatusIndex = StatusIndex()
         self.address_to_clients_dict: Dict[str, Client] = {}
         self.username_to_clients_dict: Dict[str, Client] = {}
 
-        self.waiting_clients_for_solo_play: List[Client] = []
-        self.waiting_clients_for_dual_play: List[Client] = []
+        # Waiting clients are served first come, first served
+        self.waiting_clients_for_solo_play: IndexedQueue = IndexedQueue()
+        # Dual play queues and waiting games are kept per variant, so only clients who asked for
+        # the same board are matched together
+        self.waiting_clients_for_dual_play: Dict[tuple, IndexedQueue] = defaultdict(IndexedQueue)
 
         self.servers: List[Server] = []
-        self.waiting_server_for_dual_play: Server = None
-        self.free_servers: List[Server] = []
+        self.waiting_game_for_dual_play: Dict[tuple, Game] = {}
+        # Servers with at least one free game slot
+        self.free_servers: IndexedQueue = IndexedQueue()
+        # Games that lost their server or were restored from the event log, in the order they
+        # get a new one
+        self.detached_games: IndexedQueue = IndexedQueue()
 
         self._logger.green("Waiting Queues initialized successfully")
         
@@ -118,149 +491,610 @@ class WebServer:
         self._port = port
         self._init_socket()
 
-        self.lock: threading.Lock = threading.Lock()
+        # Clients, queues, servers and games are only changed through the guard, see _run_exclusive
+        self._state_guard = self._create_state_guard()
+        self._timers = self._create_timer_service()
+
+        self.accept_metrics: AcceptMetrics = AcceptMetrics()
+        self.write_metrics: WriteMetrics = WriteMetrics()
+        self.pool_metrics: PoolMetrics = PoolMetrics()
+        self.client_heartbeat_metrics: HeartbeatMetrics = HeartbeatMetrics()
+        self.server_heartbeat_metrics: HeartbeatMetrics = HeartbeatMetrics()
+        # Served over HTTP when __main__ starts a MetricsServer, see WebServerMetrics
+        self.metrics: WebServerMetrics = WebServerMetrics(MetricsRegistry())
+        self.metrics.registry.add_collector(self._collect_metrics)
+        self._client_heartbeat = client_heartbeat
+        self._server_heartbeat = server_heartbeat
+        # Started from __main__ when POOL_MAX_SERVERS is set
+        self.pool: ServerPool = None
+
+        # Scores of every player who finished a game, kept on disk when there is a stats store
+        self.stats_store: StatsStore = None
+        self.leaderboard: Leaderboard = Leaderboard()
+        if stats_path is not None:
+            self.stats_store = StatsStore(stats_path)
+            self.leaderboard = Leaderboard(self.stats_store.load())
+            self._logger.green(f"Scores of {len(self.leaderboard)} players loaded from {stats_path}")
+
+        # Every state change is logged when there is an event log, and the games that were in
+        # progress when the WebServer stopped are restored from it
+        self.event_log: EventLog = None
+        if event_log_path is not None:
+            self.event_log = EventLog(event_log_path)
+            self._restore_games()
     
 
+    def _create_state_guard(self):
+        return StateLock()
+
+
+    def _create_timer_service(self):
+        return TimerService()
+
+
+    def _run_exclusive(self, function, *args):
+        # Runs function(*args) as the only code touching the matchmaking state. It writes to
+        # sockets through their queues, so it never waits on a client or a server.
+        return self._state_guard.call(function, *args)
+
+
     def _init_socket(self):
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # A restarted WebServer takes the port back while the old connections linger in TIME_WAIT
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.socket.bind((self._host, self._port))
         self.socket.listen()
 
         self._logger.green("Socket initialized successfully")
+
+
+    def _log_event(self, event, *fields):
+        if self.event_log is not None and self.event_log.append(event, *fields):
+            self._take_snapshot()
+
+
+    def _get_resumable_games(self):
+        games = [game for server in self.servers for game in server.games.values()] + list(self.detached_games)
+        return [game for game in games if game.moves is not None and game.game_type is not None]
+
+
+    def _take_snapshot(self):
+        # Copied under the guard, encoded and written by the event log's writer thread
+        self.event_log.snapshot([
+            [game.ID, game.game_type, game.variant, [c.username for c in game.clients], game.first_turn, list(game.moves)]
+            for game in self._get_resumable_games()
+        ])
+
+
+    def _restore_client(self, username):
+        # The player gets the usual time to reconnect, counted from when connections are
+        # accepted again, see _watch_restored_clients
+        client = Client(OfflineSocket(), f"restored:{username}", username, None, self.client_statuses)
+        client.wins, client.ties, client.losses = self.leaderboard.get(username)
+        client.online_status = Client.OnlineStatus.TIMEOUT
+
+        self.clients.append(client)
+        self.address_to_clients_dict[client.address] = client
+        self.username_to_clients_dict[username] = client
+        return client
+
+
+    def _restore_games(self):
+        for game_id, (game_type, variant, usernames, first_turn, moves) in self.event_log.recovered.games.items():
+            game = Game(None, tuple(variant), game_id)
+            game.game_type = game_type
+            game.first_turn = first_turn
+            game.moves = moves
+            game.detached_since = time.perf_counter()
+            game.clients = [self._restore_client(username) for username in usernames]
+            for c in game.clients:
+                c.game = game
+                c.status = Client.Status.PLAYING_SOLO if game_type == GameType.SOLO else Client.Status.PLAYING_DUAL
+            self.detached_games.append(game)
+
+        # The log starts over from the restored state
+        self._take_snapshot()
+
+        if self.detached_games:
+            self._logger.yellow(f"{len(self.detached_games)} games of {len(self.clients)} players restored from the event log. They continue when the players reconnect and a server is free")
+
+
+    def _watch_restored_clients(self):
+        for client in self.clients:
+            if client.online_status == Client.OnlineStatus.TIMEOUT and client.reconnect_deadline is None:
+                self._watch_timed_out_client(client)
     
 
+    def _get_free_server(self, variant):
+        # The least loaded server, and of those the one that answers the fastest
+        now = time.perf_counter()
+        return min(
+            (server for server in self.free_servers if server.supports_variant(variant)),
+            key=lambda server: (server.get_load(), server.get_latency(now)),
+            default=None
+        )
+
+
+    def _open_game(self, server: Server, variant):
+        game = Game(server, variant)
+        server.games[game.ID] = game
+
+        if not server.has_free_slot() and server in self.free_servers:
+            self.free_servers.remove(server)
+
+        return game
+
+
+    def _close_game(self, game: Game):
+        if game.moves is not None and game.game_type is not None:
+            self._log_event(Event.END, game.ID)
+
+        for c in game.clients:
+            c.game = None
+        game.clients = []
+
+        if self.waiting_game_for_dual_play.get(game.variant) == game:
+            del self.waiting_game_for_dual_play[game.variant]
+
+        if game.server is None:
+            self.detached_games.remove(game)
+            return
+
+        del game.server.games[game.ID]
+
+        self._assign_available_server(game.server)
+
+
+    def _terminate_game(self, game: Game):
+        if game.server is not None:
+            game.server.send_message(ServerForceTerminateMessage(game_id=game.get_wire_id()))
+        self._close_game(game)
+
+
+    def _send_game_start(self, game: Game, resume=False):
+        fields = dict(game_id=game.get_wire_id(), **game.get_variant_fields())
+        if game.moves is not None:
+            fields["first_turn"] = game.first_turn
+            if resume:
+                fields["moves"] = game.moves
+
+        if game.game_type == GameType.SOLO:
+            game.server.send_message(ServerStartSoloPlayMessage(client=game.clients[0].get_dict_for_server(), **fields))
+        else:
+            game.server.send_message(ServerStartDualPlayMessage(clients=[c.get_dict_for_server() for c in game.clients], **fields))
+
+
+    def _start_game(self, game: Game, game_type: GameType):
+        game.game_type = game_type
+        if game.server.resumable:
+            # The WebServer picks who starts, so it knows everything needed to play the game
+            # again on another server
+            game.first_turn = random.randint(1, 2)
+            game.moves = []
+            self._log_event(Event.START, game.ID, game_type, game.variant, [c.username for c in game.clients], game.first_turn)
+
+        self._send_game_start(game)
+
+
+    def _detach_game(self, game: Game):
+        # The game waits for a resumable server with a free slot, its players stay in it
+        self._logger.yellow(f"{game} of clients {game.clients} lost its server and waits for another one")
+
+        del game.server.games[game.ID]
+        game.server = None
+        game.detached_since = time.perf_counter()
+        self.detached_games.append(game)
+
+        for c in game.clients:
+            if c.online_status == Client.OnlineStatus.ONLINE:
+                c.socket.send(self.Text.GAME_DETACHED)
+
+
+    def _place_detached_game(self, server: Server, game: Game):
+        self.detached_games.remove(game)
+        game.server = server
+        game.detached_since = None
+        server.games[game.ID] = game
+        if not server.has_free_slot() and server in self.free_servers:
+            self.free_servers.remove(server)
+
+        self._send_game_start(game, resume=True)
+
+        self._logger.green(f"{game} resumed after {len(game.moves)} moves. Clients: {game.clients}")
+
+
+    def _end_queue_wait(self, client: Client):
+        if client.waiting_since is not None:
+            wait = time.perf_counter() - client.waiting_since
+            self.pool_metrics.record_queue_wait(wait)
+            self.metrics.matchmaking_wait.observe(wait)
+            client.waiting_since = None
+
+
     def _init_solo_game(self, server: Server, client: Client):
-        client.server = server
-        server.clients = [client]
+        game = self._open_game(server, client.variant)
+        client.game = game
+        game.clients = [client]
+        self._end_queue_wait(client)
 
         client.status = client.Status.PLAYING_SOLO
 
-        client.socket.send((colored("You have been assigned to a server. Enjoy!", "green") + "\n").encode())
+        client.socket.send(self.Text.ASSIGNED)
 
-        server.socket.send(ServerStartSoloPlayMessage(client=client.get_dict_for_server()).serialize().encode())
+        self._start_game(game, GameType.SOLO)
 
         self._logger.cyan(f"Client \"{client.username}\" was assigned to server {server.address}")
-        self._logger.green(f"Solo game for client \"{client.username}\" initialized in server {server.address}")
+        self._logger.green(f"Solo game for client \"{client.username}\" initialized in {game} [{server.address}]")
     
 
     def _init_waiting_dual_game(self, server: Server, client: Client):
-        self.waiting_server_for_dual_play = server
+        game = self._open_game(server, client.variant)
+        self.waiting_game_for_dual_play[client.variant] = game
 
-        client.server = server
-        server.clients = [client]
+        client.game = game
+        game.clients = [client]
+        self._end_queue_wait(client)
 
-        client.status = client.Status.WAITING_FOR_DUAL
+        client.status = client.Status.WAITING_FOR_OPPONENT
 
-        client.socket.send(colored("You have been assigned to a server. Waiting for opponent...\n", "cyan").encode())
+        client.socket.send(self.Text.ASSIGNED_WAITING_FOR_OPPONENT)
 
         self._logger.cyan(f"Client \"{client.username}\" was assigned to server {server.address}")
-        self._logger.green(f"Client \"{client.username}\" is waiting in the server {server.address} for a dual game")
+        self._logger.green(f"Client \"{client.username}\" is waiting in {game} [{server.address}] for a dual game")
     
 
-    def _assign_server_to_two_players_for_dual_game(self, server: Server):
-        client1, client2 = [self.waiting_clients_for_dual_play.pop() for _ in range(2)]
+    def _assign_server_to_two_players_for_dual_game(self, server: Server, variant):
+        client1, client2 = [self.waiting_clients_for_dual_play[variant].popleft() for _ in range(2)]
 
-        server.clients = [client1, client2]
+        game = self._open_game(server, variant)
+        game.clients = [client1, client2]
 
-        for c in server.clients:
+        for c in game.clients:
             c.status = Client.Status.PLAYING_DUAL
-            c.server = server
-            c.socket.send(colored("You have been assigned to a server. Waiting for opponent...\n", "cyan").encode())
-            c.socket.send(colored("Opponent has been found. Your game starts now!\n").encode())
+            c.game = game
+            self._end_queue_wait(c)
+            c.socket.send(self.Text.ASSIGNED_AND_OPPONENT_FOUND)
         
-        server.socket.send(ServerStartDualPlayMessage(clients=[c.get_dict_for_server() for c in server.clients]).serialize().encode())
+        self._start_game(game, GameType.DUAL)
 
         self._logger.cyan(f"Clients \"{client1.username}\" and \"{client2.username}\" have been assigned to server {server.address}")
-        self._logger.green(f"A dual game between \"{server.clients[0].username}\" and \"{server.clients[1].username}\" initialized in server {server.address}")
+        self._logger.green(f"A dual game between \"{game.clients[0].username}\" and \"{game.clients[1].username}\" initialized in {game} [{server.address}]")
 
 
-    def _assign_available_server(self, server: Server):
-        self.lock.acquire()
+    def _pop_waiting_client_for_server(self, queue: IndexedQueue, server: Server):
+        for client in queue:
+            if server.supports_variant(client.variant):
+                queue.remove(client)
+                return client
+        return None
+
+
+    def _assign_waiting_clients_to_server(self, server: Server):
+        # Games that are already being played come before new ones
+        if server.resumable and self.detached_games:
+            self._place_detached_game(server, self.detached_games.peek())
+            return True
+
+        solo_client = self._pop_waiting_client_for_server(self.waiting_clients_for_solo_play, server)
+        if solo_client is not None:
+            self._init_solo_game(server=server, client=solo_client)
+            return True
 
-        if len(self.waiting_clients_for_solo_play) != 0:
-            self._init_solo_game(server=server, client=self.waiting_clients_for_solo_play.pop())
-        elif len(self.waiting_clients_for_dual_play) != 0:
-            if len(self.waiting_clients_for_dual_play) >= 2:
-                self._assign_server_to_two_players_for_dual_game(server)
+        for variant, queue in self.waiting_clients_for_dual_play.items():
+            if len(queue) == 0 or not server.supports_variant(variant):
+                continue
+            if variant in self.waiting_game_for_dual_play:
+                self._add_client_to_waiting_dual_game_server(queue.popleft())
+            elif len(queue) >= 2:
+                self._assign_server_to_two_players_for_dual_game(server, variant)
             else:
-                self._init_waiting_dual_game(server=server, client=self.waiting_clients_for_dual_play.pop())
-        else:
-            server.clients = []
-            self.free_servers.append(server)
+                self._init_waiting_dual_game(server=server, client=queue.popleft())
+            return True
 
-        self.lock.release()
+        return False
 
 
-    def _init_new_server(self, server_socket, address):
-        server_socket.send((colored("Successfully connected to the WebServer.", "green") + "\n").encode())
+    def _assign_available_server(self, server: Server):
+        if server.retired:
+            return
 
-        server = Server(server_socket, address)
+        while server.has_free_slot() and self._assign_waiting_clients_to_server(server):
+            pass
+
+        if server.has_free_slot() and server not in self.free_servers:
+            self.free_servers.append(server)
+
+
+    def _init_new_server(self, server_socket, address, reader: SocketReader, msg: ServerInitMessage):
+        server = Server(server_socket, address, reader, msg.capacity)
+        self.metrics.server_connections.inc()
+
+        greeting = colored("Successfully connected to the WebServer.", "green") + "\n"
+        if msg.framing is None:
+            server_socket.send(greeting.encode())
+        else:
+            server.framing = Framing.negotiate(msg.framing)
+            server.relay = msg.relay is True and server.framing == Framing.BINARY
+            server.multicast = msg.multicast is True
+            server.heartbeat = msg.heartbeat is True
+            server.resumable = msg.resumable is True and server.supports_sessions
+            server_socket.send(ServerInitResponse(
+                framing=server.framing,
+                message=greeting,
+                relay=True if server.relay else None,
+                multicast=True if server.multicast else None,
+                heartbeat_timeout=self._server_heartbeat[1] if server.heartbeat else None,
+                resumable=True if server.resumable else None
+            ).encode())
 
         self.servers.append(server)
 
-        self._logger.green(f"{server} [{server.address}] initialized successfully")
+        self._logger.green(f"{server} [{server.address}] initialized successfully. Capacity: {server.capacity} games")
+
+        if self.pool is not None:
+            self.pool.register(server, msg.worker_id)
+        if server.heartbeat:
+            self._start_heartbeats(server, *self._server_heartbeat)
 
         self._assign_available_server(server)
 
         return server
     
 
+    def _take_server_out_of_service(self, server: Server):
+        self.metrics.server_disconnections.inc()
+        server.retired = True
+        self._stop_heartbeats(server)
+        self.servers.remove(server)
+        self.free_servers.discard(server)
+
+
+    def _retire_server(self, server: Server):
+        # The server pool only retires servers without games
+        self._take_server_out_of_service(server)
+        server.socket.close()
+
+        self._logger.magenta(f"{server} [{server.address}] retired")
+
+
+    def _cancel_game_of_ejected_server(self, game: Game):
+        if game.moves is not None and game.game_type is not None:
+            self._detach_game(game)
+            return
+
+        clients = game.clients
+        self._terminate_game(game)
+        for c in clients:
+            if c.online_status == Client.OnlineStatus.ONLINE:
+                c.status = Client.Status.IN_MENU
+                c.socket.send(self.Text.SERVER_LOST + self.Text.MENU)
+            else:
+                self._remove_client(c)
+
+        self._logger.red(f"{game} cancelled. Clients {clients} were sent back to the menu")
+
+
+    def _eject_server(self, server: Server, reason):
+        if server.retired:
+            return
+
+        self._logger.red(f"{server} [{server.address}] {reason} and was ejected. Games cancelled or moved: {len(server.games)}")
+
+        self._take_server_out_of_service(server)
+        for game in list(server.games.values()):
+            self._cancel_game_of_ejected_server(game)
+        server.socket.close()
+
+        for free_server in list(self.free_servers):
+            self._assign_available_server(free_server)
+
+
+    def _get_heartbeat_metrics(self, peer: SocketContainer) -> HeartbeatMetrics:
+        return self.server_heartbeat_metrics if isinstance(peer, Server) else self.client_heartbeat_metrics
+
+
+    def _start_heartbeats(self, peer: SocketContainer, interval, timeout):
+        self._stop_heartbeats(peer)
+        peer.heartbeat_interval = interval
+        peer.heartbeat_timeout = timeout
+        self._schedule_heartbeat(peer)
+
+
+    def _stop_heartbeats(self, peer: SocketContainer):
+        peer.heartbeat_generation += 1
+        if peer.heartbeat_timer is not None:
+            peer.heartbeat_timer.cancel()
+            peer.heartbeat_timer = None
+        peer.heartbeat_sent_at = None
+
+
+    def _schedule_heartbeat(self, peer: SocketContainer):
+        peer.heartbeat_timer = self._timers.schedule(
+            peer.heartbeat_interval,
+            self._run_exclusive,
+            self._send_heartbeat,
+            peer,
+            peer.heartbeat_generation
+        )
+
+
+    def _send_heartbeat(self, peer: SocketContainer, generation):
+        if generation != peer.heartbeat_generation:
+            return
+
+        # One heartbeat is out at a time, the next is sent once it is answered
+        now = time.perf_counter()
+        if peer.heartbeat_sent_at is None:
+            peer.heartbeat_sent_at = now
+            peer.send_heartbeat()
+            self._get_heartbeat_metrics(peer).send()
+        elif now - peer.heartbeat_sent_at >= peer.heartbeat_timeout:
+            peer.heartbeat_timer = None
+            self._get_heartbeat_metrics(peer).dead_peer()
+            self._handle_dead_peer(peer)
+            return
+
+        self._schedule_heartbeat(peer)
+
+
+    def _handle_dead_peer(self, peer: SocketContainer):
+        if isinstance(peer, Server):
+            self._eject_server(peer, f"didn't answer a heartbeat in {peer.heartbeat_timeout} seconds")
+            return
+
+        self._logger.yellow(f"Client \"{peer.username}\" didn't answer a heartbeat in {peer.heartbeat_timeout} seconds. Its connection is closed")
+        self._stop_heartbeats(peer)
+        # Also when the client is gone without closing the connection, the thread reading from
+        # it sees the connection end and handles the client as disconnected
+        peer.socket.abort()
+
+
+    def _handle_heartbeat_response(self, peer: SocketContainer):
+        if peer.heartbeat_sent_at is None:
+            return
+
+        rtt = time.perf_counter() - peer.heartbeat_sent_at
+        peer.heartbeat_sent_at = None
+        peer.record_rtt(rtt)
+        self._get_heartbeat_metrics(peer).answer(rtt)
+
+
+    def _handle_server_heartbeat_response(self, server: Server, message: ServerHeartbeatResponse):
+        if message.sequence == server.heartbeat_sequence:
+            self._handle_heartbeat_response(server)
+
+
     def _handle_server_end_game(self, server: Server, message: ServerEndGameMessage):
-        self._logger.green(f"Game in the server {server.address} ended")
+        game = server.get_game(message.game_id)
+        if game is None:
+            self._logger.red(f"{server} ended an unknown game (id: {message.game_id})")
+            return
+
+        self._logger.green(f"{game} in the server {server.address} ended")
 
         if message.is_tie:
-            for c in server.clients:
+            for c in game.clients:
                 c.ties += 1
         elif message.winner_address is not None:
-            if len(server.clients) == 1:
-                server.clients[0].wins += 1
+            if len(game.clients) == 1:
+                game.clients[0].wins += 1
             else:
                 client_winner = self.address_to_clients_dict[message.winner_address]
-                client_loser = server.clients[0] if server.clients[0] != client_winner else server.clients[1]
+                client_loser = game.clients[0] if game.clients[0] != client_winner else game.clients[1]
                 client_winner.wins += 1
                 client_loser.losses += 1
         else:
-            server.clients[0].losses += 1
-        for c in server.clients:
-            c.server = None
+            game.clients[0].losses += 1
+        for c in game.clients:
+            self._record_score(c)
             c.status = Client.Status.IN_MENU
-            c.socket.send(self._get_client_menu().encode())
-        server.clients = []
-        self._assign_available_server(server)
+            c.socket.send(self.Text.MENU)
+        self._close_game(game)
 
 
-    def _handle_server(self, server: Server):
-        while True:
-            msg_obj: Message = Message.deserialize(SocketReader(server.socket).read_json())
-            if msg_obj.message_type == MessageType.SERVER_END_GAME:
-               self._handle_server_end_game(server, msg_obj)
-            elif msg_obj.message_type == MessageType.SERVER_TO_CLIENT_MESSAGE:
-                self.address_to_clients_dict[msg_obj.client_address].socket.send(msg_obj.message.encode())
-            else:
-                self._logger.red("Wrong message type. It should be of type ServerToClientMessage or ServerEndGameMessage")
+    def _handle_server_move(self, server: Server, message: ServerMoveMessage):
+        game = server.get_game(message.game_id)
+        if game is None or game.moves is None:
+            return
+
+        game.moves.append([message.x, message.y])
+        self._log_event(Event.PUT, game.ID, message.x, message.y)
+
+
+    def _record_score(self, client: Client):
+        self.leaderboard.update(client.username, client.wins, client.ties, client.losses)
+        if self.stats_store is not None:
+            self.stats_store.record(client.username, client.wins, client.ties, client.losses)
+
+
+    def _send_to_address(self, address, data):
+        # Called without the guard by the thread reading from a game server. A client that
+        # left in the meantime doesn't get the message.
+        client = self.address_to_clients_dict.get(address)
+        if client is not None:
+            client.socket.send(data)
 
 
-    def _get_client_menu(self):
-        return colored("\n".join([line.strip() for line in """
-        ┏━ Menu ━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
-        ┣━━━  /solo : Play with computer   ┃
-        ┣━━━  /dual : Play with opponent   ┃
-        ┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛
-        """.split("\n") if line.strip() != ""]), "yellow") + "\n"
+    def _send_to_clients(self, addresses, data):
+        # Fans out a message the game server sent once for all of its recipients
+        for address in addresses:
+            self._send_to_address(address, data)
 
 
-    def _init_new_client(self, client_socket, address, msg: ClientInitMessage):
+    def _handle_server_message(self, server: Server, msg_obj: Message):
+        if msg_obj.message_type == MessageType.SERVER_END_GAME:
+            self._run_exclusive(self._handle_server_end_game, server, msg_obj)
+        elif msg_obj.message_type == MessageType.SERVER_TO_CLIENT_MESSAGE:
+            self._send_to_address(msg_obj.client_address, msg_obj.message.encode())
+        elif msg_obj.message_type == MessageType.SERVER_TO_CLIENTS_MESSAGE:
+            self._send_to_clients(msg_obj.client_addresses, msg_obj.message.encode())
+        elif msg_obj.message_type == MessageType.SERVER_HEARTBEAT_RESPONSE:
+            self._run_exclusive(self._handle_server_heartbeat_response, server, msg_obj)
+        elif msg_obj.message_type == MessageType.SERVER_MOVE:
+            self._run_exclusive(self._handle_server_move, server, msg_obj)
+        else:
+            self._logger.red("Wrong message type. It should be of type ServerToClientMessage, ServerToClientsMessage, ServerEndGameMessage, ServerHeartbeatResponse or ServerMoveMessage")
+
+
+    def _handle_server_frame(self, server: Server, message_type, payload):
+        if message_type == MessageType.SERVER_TO_CLIENT_RELAY:
+            # Routed on the address in front of the text; the text itself is never decoded
+            address, text = ServerToClientMessage.split_relay(payload)
+            self._send_to_address(address, text)
+        elif message_type == MessageType.SERVER_TO_CLIENTS_RELAY:
+            addresses, text = ServerToClientsMessage.split_relay(payload)
+            self._send_to_clients(addresses, text)
+        else:
+            self._handle_server_message(server, Message.decode_frame(message_type, payload))
+
+
+    def _handle_server(self, server: Server):
+        try:
+            # Whatever an ejected server still sends is ignored
+            while not server.retired:
+                if server.framing == Framing.BINARY:
+                    message_type, payload = server.reader.read_frame()
+                    read_at = time.perf_counter()
+                    self._handle_server_frame(server, message_type, payload)
+                else:
+                    message = server.read_message()
+                    message_type, read_at = message.message_type, time.perf_counter()
+                    self._handle_server_message(server, message)
+                self.metrics.record_server_message(message_type, read_at)
+        except Exception:
+            self._run_exclusive(self._eject_server, server, "lost its connection")
+
+
+    def _parse_menu_command(self, msg):
+        # "/solo" plays the classic game, "/solo 15 5" a 15x15 board with 5 in a row.
+        # The variant is None if the arguments are invalid.
+        command, *args = msg.split() or [""]
+        if len(args) == 0:
+            return command, CLASSIC_VARIANT
+        if len(args) != 2 or not all(arg.isdigit() for arg in args):
+            return command, None
+
+        size, win_length = map(int, args)
+        if not 3 <= win_length <= size <= MAX_BOARD_SIZE:
+            return command, None
+        return command, (size, win_length)
+
+
+    def _init_new_client(self, client_socket, address, msg: ClientInitMessage, reader: SocketReader):
         self._logger.blue(f"New client connected. [Address: {address} - Username: {msg.username}]")
 
-        client_socket.send((colored("Successfully connected to the WebServer.", "green") + "\n").encode())
+        client_socket.send(self.Text.CONNECTED)
 
-        client = Client(client_socket, address, msg.username)
+        client = Client(client_socket, address, msg.username, reader, self.client_statuses)
+        self.metrics.client_connections.inc()
+        client.wins, client.ties, client.losses = self.leaderboard.get(msg.username)
 
         self.clients.append(client)
         self.address_to_clients_dict[address] = client
         self.username_to_clients_dict[msg.username] = client
 
-        client.socket.send(self._get_client_menu().encode())
+        client.socket.send(self.Text.MENU)
+        self._log_event(Event.CLIENT, client.username)
 
         self._logger.green(f"Client \"{client.username}\" initialized successfully")
 
@@ -268,7 +1102,7 @@ class WebServer:
     
 
     def _put_client_on_wait(self, client: Client, game_type: GameType):
-        client.server = None
+        client.game = None
 
         if game_type == GameType.SOLO:
             client.status = client.Status.WAITING_FOR_SOLO
@@ -277,121 +1111,141 @@ class WebServer:
             self._logger.cyan(f"Client \"{client.username}\" added to the waiting queue for solo game")
         elif game_type == GameType.DUAL:
             client.status = client.Status.WAITING_FOR_DUAL
-            self.waiting_clients_for_dual_play.append(client)
+            self.waiting_clients_for_dual_play[client.variant].append(client)
 
             self._logger.cyan(f"Client \"{client.username}\" added to the waiting queue for dual game")
         else:
             self._logger.red("Invalid game_type")
             raise Exception("Invalid game_type")
 
-        client.socket.send(colored("You will be assigned to a server ASAP. Please wait... (/exchange to change the playing mode)\n", "cyan").encode())
+        client.socket.send(self.Text.PLEASE_WAIT)
 
 
     def _add_client_to_waiting_dual_game_server(self, client: Client):
-        server = self.waiting_server_for_dual_play
-        self.waiting_server_for_dual_play = None
+        game = self.waiting_game_for_dual_play.pop(client.variant)
 
-        client.server = server
-        server.clients.append(client)
+        client.game = game
+        game.clients.append(client)
+        self._end_queue_wait(client)
 
         client.status = client.Status.PLAYING_DUAL
-        server.clients[0].status = client.Status.PLAYING_DUAL
+        game.clients[0].status = client.Status.PLAYING_DUAL
 
-        for c in server.clients:
-            c.socket.send(colored("Opponent has been found. Your game starts now!\n", "cyan").encode())
+        for c in game.clients:
+            c.socket.send(self.Text.OPPONENT_FOUND)
 
-        server.socket.send(ServerStartDualPlayMessage(clients=[c.get_dict_for_server() for c in server.clients]).serialize().encode())
+        self._start_game(game, GameType.DUAL)
 
-        self._logger.blue(f"Client \"{client.username}\" was assigned to server {server.address}")
-        self._logger.cyan(f"Client \"{client.username}\" is waiting for an opponent in the server {server.address}")
+        self._logger.blue(f"Client \"{client.username}\" was assigned to server {game.server.address}")
+        self._logger.cyan(f"Dual game between \"{game.clients[0].username}\" and \"{client.username}\" started in {game}")
 
 
     def _assign_available_client(self, client: Client, game_type: GameType):
-        self.lock.acquire()
+        client.waiting_since = time.perf_counter()
+        self._log_event(Event.QUEUE, client.username, game_type, client.variant)
+        server = self._get_free_server(client.variant)
 
         if game_type == GameType.SOLO:
-            if len(self.free_servers) != 0:
-                self._init_solo_game(server=self.free_servers.pop(), client=client)
+            if server is not None:
+                self._init_solo_game(server=server, client=client)
             else:
                 self._put_client_on_wait(client, GameType.SOLO)
         elif game_type == GameType.DUAL:
-            if self.waiting_server_for_dual_play is not None:
+            if client.variant in self.waiting_game_for_dual_play:
                 self._add_client_to_waiting_dual_game_server(client)
-            elif len(self.free_servers) != 0:
-                self._init_waiting_dual_game(server=self.free_servers.pop(), client=client)
+            elif server is not None:
+                self._init_waiting_dual_game(server=server, client=client)
             else:
                 self._put_client_on_wait(client, GameType.DUAL)
         else:
             self._logger.red("Invalid type for game_type")
-
-        self.lock.release()
     
 
     def _remove_client(self, client: Client):
+        self._cancel_reconnect_deadline(client)
+        self._stop_heartbeats(client)
         self.clients.remove(client)
+        self.client_statuses.discard(client)
         del self.address_to_clients_dict[client.address]
         del self.username_to_clients_dict[client.username]
+        self._log_event(Event.REMOVE, client.username)
     
 
-    def _terminate_timed_out_client(self, client: Client):
-        self._logger.yellow(f"Client \"{client.username}\" timed out while playing. It will be removed after {self.TERMINATE_TIMEOUT_DURATION} seconds")
-        
-        cnt =  0
-        while cnt < self.TERMINATE_TIMEOUT_DURATION:
-            time.sleep(0.5)
-            cnt += 1 
-            if client.online_status == Client.OnlineStatus.ONLINE:
-                self._logger.yellow(f"Timed out client \"{client.username}\" returned to the server and won't be removed.")
-                return
-            elif client.username not in self.username_to_clients_dict:
-                self._logger.blue(f"Timed out client \"{client.username}\" has already removed from the server")
-                return
+    def _is_timed_out_client_back_or_removed(self, client: Client):
+        if client.online_status == Client.OnlineStatus.ONLINE:
+            self._logger.yellow(f"Timed out client \"{client.username}\" returned to the server and won't be removed.")
+            return True
+        elif client.username not in self.username_to_clients_dict:
+            self._logger.blue(f"Timed out client \"{client.username}\" has already removed from the server")
+            return True
+        return False
+
 
+    def _expire_timed_out_client(self, client: Client):
+        client.reconnect_deadline = None
+        # A reconnect cancels the deadline, unless it came in while the timer was already firing
+        if not self._is_timed_out_client_back_or_removed(client):
+            self._remove_timed_out_client(client)
 
+
+    def _cancel_reconnect_deadline(self, client: Client):
+        if client.reconnect_deadline is not None:
+            client.reconnect_deadline.cancel()
+            client.reconnect_deadline = None
+
+
+    def _remove_timed_out_client(self, client: Client):
         removed_opponent = None
+        game = client.game
         if client.status == client.Status.PLAYING_SOLO:
-            client.server.clients = []
-            self.waiting_server_for_dual_play = None
-            client.server.socket.send(ServerForceTerminateMessage().serialize().encode())
-            self._assign_available_server(client.server)
+            self._terminate_game(game)
         elif client.status == client.Status.PLAYING_DUAL:
-            client_opponent = client.server.clients[0] if client.server.clients[0] != client else client.server.clients[1]
-            client.server.clients = []
-            client.server.socket.send(ServerForceTerminateMessage().serialize().encode())
+            client_opponent = game.clients[0] if game.clients[0] != client else game.clients[1]
+            self._terminate_game(game)
             if client_opponent.online_status == Client.OnlineStatus.ONLINE:
-                client_opponent.socket.send(colored("Your opponent left the game.\n", "cyan").encode())
+                client_opponent.socket.send(self.Text.OPPONENT_LEFT)
                 self._assign_available_client(client_opponent, GameType.DUAL)
             else:
                 self._remove_client(client_opponent)
                 removed_opponent = client_opponent
-
-            self._assign_available_server(client.server)
     
         self._remove_client(client)
 
         self._logger.red(f"Timed out client \"{client.username}\" removed")
         if removed_opponent is not None:
-            self._logger.red(f"Timed out {client.username}'s opponent \"{client.username}\" also removed")
+            self._logger.red(f"Timed out {client.username}'s opponent \"{removed_opponent.username}\" also removed")
+
+
+    def _watch_timed_out_client(self, client: Client):
+        self._logger.yellow(f"Client \"{client.username}\" timed out while playing. It will be removed after {self.TERMINATE_TIMEOUT_DURATION} seconds")
+
+        client.reconnect_deadline = self._timers.schedule(
+            self.TERMINATE_TIMEOUT_DURATION,
+            self._run_exclusive,
+            self._expire_timed_out_client,
+            client
+        )
 
 
     def _handle_client_connection_lost(self, client: Client):
+        self.metrics.client_disconnections.inc()
         client.socket.close()
+        self._stop_heartbeats(client)
         
         if client.status == Client.Status.IN_MENU:
             self._remove_client(client)
         if client.status == Client.Status.WAITING_FOR_DUAL:
-            self.waiting_clients_for_dual_play.remove(client)
+            self.waiting_clients_for_dual_play[client.variant].remove(client)
             self._remove_client(client)
         elif client.status == Client.Status.WAITING_FOR_SOLO:
             self.waiting_clients_for_solo_play.remove(client)
             self._remove_client(client)
         elif client.status == Client.Status.WAITING_FOR_OPPONENT:
-            client.server.clients = []
-            self.waiting_server_for_dual_play = None
-            self._assign_available_server(client.server)
+            self._close_game(client.game)
+            self._remove_client(client)
         elif client.status in {Client.Status.PLAYING_SOLO, Client.Status.PLAYING_DUAL}:
             client.online_status = client.OnlineStatus.TIMEOUT
-            threading.Thread(target=self._terminate_timed_out_client, args=[client]).start()
+            self._watch_timed_out_client(client)
         
 
         self._logger.red(f"Client [Address: {client.address} - Username: {client.username}] disconnected.")
@@ -405,125 +1259,221 @@ class WebServer:
         return False
     
 
-    def _get_valid_username_from_client(self, init_msg: ClientInitMessage, socket_obj: socket.socket):
-        while not self._validate_username(init_msg.username):
-            socket_obj.send(ClientInitResponse(
-                is_valid=False,
-                message=colored("Username already exists. Try another one", "red")+"\n"
-            ).serialize().encode())
+    def _reject_username(self, init_msg: ClientInitMessage, socket_obj: socket.socket):
+        socket_obj.send(ClientInitResponse(
+            is_valid=False,
+            message=colored("Username already exists. Try another one", "red")+"\n",
+            framing=self._negotiate_client_framing(init_msg)
+        ).encode())
 
-            init_msg = Message.deserialize(SocketReader(socket_obj).read_json())
 
-            if type(init_msg) != ClientInitMessage:
-                self._logger.red("Incoming client didn't follow the prototype for initialization. Socket terminated")
-                socket_obj.close()
-                return None
-        
-        return init_msg
+    def _check_init_message_prototype(self, init_msg: Message, socket_obj: socket.socket):
+        if type(init_msg) != ClientInitMessage:
+            self._logger.red("Incoming client didn't follow the prototype for initialization. Socket terminated")
+            socket_obj.close()
+            return False
+        return True
+
+
+    def _try_accept_client(self, init_msg: ClientInitMessage, socket_obj: socket.socket, address: str, reader: SocketReader):
+        # The username is checked and taken in one go, so two clients can't both get it
+        if not self._validate_username(init_msg.username):
+            self._reject_username(init_msg, socket_obj)
+            return None
+
+        return self._accept_client(init_msg, socket_obj, address, reader)
 
 
-    def _reconnect_client(self, init_msg: ClientInitMessage, socket_obj: socket.socket, address: str):
+    def _reconnect_client(self, init_msg: ClientInitMessage, socket_obj: socket.socket, address: str, reader: SocketReader):
         self._logger.blue(f"Client [Address: {address} - Username: {init_msg.username}] reconnected to the server")
 
-        socket_obj.send((colored("Successfully connected to the WebServer.", "green") + "\n").encode())
+        socket_obj.send(self.Text.CONNECTED)
 
         client = self.username_to_clients_dict[init_msg.username]
+        self.metrics.client_connections.inc()
         client.socket = socket_obj
+        client.reader = reader
         client.online_status = Client.OnlineStatus.ONLINE
+        if client.reconnect_deadline is not None:
+            self._logger.yellow(f"Timed out client \"{client.username}\" returned to the server and won't be removed.")
+            self._cancel_reconnect_deadline(client)
 
         del self.address_to_clients_dict[client.address]
         client.address = address
         self.address_to_clients_dict[address] = client
 
         if client.status == Client.Status.PLAYING_SOLO or client.status == Client.Status.PLAYING_DUAL:
-            client.server.socket.send(ServerUpdateClientMessage(client=client.get_dict_for_server()).serialize().encode())
+            if client.game.server is None:
+                # The new address goes out with the game when it is resumed
+                socket_obj.send(self.Text.GAME_DETACHED)
+            else:
+                client.game.server.send_message(ServerUpdateClientMessage(client=client.get_dict_for_server(), game_id=client.game.get_wire_id()))
 
         return client
 
 
-    def _handle_client(self, init_msg: ClientInitMessage, socket_obj: socket.socket, address: str):
-        init_msg = self._get_valid_username_from_client(init_msg, socket_obj)
-        if init_msg is None:
-            return
+    def _negotiate_client_framing(self, init_msg: ClientInitMessage):
+        return None if init_msg.framing is None else Framing.negotiate(init_msg.framing)
 
-        socket_obj.send(ClientInitResponse(is_valid=True, message=colored("Username accepted by the webserver", "green")).serialize().encode())
+
+    def _accept_client(self, init_msg: ClientInitMessage, socket_obj: socket.socket, address: str, reader: SocketReader):
+        heartbeat = init_msg.heartbeat is True
+        socket_obj.send(ClientInitResponse(
+            is_valid=True,
+            message=colored("Username accepted by the webserver", "green"),
+            framing=self._negotiate_client_framing(init_msg),
+            heartbeat_timeout=self._client_heartbeat[1] if heartbeat else None
+        ).encode())
         
         if init_msg.username in self.username_to_clients_dict:
-            client = self._reconnect_client(init_msg, socket_obj, address)
+            client = self._reconnect_client(init_msg, socket_obj, address, reader)
+        else:
+            client = self._init_new_client(socket_obj, address, init_msg, reader)
+        client.framing = Framing.negotiate(init_msg.framing)
+
+        # Heartbeats belong to the connection, a client may come back without them
+        client.heartbeat = heartbeat
+        if heartbeat:
+            self._start_heartbeats(client, *self._client_heartbeat)
         else:
-            client = self._init_new_client(socket_obj, address, init_msg)
+            self._stop_heartbeats(client)
+
+        return client
+
+
+    def _handle_client_message(self, client: Client, msg_obj: Message):
+        self.metrics.count_client_message(msg_obj.message_type)
+        if type(msg_obj) == ClientHeartbeatResponse:
+            self._handle_heartbeat_response(client)
+            return
+
+        if type(msg_obj) != ClientMessage:
+            self._logger.red("Wrong message type. It should be of type ClientMessage")
+            raise Exception("Wrong message type. It should be of type ClientMessage")
+        
+        msg = msg_obj.message
+
+        if msg == "/users":
+            client.socket.send((colored("Users online: " + str(len(self.clients)), "magenta") + "\n").encode())
+        elif client.status == client.Status.IN_MENU:
+            command, variant = self._parse_menu_command(msg)
+            if command in {"/solo", "/dual"} and variant is not None:
+                client.variant = variant
+                self._assign_available_client(client, GameType.SOLO if command == "/solo" else GameType.DUAL)
+            else:
+                client.socket.send(self.Text.INVALID_INPUT + self.Text.MENU)
+        elif client.status in {client.Status.PLAYING_SOLO, client.Status.PLAYING_DUAL}:
+            if client.game.server is None:
+                client.socket.send(self.Text.GAME_DETACHED)
+                return
+            client.game.server.send_message(ClientToServerMessage(client.address, msg, game_id=client.game.get_wire_id()))
+        else:
+            if msg == "/exchange":
+                self._logger.cyan(f"Client \"{client.username}\" used /exchange command")
+                if client.status == client.Status.WAITING_FOR_DUAL:
+                    self.waiting_clients_for_dual_play[client.variant].remove(client)
+                    self._logger.cyan(f"Client \"{client.username}\" was removed from waiting queue of dual games")
+                elif client.status == client.Status.WAITING_FOR_SOLO:
+                    self.waiting_clients_for_solo_play.remove(client)
+                    self._logger.cyan(f"Client \"{client.username}\" was removed from waiting queue of solo games")
+                elif client.status == client.Status.WAITING_FOR_OPPONENT:
+                    self._logger.cyan(f"Client \"{client.username}\" is no longer looking for opponent for dual game")
+                    self._logger.cyan(f"{client.game} is no longer assigned to \"{client.username}\"")
+                    self._close_game(client.game)
+                else:
+                    raise Exception("Why here?!")
+                client.status = client.Status.IN_MENU
+                client.socket.send(self.Text.MENU)
+                self._log_event(Event.MENU, client.username)
+            else:
+                client.socket.send(self.Text.PLEASE_WAIT)
+
+
+    def _handle_client(self, init_msg: ClientInitMessage, socket_obj: socket.socket, address: str, reader: SocketReader):
+        client = self._run_exclusive(self._try_accept_client, init_msg, socket_obj, address, reader)
+        while client is None:
+            init_msg = Message.deserialize(reader.read_json())
+
+            if not self._check_init_message_prototype(init_msg, socket_obj):
+                return
 
+            client = self._run_exclusive(self._try_accept_client, init_msg, socket_obj, address, reader)
 
         while True:
             try:
-                msg_obj = Message.deserialize(SocketReader(client.socket).read_json())
-
-                if type(msg_obj) != ClientMessage:
-                    self._logger.red("Wrong message type. It should be of type ClientMessage")
-                    raise Exception("Wrong message type. It should be of type ClientMessage")
-                
-                msg = msg_obj.message
-
-                if msg == "/users":
-                    client.socket.send((colored("Users online: " + str(len(self.clients)), "magenta") + "\n").encode())
-                elif client.status == client.Status.IN_MENU:
-                    if msg == "/solo":
-                        self._assign_available_client(client, GameType.SOLO)
-                    elif msg == "/dual":
-                        self._assign_available_client(client, GameType.DUAL)
-                    else:
-                        client.socket.send((colored("Invalid input\n", "red") + self._get_client_menu()).encode())
-                elif client.status in {client.Status.PLAYING_SOLO, client.Status.PLAYING_DUAL}:
-                    client.server.socket.send(ClientToServerMessage(client.address, msg).serialize().encode())
-                else:
-                    if msg == "/exchange":
-                        self._logger.cyan(f"Client \"{client.username}\" used /exchange command")
-                        if client.status == client.Status.WAITING_FOR_DUAL:
-                            self.waiting_clients_for_dual_play.remove(client)
-                            self._logger.cyan(f"Client \"{client.username}\" was removed from waiting queue of dual games")
-                        elif client.status == client.Status.WAITING_FOR_SOLO:
-                            self.waiting_clients_for_solo_play.remove(client)
-                            self._logger.cyan(f"Client \"{client.username}\" was removed from waiting queue of solo games")
-                        elif client.status == client.Status.WAITING_FOR_OPPONENT:
-                            self._logger.cyan(f"Client \"{client.username}\" is no longer looking for opponent for dual game")
-                            client.server.clients = []
-                            self.waiting_server_for_dual_play = None
-                            self._logger.cyan(f"Server {client.server.address} is no longer assigned to \"{client.username}\"")
-                            self._assign_available_server(client.server)
-                            client.server = None
-                        else:
-                            raise Exception("Why here?!")
-                        client.status = client.Status.IN_MENU
-                        client.socket.send(self._get_client_menu().encode())
-                    else:
-                        client.socket.send(colored("You will be assigned to a server ASAP. Please wait... (/exchange to change the playing mode)\n", "cyan").encode())
+                self._run_exclusive(self._handle_client_message, client, client.read_message())
             except:
-                self._handle_client_connection_lost(client)
+                self._run_exclusive(self._handle_client_connection_lost, client)
                 return
 
 
+    def _reject_connection(self, new_socket: socket.socket, new_address: str):
+        self._logger.red(f"Connection from \"{new_address}\" rejected. Too many pending handshakes")
+
+        try:
+            new_socket.send(self.Text.BUSY)
+        except OSError:
+            pass
+        new_socket.close()
+
+
+    def _handshake_timed_out(self, new_socket: socket.socket, new_address: str):
+        self.accept_metrics.timeout_handshake()
+        self._logger.red(f"Connection from \"{new_address}\" didn't send its init message in {self.HANDSHAKE_TIMEOUT_DURATION} seconds. Socket terminated")
+        new_socket.close()
+
+
+    def _handshake_failed(self, new_socket: socket.socket, new_address: str):
+        self.accept_metrics.fail_handshake()
+        self._logger.red(f"Connection from \"{new_address}\" sent an invalid init message. Socket terminated")
+        new_socket.close()
+
+
+    def _handshake(self, new_socket: socket.socket, new_address: str, accepted_at: float):
+        reader = SocketReader(new_socket, self.metrics.received_bytes)
+
+        reader.deadline = accepted_at + self.HANDSHAKE_TIMEOUT_DURATION
+        try:
+            init_msg = reader.read_message()
+        except socket.timeout:
+            self._handshake_timed_out(new_socket, new_address)
+            return
+        except Exception:
+            self._handshake_failed(new_socket, new_address)
+            return
+        reader.deadline = None
+        new_socket.settimeout(None)
+
+        self.accept_metrics.finish_handshake(accepted_at)
+
+        # From here on every write to the connection goes through its queue
+        new_socket = SocketWriter(new_socket, self.write_metrics, self.MAX_QUEUED_WRITE_BYTES)
+
+        if type(init_msg) == ServerInitMessage:
+            self._logger.blue(f"New server connected with address \"{new_address}\"")
+            server = self._run_exclusive(self._init_new_server, new_socket, new_address, reader, init_msg)
+            self._handle_server(server)
+        elif type(init_msg) == ClientInitMessage:
+            self._handle_client(init_msg, new_socket, new_address, reader)
+        else:
+            new_socket.send(self.Text.INVALID_INIT_MESSAGE)
+
+
     def receive_connections(self):
+        self._run_exclusive(self._watch_restored_clients)
         while True:
             new_socket, new_address = self.socket.accept()
             new_address = f"{new_address[0]}:{new_address[1]}"
 
-            init_msg = Message.deserialize(SocketReader(new_socket).read_json())
-            if type(init_msg) == ServerInitMessage:
-                self._logger.blue(f"New server connected with address \"{new_address}\"")
-                server = self._init_new_server(new_socket, new_address)
-                threading.Thread(target=self._handle_server, args=[server]).start()
-            elif type(init_msg) == ClientInitMessage:
-                threading.Thread(target=self._handle_client, args=[init_msg, new_socket, new_address]).start()
-            else:
-                new_socket.send(colored(f"Invalid initialization message type. It should be either \"ServerInitMessage\" or \"ClientInitMessage\".\n", "red").encode())
+            if not self.accept_metrics.try_start_handshake(self.MAX_PENDING_HANDSHAKES):
+                self._reject_connection(new_socket, new_address)
+                continue
+
+            threading.Thread(target=self._handshake, args=[new_socket, new_address, time.perf_counter()]).start()
 
 
     def _get_clients_by_status(self, status: Client.Status):
-        res = []
-        for c in self.clients:
-            if c.status == status:
-                res.append(c)
-        return res
+        return list(self.client_statuses.get(status))
 
 
     def _get_clients_playing_solo_game(self):
@@ -535,54 +1485,115 @@ class WebServer:
     
 
     def _get_client_waiting_for_opponent(self):
-        res = self._get_clients_by_status(Client.Status.WAITING_FOR_DUAL)
-        return res[0] if len(res) > 0 else None
+        return self.client_statuses.get(Client.Status.WAITING_FOR_OPPONENT).peek()
     
 
-    def _get_servers_hosting_solo_game(self):
-        res = []
-        for s in self.servers:
-            if len(s.clients) != 0 and s.clients[0].status == Client.Status.PLAYING_SOLO:
-                res.append(s)
-        return res
+    def _get_games_by_client_status(self, status: Client.Status):
+        # A game is listed under the status of its first client
+        return [c.game for c in self.client_statuses.get(status) if c.game is not None and c.game.clients[0] is c]
+
 
+    def _get_games_hosting_solo_game(self):
+        return self._get_games_by_client_status(Client.Status.PLAYING_SOLO)
 
-    def _get_servers_hosting_dual_game(self):
-        res = []
-        for s in self.servers:
-            if len(s.clients) != 0 and s.clients[0].status == Client.Status.PLAYING_DUAL:
-                res.append(s)
-        return res
+
+    def _get_games_hosting_dual_game(self):
+        return self._get_games_by_client_status(Client.Status.PLAYING_DUAL)
         
 
-    def _print_queues_stat(self):
+    def _get_queues_stat(self):
         clients_stats = [
             "Clients : " + str(self.clients),
             "Clients waiting for solo play : " + str(self.waiting_clients_for_solo_play),
-            "Clients waiting for dual play : " + str(self.waiting_clients_for_dual_play),
+            "Clients waiting for dual play : " + str([c for queue in self.waiting_clients_for_dual_play.values() for c in queue]),
             "Clients waiting for opponent : " + str(self._get_client_waiting_for_opponent()),
             "Clients playing solo game : " + str(self._get_clients_playing_solo_game()),
             "Clients playing dual game : " + str(self._get_clients_playing_dual_game())
         ]
         servers_stats = [
             "Servers : " + str(self.servers),
-            "Free servers : " + str(self.free_servers),
-            "Server waiting for opponent : " + str(self.waiting_server_for_dual_play),
-            "Servers hosting solo game : " + str(self._get_servers_hosting_solo_game()),
-            "Servers hosting dual game : " + str(self._get_servers_hosting_dual_game())
+            "Servers with free slots : " + str(self.free_servers),
+            "Games waiting for opponent : " + str(list(self.waiting_game_for_dual_play.values())),
+            "Games waiting for a server : " + str(self.detached_games),
+            "Solo games : " + str(self._get_games_hosting_solo_game()),
+            "Dual games : " + str(self._get_games_hosting_dual_game())
+        ]
+        servers_load_stats = [
+            f"{server} : {len(server.games)}/{server.capacity} games, RTT " + (f"{server.rtt * 1000:.2f}ms" if server.rtt is not None else "-")
+            for server in self.servers
         ]
-        max_stat_len = max(list(map(len, clients_stats)) + list(map(len, servers_stats))) + 6
+        return [clients_stats, servers_stats] + ([servers_load_stats] if servers_load_stats else [])
+
+
+    def _get_pool_stat(self):
+        if self.pool is None:
+            return list(self.pool_metrics.get_stats(0, 0, 0))
+        return list(self.pool_metrics.get_stats(len(self.pool), self.pool.get_starting_count(), self.pool.max_size))
+
+
+    def _get_state_metrics(self):
+        statuses = {name.lower(): len(self.client_statuses.get(status)) for name, status in vars(Client.Status).items() if name.isupper()}
+        queues = {
+            "solo": len(self.waiting_clients_for_solo_play),
+            "dual": sum(len(queue) for queue in self.waiting_clients_for_dual_play.values()),
+            "detached_games": len(self.detached_games),
+        }
+        return statuses, queues, len(self.servers), sum(len(server.games) for server in self.servers)
+
+
+    def _collect_metrics(self):
+        metrics = self.metrics
+        statuses, queues, servers, games = self._run_exclusive(self._get_state_metrics)
+        for status, count in statuses.items():
+            metrics.clients.labels(status).set(count)
+        for queue, depth in queues.items():
+            metrics.queue_depth.labels(queue).set(depth)
+        metrics.game_servers.set(servers)
+        metrics.games.set(games)
+
+        # The other metrics objects keep their own counts, they are copied as they are
+        accept = self.accept_metrics
+        for result, count in [("completed", accept.completed), ("rejected", accept.rejected), ("timed_out", accept.timed_out), ("failed", accept.failed)]:
+            metrics.handshakes.labels(result).set(count)
+        metrics.pending_handshakes.set(accept.handshaking)
+
+        writes = self.write_metrics
+        metrics.sent_bytes.set(writes.bytes_written)
+        metrics.writes.set(writes.writes)
+        metrics.queued_write_bytes.set(writes.queued_bytes)
+        metrics.dropped_frames.set(writes.frames_dropped)
+        metrics.slow_consumers.set(writes.slow_consumers)
+
+        for peer, heartbeats in [("client", self.client_heartbeat_metrics), ("server", self.server_heartbeat_metrics)]:
+            metrics.heartbeats.labels(peer, "sent").set(heartbeats.sent)
+            metrics.heartbeats.labels(peer, "answered").set(heartbeats.answered)
+            metrics.dead_links.labels(peer).set(heartbeats.dead)
+
+        metrics.guard_calls.set(self._state_guard.metrics.calls)
+
+        pool = self.pool_metrics
+        for event, count in [("spawned", pool.spawned), ("registered", pool.registered), ("retired", pool.retired), ("failed", pool.failed)]:
+            metrics.pool_workers.labels(event).set(count)
+
+        if self.stats_store is not None:
+            metrics.score_updates.labels().set(self.stats_store.metrics.updates)
+            metrics.pending_scores.labels().set(self.stats_store.get_pending_count())
+        if self.event_log is not None:
+            metrics.logged_events.labels().set(self.event_log.metrics.events)
+            metrics.pending_events.labels().set(self.event_log.get_pending_count())
+
+
+    def _print_stats_box(self, title, sections: List[List[str]]):
+        max_stat_len = max(len(stat) for section in sections for stat in section) + 6
 
-        title = " Queues Stat "
         half_line_len_for_title = (max_stat_len - len(title) + 1) // 2
         print(colored("┏" + "━"*half_line_len_for_title + title + "━"*(max_stat_len - len(title) - half_line_len_for_title + 1) + "┓", "magenta"))
-        for stat in clients_stats:
-            spaces_len = max_stat_len - len(stat)
-            print(colored("┃ " + stat + " "*spaces_len + "┃", "magenta"))
-        print(colored("┣" + "━"*(max_stat_len + 1) + "┫", "magenta"))
-        for stat in servers_stats:
-            spaces_len = max_stat_len - len(stat)
-            print(colored("┃ " + stat + " "*spaces_len + "┃", "magenta"))
+        for idx, section in enumerate(sections):
+            if idx != 0:
+                print(colored("┣" + "━"*(max_stat_len + 1) + "┫", "magenta"))
+            for stat in section:
+                spaces_len = max_stat_len - len(stat)
+                print(colored("┃ " + stat + " "*spaces_len + "┃", "magenta"))
         print(colored("┗" + "━"*(max_stat_len + 1) + "┛", "magenta"))
     
 
@@ -594,28 +1605,78 @@ class WebServer:
         table.add_column("Ties", justify="center", style="magenta")
         table.add_column("Losses", justify="center", style="magenta")
 
-        sorted_clients = sorted(self.clients, key=lambda c: (-c.wins, -c.ties, c.losses, c.username))
-        for rank, c in enumerate(sorted_clients):
-            table.add_row(*map(str, [rank+1, c.username, c.wins, c.ties, c.losses]))
+        scores = self._run_exclusive(lambda: list(self.leaderboard.top(self.SCOREBOARD_SIZE)))
+        for score in scores:
+            table.add_row(*map(str, score))
 
         console = Console()
         console.print(table)
 
 
+    def _print_rank(self, username):
+        rank, players, (wins, ties, losses) = self._run_exclusive(
+            lambda: (self.leaderboard.rank(username), len(self.leaderboard), self.leaderboard.get(username))
+        )
+        if rank is None:
+            print(colored(f"\"{username}\" hasn't finished a game yet", "red"))
+        else:
+            print(colored(f"\"{username}\" is ranked {rank} of {players} players. Wins: {wins} - Ties: {ties} - Losses: {losses}", "magenta"))
+
+
+    def _get_stats_store_stat(self):
+        return list(self.stats_store.metrics.get_stats(len(self.leaderboard), self.stats_store.get_pending_count()))
+
+
     def handle_console_commands(self):
         while True:
             cmd = input()
             if cmd == "/users":
                 print(colored("Users online: " + str(len(self.clients)), "magenta"))
             elif cmd == "/qstat":
-                self._print_queues_stat()
+                self._print_stats_box(" Queues Stat ", self._run_exclusive(self._get_queues_stat))
             elif cmd == "/scoreboard":
                 self._print_score_board()
+            elif cmd.startswith("/rank "):
+                self._print_rank(cmd[len("/rank "):].strip())
+            elif cmd == "/store":
+                if self.stats_store is None:
+                    print(colored("Scores aren't stored. Set STATS_DB to keep them across restarts", "red"))
+                else:
+                    self._print_stats_box(" Stats Store ", self._run_exclusive(self._get_stats_store_stat))
+            elif cmd == "/events":
+                if self.event_log is None:
+                    print(colored("Events aren't logged. Set EVENT_LOG to restore games after a restart", "red"))
+                else:
+                    self._print_stats_box(" Event Log ", list(self.event_log.metrics.get_stats(self.event_log.get_pending_count())))
+            elif cmd == "/accept":
+                self._print_stats_box(" Accept Stat ", list(self.accept_metrics.get_stats()))
+            elif cmd == "/writes":
+                self._print_stats_box(" Write Stat ", list(self.write_metrics.get_stats()))
+            elif cmd == "/locks":
+                self._print_stats_box(" Lock Stat ", list(self._state_guard.metrics.get_stats()))
+            elif cmd == "/pool":
+                self._print_stats_box(" Pool Stat ", self._run_exclusive(self._get_pool_stat))
+            elif cmd == "/metrics":
+                print(self.metrics.registry.render().decode(), end="")
+            elif cmd == "/heartbeats":
+                self._print_stats_box(" Heartbeat Stat ", [
+                    self.client_heartbeat_metrics.get_stats("Client"),
+                    self.server_heartbeat_metrics.get_stats("Server")
+                ])
             elif cmd == "/help":
                 print(colored("┏━━━━━━━━━━━━━ Help Menu ━━━━━━━━━━━━━━┓", "yellow"))
                 print(colored("┣━━ /users : Number of online users    ┃", "yellow"))
                 print(colored("┣━━ /qstat : Stats about queues        ┃", "yellow"))
                 print(colored("┣━━ /scoreboard : Scoreboard           ┃", "yellow"))
+                print(colored("┣━━ /rank USERNAME : Player's rank     ┃", "yellow"))
+                print(colored("┣━━ /store : Stats store writes        ┃", "yellow"))
+                print(colored("┣━━ /events : Event log commits        ┃", "yellow"))
+                print(colored("┣━━ /accept : Stats about handshakes   ┃", "yellow"))
+                print(colored("┣━━ /writes : Stats about write queues ┃", "yellow"))
+                print(colored("┣━━ /locks : Matchmaking lock times    ┃", "yellow"))
+                print(colored("┣━━ /pool : Server pool size and waits ┃", "yellow"))
+                print(colored("┣━━ /heartbeats : Heartbeat RTTs       ┃", "yellow"))
+                print(colored("┣━━ /metrics : Metrics in Prom format  ┃", "yellow"))
                 print(colored("┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛", "yellow"))
             else:
                 print(colored("Invalid command. See /help for the list of commands.", "red"))
@@ -626,7 +1687,45 @@ if __name__ == '__main__':
     
     host = os.getenv("HOST")
     port = int(os.getenv("PORT"))
+    use_json_backend(os.getenv("JSON_BACKEND"))
+    heartbeats = {
+        "client_heartbeat": (
+            float(os.getenv("CLIENT_HEARTBEAT_INTERVAL", WebServer.CLIENT_HEARTBEAT[0])),
+            float(os.getenv("CLIENT_HEARTBEAT_TIMEOUT", WebServer.CLIENT_HEARTBEAT[1]))
+        ),
+        "server_heartbeat": (
+            float(os.getenv("SERVER_HEARTBEAT_INTERVAL", WebServer.SERVER_HEARTBEAT[0])),
+            float(os.getenv("SERVER_HEARTBEAT_TIMEOUT", WebServer.SERVER_HEARTBEAT[1]))
+        ),
+    }
+
+    # Scores are kept in stats.db unless STATS_DB is set to another file, or to nothing
+    stats_path = os.getenv("STATS_DB", "stats.db") or None
+    # Games in progress survive a restart when EVENT_LOG names the file to log them to
+    event_log_path = os.getenv("EVENT_LOG") or None
+
+    if os.getenv("WEBSERVER_MODE", "threaded") == "asyncio":
+        from async_webserver import AsyncWebServer
+        web_server = AsyncWebServer(host, port, stats_path=stats_path, event_log_path=event_log_path, **heartbeats)
+    else:
+        web_server = WebServer(host, port, stats_path=stats_path, event_log_path=event_log_path, **heartbeats)
+
+    pool_max_servers = int(os.getenv("POOL_MAX_SERVERS", "0"))
+    if pool_max_servers > 0:
+        web_server.pool = ServerPool(
+            web_server,
+            host,
+            port,
+            min_size=int(os.getenv("POOL_MIN_SERVERS", "0")),
+            max_size=pool_max_servers,
+            capacity=int(os.getenv("GAME_SERVER_CAPACITY", "64")),
+            idle_timeout=float(os.getenv("POOL_IDLE_TIMEOUT", "60"))
+        )
+        web_server.pool.start()
+
+    # The metrics are served at http://METRICS_HOST:METRICS_PORT/metrics when METRICS_PORT is set
+    if os.getenv("METRICS_PORT"):
+        MetricsServer(web_server.metrics.registry, os.getenv("METRICS_HOST", "127.0.0.1"), int(os.getenv("METRICS_PORT"))).start()
 
-    web_server = WebServer(host, port)
     threading.Thread(target=web_server.handle_console_commands).start()
     web_server.receive_connections()